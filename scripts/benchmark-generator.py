@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+
+# Measure where generate-training-data.py spends its time. Each stage of making a
+# training line (text sampling, fitz rendering, cropping, blur, noise, saving) is
+# timed on its own, then the whole line is timed end-to-end, all with a fixed
+# random seed and a font bundled in data/extra-fonts. Results are shown as
+# µs/line and lines/sec/core (from CPU time); with "-o" they are also written as
+# JSON, along with the git commit, so runs on different commits can be compared.
+# With "-e", each image encoding (and PNG compression level) is also measured on
+# clean and degraded lines, as bytes/line and µs to encode & save a line.
+
+import argparse
+import importlib.util
+import io
+import json
+import platform
+import random
+import subprocess
+import tempfile
+import time
+
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+GENERATOR_SCRIPT = Path(__file__).resolve().parent / "generate-training-data.py"
+DEFAULT_FONT = (
+    ROOT_DIR
+    / "data"
+    / "extra-fonts"
+    / "Microsoft"
+    / "TrueType"
+    / "Segoe UI"
+    / "Segoe_UI_Regular.ttf"
+)
+DEFAULT_LINES = 100
+DEFAULT_SEED = 42
+PNG_COMPRESS_LEVELS = [1, 3, 6, 9]
+
+
+def load_generator():
+    """return generate-training-data.py as a module with its default globals set"""
+    spec = importlib.util.spec_from_file_location("generator", GENERATOR_SCRIPT)
+    generator = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(generator)
+    generator.CHARACTER_HEIGHT = generator.DEFAULT_CHARACTER_HEIGHT
+    generator.LINE_LENGTH = generator.DEFAULT_LINE_LENGTH
+    generator.DEGRADED_IMAGE_PROBABILITY = 0  # generator's default
+    generator.IMAGE_ENCODING = generator.DEFAULT_IMAGE_ENCODING
+    generator.CHAR_VARS = generator.get_script_variables()
+    return generator
+
+
+def get_git_commit():
+    proc = subprocess.run(
+        ["git", "-C", str(ROOT_DIR), "rev-parse", "--short", "HEAD"],
+        capture_output=True,
+        text=True,
+    )
+    return proc.stdout.strip() if proc.returncode == 0 else None
+
+
+class StageTimer:
+    """accumulate wall & CPU time of each stage"""
+
+    def __init__(self):
+        self.wall = {}
+        self.cpu = {}
+
+    def run(self, stage, func, *args):
+        t_wall = time.perf_counter()
+        t_cpu = time.process_time()
+        result = func(*args)
+        self.cpu[stage] = self.cpu.get(stage, 0) + time.process_time() - t_cpu
+        self.wall[stage] = self.wall.get(stage, 0) + time.perf_counter() - t_wall
+        return result
+
+
+def benchmark_stages(generator, fontfile, num_lines, seed, out_dir):
+    timer = StageTimer()
+    random.seed(seed)
+    for i in range(num_lines):
+        chars = timer.run(
+            "sample",
+            generator.generate_text_line_weighted_chars,
+            generator.CHAR_VARS,
+            generator.LINE_LENGTH,
+        )
+        img = timer.run("render", generator.render_text_line, chars, fontfile)
+        img = timer.run("crop", generator.crop_text_line, img)
+        # Degradations are timed on every line rather than only on the random
+        # fraction that gets them.
+        timer.run("blur", generator.add_blur, img)
+        timer.run("noise", generator.add_noise, img)
+        timer.run(
+            "save", generator.save_training_data_pair, out_dir, f"{i}", chars, img
+        )
+    return timer
+
+
+def benchmark_end_to_end(generator, fontfile, num_lines, seed, out_dir):
+    timer = StageTimer()
+    random.seed(seed)
+
+    def make_line(i):
+        chars = generator.generate_text_line_weighted_chars(
+            generator.CHAR_VARS, generator.LINE_LENGTH
+        )
+        img, degraded = generator.generate_text_line_png(chars, fontfile)
+        generator.save_training_data_pair(
+            out_dir, f"e2e-{i}", chars, img, degraded, generator.IMAGE_ENCODING
+        )
+
+    for i in range(num_lines):
+        timer.run("end-to-end", make_line, i)
+    return timer
+
+
+def get_encoding_variants(generator):
+    """return {name: (encoding, save options)}, incl. each PNG compress level"""
+    variants = {}
+    for encoding, (_, ext, options) in generator.IMAGE_ENCODINGS.items():
+        if ext == ".png":
+            for level in PNG_COMPRESS_LEVELS:
+                variants[f"{encoding}-z{level}"] = (
+                    encoding,
+                    {**options, "compress_level": level},
+                )
+        else:
+            variants[encoding] = (encoding, options)
+    return variants
+
+
+def benchmark_encodings(generator, fontfile, num_lines, seed):
+    """return {(variant, "clean" or "degraded"): (bytes/line, µs/line)}"""
+    random.seed(seed)
+    clean = []
+    for i in range(num_lines):
+        chars = generator.generate_text_line_weighted_chars(
+            generator.CHAR_VARS, generator.LINE_LENGTH
+        )
+        clean.append(
+            generator.crop_text_line(generator.render_text_line(chars, fontfile))
+        )
+    degraded = [generator.add_noise(generator.add_blur(img)) for img in clean]
+
+    results = {}
+    for name, (encoding, options) in get_encoding_variants(generator).items():
+        mode, ext, _ = generator.IMAGE_ENCODINGS.get(encoding)
+        image_format = "TIFF" if ext == ".tif" else "PNG"
+        for kind, images in (("clean", clean), ("degraded", degraded)):
+            if kind == "degraded" and mode == "1":
+                # The generator never saves degraded lines as bilevel images.
+                continue
+            size = 0
+            t_start = time.perf_counter()
+            for img in images:
+                out, _, _ = generator.encode_line_image(img, encoding)
+                buf = io.BytesIO()
+                out.save(buf, format=image_format, **options)
+                size += buf.tell()
+            seconds = time.perf_counter() - t_start
+            results[(name, kind)] = (
+                round(size / len(images)),
+                round(seconds / len(images) * 1_000_000, 1),
+            )
+    return results
+
+
+def get_results(timers, num_lines):
+    results = {}
+    for timer in timers:
+        for stage, wall in timer.wall.items():
+            cpu = timer.cpu.get(stage)
+            results[stage] = {
+                "us_per_line": round(wall / num_lines * 1_000_000, 1),
+                "cpu_us_per_line": round(cpu / num_lines * 1_000_000, 1),
+                "lines_per_sec_per_core": round(num_lines / cpu, 1) if cpu else None,
+            }
+    return results
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Time each stage of generate-training-data.py on a fixed seed & font."
+    )
+    parser.add_argument(
+        "-e",
+        "--encodings",
+        action="store_true",
+        help="also compare image encodings & PNG compression levels",
+    )
+    parser.add_argument(
+        "-f",
+        "--fontfile",
+        type=str,
+        default=str(DEFAULT_FONT),
+        help="font file to render lines with [data/extra-fonts/.../Segoe_UI_Regular.ttf]",
+    )
+    parser.add_argument(
+        "-n",
+        "--lines",
+        type=int,
+        default=DEFAULT_LINES,
+        help=f"number of lines to generate for each measurement [{DEFAULT_LINES}]",
+    )
+    parser.add_argument(
+        "-o",
+        "--outfile",
+        type=str,
+        help="also write results as JSON to this file",
+    )
+    parser.add_argument(
+        "-s",
+        "--seed",
+        type=int,
+        default=DEFAULT_SEED,
+        help=f"random seed [{DEFAULT_SEED}]",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    fontfile = Path(args.fontfile).expanduser().resolve()
+    if not fontfile.is_file():
+        print(f"Error: Could not find file: {args.fontfile}")
+        exit(1)
+    generator = load_generator()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_dir = Path(tmp_dir)
+        timers = [
+            benchmark_stages(generator, str(fontfile), args.lines, args.seed, out_dir),
+            benchmark_end_to_end(
+                generator, str(fontfile), args.lines, args.seed, out_dir
+            ),
+        ]
+    results = get_results(timers, args.lines)
+    encodings = None
+    if args.encodings:
+        encodings = benchmark_encodings(generator, str(fontfile), args.lines, args.seed)
+
+    print("µs/line\tCPU µs/line\tlines/sec/core\tStage")
+    for stage, r in results.items():
+        print(
+            f"{r.get('us_per_line'):.1f}\t{r.get('cpu_us_per_line'):.1f}\t\t"
+            f"{r.get('lines_per_sec_per_core')}\t\t{stage}"
+        )
+
+    if encodings:
+        print("\nbytes/line\tµs/line\tLines\t\tEncoding")
+        for (name, kind), (size, us) in encodings.items():
+            print(f"{size}\t\t{us:.1f}\t{kind}\t\t{name}")
+
+    if args.outfile:
+        data = {
+            "commit": get_git_commit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "font": fontfile.name,
+            "lines": args.lines,
+            "seed": args.seed,
+            "character_height": generator.CHARACTER_HEIGHT,
+            "line_length": generator.LINE_LENGTH,
+            "stages": results,
+        }
+        if encodings:
+            data["encodings"] = {
+                f"{name}/{kind}": {"bytes_per_line": size, "us_per_line": us}
+                for (name, kind), (size, us) in encodings.items()
+            }
+        Path(args.outfile).write_text(json.dumps(data, indent=1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+
+# Benchmark the speed and accuracy of every model in tessdata on the images in
+# data/evaluation: per-page latency, throughput, peak RSS of tesseract and CER.
+# Each run is appended to data/evaluation/benchmarks.csv, and each model is
+# compared with its previous run (same host & number of jobs). Slower, bigger or
+# less accurate results beyond the tolerances are flagged as regressions, and the
+# exit status is 1 if any were found.
+# A model cascade (see cascade.py) given as "-c FAST:SLOW" is benchmarked the
+# same way, next to both of its models, and compared with always using SLOW.
+
+import argparse
+import csv
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import unicodedata
+
+from cache_utils import get_file_hash
+from cascade import DEFAULT_MIN_CONFIDENCE
+from cascade import DEFAULT_RERUN_SCALE
+from cascade import get_cascade_label
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+TESSDATA_DIR = ROOT_DIR / "tessdata"
+EVAL_DIR = ROOT_DIR / "data" / "evaluation"
+BENCHMARKS_CSV = EVAL_DIR / "benchmarks.csv"
+CSV_FIELDNAMES = [
+    "date",
+    "host",
+    "model",
+    "model-sha256",
+    "jobs",
+    "pages",
+    "latency-mean",
+    "latency-p50",
+    "latency-p95",
+    "pages-per-sec",
+    "peak-rss-mb",
+    "cer",
+]
+# Relative change in speed or memory, or absolute change in CER, flagged as a
+# regression.
+DEFAULT_TOLERANCE = 0.10
+CER_TOLERANCE = 0.005
+
+
+def get_percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)]
+
+
+def get_pages(eval_dir=EVAL_DIR):
+    """return list of (image file, truth file) pairs"""
+    pages = []
+    for gt_file in sorted(eval_dir.glob("*/*.gt.txt")):
+        image_file = Path(str(gt_file).replace(".gt.txt", ".png"))
+        if image_file.is_file():
+            pages.append((image_file, gt_file))
+    return pages
+
+
+def run_tesseract(image_file, model, out_base):
+    """return (text, seconds, peak RSS in MB) of one tesseract run"""
+    cmd = ["tesseract", str(image_file), str(out_base), "-l", model]
+    log_file = Path(f"{out_base}.log")
+    with log_file.open("w") as log:
+        t_start = time.monotonic()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=log)
+        # os.wait4 gives the resource usage of this child alone.
+        _, status, rusage = os.wait4(proc.pid, 0)
+        seconds = time.monotonic() - t_start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(log_file.read_text().strip())
+    # ru_maxrss is in KiB on Linux.
+    return Path(f"{out_base}.txt").read_text(), seconds, rusage.ru_maxrss / 1024
+
+
+def get_error_counts(truth_file, text):
+    """return (errors, truth chars) as used for group CER in show-chart.py"""
+    import jiwer
+
+    transform = jiwer.transforms.Compose(
+        [jiwer.transforms.Strip(), jiwer.transforms.ReduceToListOfListOfChars()]
+    )
+    result = jiwer.process_characters(
+        reference=unicodedata.normalize("NFC", truth_file.read_text()),
+        hypothesis=unicodedata.normalize("NFC", text),
+        reference_transform=transform,
+        hypothesis_transform=transform,
+    )
+    errors = result.substitutions + result.deletions + result.insertions
+    return errors, result.substitutions + result.deletions + result.hits
+
+
+def benchmark_model(model, pages, jobs):
+    """return benchmark results row for model over pages"""
+    errors = 0
+    total = 0
+    latencies = []
+    peak_rss = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+
+        def run_page(i):
+            image_file, _ = pages[i]
+            return run_tesseract(image_file, model, Path(tmp_dir) / str(i))
+
+        t_start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(run_page, range(len(pages))))
+        wall = time.monotonic() - t_start
+
+    for (_, gt_file), (text, seconds, rss) in zip(pages, results):
+        e, n = get_error_counts(gt_file, text)
+        errors += e
+        total += n
+        latencies.append(seconds)
+        peak_rss = max(peak_rss, rss)
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "model": model,
+        "model-sha256": get_file_hash(TESSDATA_DIR / f"{model}.traineddata"),
+        "jobs": jobs,
+        "pages": len(pages),
+        "latency-mean": round(statistics.mean(latencies), 3),
+        "latency-p50": round(get_percentile(latencies, 50), 3),
+        "latency-p95": round(get_percentile(latencies, 95), 3),
+        "pages-per-sec": round(len(pages) / wall, 3),
+        "peak-rss-mb": round(peak_rss, 1),
+        "cer": round(errors / total, 4) if total else "",
+    }
+
+
+def run_cascade_page(args):
+    """return (text, seconds, lines, lines re-read) of one page; runs in a worker"""
+    from cascade import ocr_cascade
+    from PIL import Image
+
+    image_file, fast_model, slow_model, min_confidence, scale = args
+    with Image.open(image_file) as img:
+        t_start = time.monotonic()
+        text, num_lines, num_reread = ocr_cascade(
+            img, fast_model, slow_model, min_confidence, scale
+        )
+        seconds = time.monotonic() - t_start
+    return text, seconds, num_lines, num_reread
+
+
+def benchmark_cascade(fast_model, slow_model, pages, jobs, min_confidence, scale):
+    """return (benchmark results row, fraction of lines re-read) for a cascade"""
+    from ocr_pipeline import init_ocr_worker
+
+    errors = 0
+    total = 0
+    latencies = []
+    num_lines = 0
+    num_reread = 0
+    t_start = time.monotonic()
+    with multiprocessing.Pool(
+        processes=jobs, initializer=init_ocr_worker, initargs=(TESSDATA_DIR,)
+    ) as pool:
+        results = pool.map(
+            run_cascade_page,
+            [
+                (image_file, fast_model, slow_model, min_confidence, scale)
+                for image_file, _ in pages
+            ],
+        )
+    wall = time.monotonic() - t_start
+
+    for (_, gt_file), (text, seconds, lines, reread) in zip(pages, results):
+        e, n = get_error_counts(gt_file, text)
+        errors += e
+        total += n
+        latencies.append(seconds)
+        num_lines += lines
+        num_reread += reread
+    row = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "model": get_cascade_label(fast_model, slow_model, min_confidence, scale),
+        "model-sha256": "+".join(
+            get_file_hash(TESSDATA_DIR / f"{m}.traineddata")
+            for m in (fast_model, slow_model)
+        ),
+        "jobs": jobs,
+        "pages": len(pages),
+        "latency-mean": round(statistics.mean(latencies), 3),
+        "latency-p50": round(get_percentile(latencies, 50), 3),
+        "latency-p95": round(get_percentile(latencies, 95), 3),
+        "pages-per-sec": round(len(pages) / wall, 3),
+        # tesseract runs inside the workers (or their pytesseract subprocesses),
+        # so its memory can't be told apart from Python's.
+        "peak-rss-mb": "",
+        "cer": round(errors / total, 4) if total else "",
+    }
+    return row, num_reread / num_lines if num_lines else 0
+
+
+def load_benchmarks(benchmarks_csv=BENCHMARKS_CSV):
+    if not benchmarks_csv.is_file():
+        return []
+    with benchmarks_csv.open(newline="") as c:
+        return list(csv.DictReader(c))
+
+
+def save_benchmark(row, benchmarks_csv=BENCHMARKS_CSV):
+    new_file = not benchmarks_csv.is_file()
+    with benchmarks_csv.open("a", newline="") as c:
+        dwriter = csv.DictWriter(c, fieldnames=CSV_FIELDNAMES)
+        if new_file:
+            dwriter.writeheader()
+        dwriter.writerow(row)
+
+
+def get_previous_run(history, row):
+    for r in reversed(history):
+        if (r.get("model"), r.get("host"), str(r.get("jobs"))) == (
+            row.get("model"),
+            row.get("host"),
+            str(row.get("jobs")),
+        ):
+            return r
+    return None
+
+
+def get_regressions(prev, row, tolerance=DEFAULT_TOLERANCE):
+    """return list of fields in row that are worse than in prev beyond tolerance"""
+    if prev is None:
+        return []
+    regressions = []
+    # (field, True if higher is worse)
+    for k, higher_is_worse in (
+        ("latency-p50", True),
+        ("latency-p95", True),
+        ("peak-rss-mb", True),
+        ("pages-per-sec", False),
+    ):
+        if prev.get(k) == "" or row.get(k) == "":
+            continue
+        old = float(prev.get(k))
+        new = float(row.get(k))
+        change = (new - old) / old if old else 0
+        if (change if higher_is_worse else -change) > tolerance:
+            regressions.append(k)
+    if prev.get("cer") != "" and row.get("cer") != "":
+        if float(row.get("cer")) - float(prev.get("cer")) > CER_TOLERANCE:
+            regressions.append("cer")
+    return regressions
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Benchmark latency, throughput, memory & CER of tessdata models on data/evaluation."
+    )
+    parser.add_argument(
+        "-c",
+        "--cascade",
+        action="append",
+        metavar="FAST:SLOW",
+        help="also benchmark this model cascade, e.g. 'Latin:Latin_afr'; without -l, only its models are benchmarked; can be given more than once",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of pages to OCR at once, to mimic production load [1]",
+    )
+    parser.add_argument(
+        "-l",
+        "--model",
+        action="append",
+        help="benchmark only this model; can be given more than once [all]",
+    )
+    parser.add_argument(
+        "-m",
+        "--min-confidence",
+        type=float,
+        default=DEFAULT_MIN_CONFIDENCE,
+        help=f"with -c, mean word confidence (0-100) below which a line is read again [{DEFAULT_MIN_CONFIDENCE}]",
+    )
+    parser.add_argument(
+        "-n",
+        "--no-save",
+        action="store_true",
+        help="don't add results to benchmarks.csv",
+    )
+    parser.add_argument(
+        "-s",
+        "--rerun-scale",
+        type=float,
+        default=DEFAULT_RERUN_SCALE,
+        help=f"with -c, scale lines that are read again by this factor [{DEFAULT_RERUN_SCALE}]",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help=f"relative change in speed or memory flagged as a regression [{DEFAULT_TOLERANCE}]",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    cascades = []
+    for c in args.cascade or []:
+        fast_model, sep, slow_model = c.partition(":")
+        if not sep or not fast_model or not slow_model:
+            print(f"Error: Invalid cascade: {c}; use FAST:SLOW")
+            exit(1)
+        cascades.append((fast_model, slow_model))
+    models = args.model
+    if not models and cascades:
+        models = sorted({m for c in cascades for m in c})
+    if not models:
+        models = sorted(f.stem for f in TESSDATA_DIR.glob("*.traineddata"))
+    if not models:
+        print(f"Error: No models found in {TESSDATA_DIR}")
+        exit(1)
+    for m in models + [m for c in cascades for m in c]:
+        if not (TESSDATA_DIR / f"{m}.traineddata").is_file():
+            print(f"Error: Could not find model: {m}")
+            exit(1)
+    pages = get_pages()
+    if not pages:
+        print(f"Error: No image/ground truth pairs found in {EVAL_DIR}")
+        exit(1)
+    os.environ["TESSDATA_PREFIX"] = str(TESSDATA_DIR)
+    # Parallelism comes from the jobs; keep each tesseract single-threaded.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+    history = load_benchmarks()
+    found_regressions = False
+    print(
+        f"Benchmarking {len(models)} models on {len(pages)} pages, {args.jobs} at once"
+    )
+    print("p50 (s)\tp95 (s)\tpages/s\tRSS (MB)\tCER\tModel")
+    rows = {}
+    benchmarks = [(m, None) for m in models] + [(None, c) for c in cascades]
+    for m, cascade in benchmarks:
+        try:
+            if cascade:
+                row, reread = benchmark_cascade(
+                    *cascade, pages, args.jobs, args.min_confidence, args.rerun_scale
+                )
+            else:
+                row = benchmark_model(m, pages, args.jobs)
+        except RuntimeError as e:
+            print(f"Error: {m or ':'.join(cascade)}: {e}")
+            continue
+        m = row.get("model")
+        rows[m] = row
+        regressions = get_regressions(
+            get_previous_run(history, row), row, args.tolerance
+        )
+        flag = f"\tREGRESSION: {', '.join(regressions)}" if regressions else ""
+        found_regressions = found_regressions or bool(regressions)
+        print(
+            f"{row.get('latency-p50')}\t{row.get('latency-p95')}\t{row.get('pages-per-sec')}\t"
+            f"{row.get('peak-rss-mb')}\t\t{row.get('cer')}\t{m}{flag}"
+        )
+        if not args.no_save:
+            save_benchmark(row)
+        if cascade:
+            slow = rows.get(cascade[1])
+            if slow is None:
+                continue
+            speedup = float(row.get("pages-per-sec")) / float(slow.get("pages-per-sec"))
+            cer_change = ""
+            if row.get("cer") != "" and slow.get("cer") != "":
+                cer_change = (
+                    f", CER {float(row.get('cer')) - float(slow.get('cer')):+.4f}"
+                )
+            print(
+                f"\t{reread:.0%} of lines re-read; {speedup:.2f}x pages/s{cer_change} vs. {cascade[1]} alone"
+            )
+    if found_regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Measure the startup time of the repo's scripts on their lightest code paths.
+# Each command is run several times and the fastest and mean wall times are shown.
+# With "-i" the slowest imports of each command are also listed (python -X importtime).
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from pathlib import Path
+
+DEFAULT_RUNS = 5
+
+
+def get_commands(scripts_dir, eval_dir):
+    gt_file = sorted(eval_dir.glob("*/*.gt.txt"))[0]
+    hyp_file = gt_file.with_name(gt_file.name.replace(".gt.", ".Latin."))
+    return {
+        "evaluate-ocr (truth vs hypothesis)": [
+            scripts_dir / "evaluate-ocr.py",
+            "-t",
+            gt_file,
+            "-o",
+            hyp_file,
+        ],
+        "generate-training-data (weights)": [
+            scripts_dir / "generate-training-data.py",
+            "-w",
+        ],
+        "scan-data (help)": [scripts_dir / "scan-data.py", "-h"],
+        "show-chart (summary table)": [scripts_dir / "show-chart.py", "-n"],
+    }
+
+
+def time_command(cmd, runs):
+    times = []
+    for i in range(runs):
+        t_start = time.perf_counter()
+        proc = subprocess.run([sys.executable, *cmd], capture_output=True)
+        times.append(time.perf_counter() - t_start)
+        if proc.returncode != 0:
+            print(f"Error: Command failed: {' '.join(str(c) for c in cmd)}")
+            print(proc.stderr.decode(), end="")
+            return None
+    return times
+
+
+def get_slowest_imports(cmd, count=5):
+    # Ref: https://docs.python.org/3/using/cmdline.html#cmdoption-X
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *cmd], capture_output=True
+    )
+    imports = []
+    for line in proc.stderr.decode().splitlines():
+        # e.g. "import time:       153 |      26870 | matplotlib.pyplot"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line.split("|")
+        imports.append((int(parts[1]), parts[2].rstrip()))
+    imports.sort(reverse=True)
+    return imports[:count]
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Measure startup time of the repo's scripts."
+    )
+    parser.add_argument(
+        "-i",
+        "--imports",
+        action="store_true",
+        help="also list the slowest (cumulative) imports of each command",
+    )
+    parser.add_argument(
+        "-r",
+        "--runs",
+        type=int,
+        default=DEFAULT_RUNS,
+        help=f"number of runs per command [{DEFAULT_RUNS}]",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    scripts_dir = Path(__file__).expanduser().resolve().parent
+    eval_dir = scripts_dir.parent / "data" / "evaluation"
+
+    print("Min (s)\tMean (s)\tCommand")
+    for name, cmd in get_commands(scripts_dir, eval_dir).items():
+        times = time_command(cmd, args.runs)
+        if times is None:
+            continue
+        print(f"{min(times):.3f}\t{statistics.mean(times):.3f}\t\t{name}")
+        if args.imports:
+            for us, module in get_slowest_imports(cmd):
+                print(f"\t{us / 1_000_000:.3f}\t\t  {module}")
+
+
+if __name__ == "__main__":
+    main()
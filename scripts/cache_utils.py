@@ -0,0 +1,49 @@
+"""helpers for content-hash keyed caches shared by the scripts"""
+
+import hashlib
+import json
+import os
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_file_hash(file_path, hash_cache=None):
+    """return sha256 of file contents, reusing cached hash if size & mtime are unchanged"""
+    stat = file_path.stat()
+    key = str(file_path)
+    cached = hash_cache.get(key) if hash_cache is not None else None
+    if (
+        cached
+        and cached.get("size") == stat.st_size
+        and cached.get("mtime") == stat.st_mtime_ns
+    ):
+        return cached.get("sha256")
+
+    h = hashlib.sha256()
+    with file_path.open("rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            h.update(chunk)
+    if hash_cache is not None:
+        hash_cache[key] = {
+            "mtime": stat.st_mtime_ns,
+            "sha256": h.hexdigest(),
+            "size": stat.st_size,
+        }
+    return h.hexdigest()
+
+
+def load_json(json_file, default):
+    if json_file.is_file():
+        return json.loads(json_file.read_text())
+    return default
+
+
+def save_json(json_file, data, indent=1):
+    # Write to a temporary file first so that an interrupted run never leaves
+    # a truncated file behind.
+    tmp_file = json_file.with_name(f"{json_file.name}.tmp")
+    if indent is None:
+        tmp_file.write_text(json.dumps(data, separators=(",", ":")))
+    else:
+        tmp_file.write_text(json.dumps(data, indent=indent, sort_keys=True))
+    os.replace(tmp_file, json_file)
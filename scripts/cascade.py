@@ -0,0 +1,196 @@
+"""confidence-gated model cascade: re-read only doubtful lines with a slower model"""
+
+# Most lines of a clean page are read just as well by a general model (e.g.
+# Latin) as by a specialized one. The page is read once with the fast model,
+# whose word data (see ocr_data.py) gives each word's confidence; lines
+# whose mean word confidence is below a threshold are cropped from the page
+# (optionally upscaled, i.e. at a higher DPI), stacked one below the other in a
+# single image, and read again with the slow model in one tesseract run, so that
+# a page costs at most two runs however many lines are doubtful. Each re-read
+# line's text replaces the fast model's, and the page text is put back together
+# the way tesseract's text output lays it out. If most lines are doubtful, the
+# page is simply read again as a whole with the slow model. The
+# fast model's text & word data can also be passed in if they were stored when
+# the page was read before.
+
+import bisect
+import io
+
+from char_profiles import get_profile_config
+from ocr_data import parse_tsv
+from ocr_data import run_tesseract
+from ocr_pipeline import DEFAULT_MODEL
+
+DEFAULT_FAST_MODEL = "Latin"
+DEFAULT_SLOW_MODEL = DEFAULT_MODEL
+# Tesseract word confidences are 0-100.
+DEFAULT_MIN_CONFIDENCE = 85
+DEFAULT_RERUN_SCALE = 1.0
+# Re-reading either the stacked lines or the whole page is one slow-model run,
+# whose cost grows with the amount of text. Beyond this fraction of doubtful
+# lines, little is saved by stacking them, and reading the whole page keeps the
+# slow model's own layout analysis.
+MAX_RERUN_FRACTION = 0.5
+LINE_PAD = 4  # px kept around each cropped line
+LINE_GAP = 24  # px of white between stacked lines, so they're not merged
+# Tesseract page segmentation mode for a single uniform block of text.
+BLOCK_PSM = 6
+
+
+def get_cascade_label(fast_model, slow_model, min_confidence, scale):
+    """return name under which results of the cascade are stored"""
+    label = f"{fast_model}-{slow_model}@{min_confidence:g}"
+    if scale != 1:
+        label += f"x{scale:g}"
+    return label
+
+
+def get_data_lines(data):
+    """return lines in reading order from word data (see ocr_data.py)
+
+    Each line is a dict with its paragraph, text, mean word confidence and
+    bounding box (left, top, right, bottom).
+    """
+    lines = {}
+    for i, word in enumerate(data.get("text")):
+        conf = float(data.get("conf")[i])
+        if conf < 0 or not word.strip():
+            continue
+        key = tuple(
+            data.get(k)[i] for k in ("page_num", "block_num", "par_num", "line_num")
+        )
+        left = data.get("left")[i]
+        top = data.get("top")[i]
+        right = left + data.get("width")[i]
+        bottom = top + data.get("height")[i]
+        line = lines.setdefault(
+            key,
+            {
+                "par": key[:3],
+                "words": [],
+                "confs": [],
+                "box": [left, top, right, bottom],
+            },
+        )
+        line.get("words").append(word)
+        line.get("confs").append(conf)
+        box = line.get("box")
+        line["box"] = [
+            min(box[0], left),
+            min(box[1], top),
+            max(box[2], right),
+            max(box[3], bottom),
+        ]
+    for line in lines.values():
+        line["text"] = " ".join(line.pop("words"))
+        confs = line.pop("confs")
+        line["conf"] = sum(confs) / len(confs)
+    return list(lines.values())
+
+
+def get_lines_text(lines):
+    """return page text of lines, laid out like tesseract's text output"""
+    text = ""
+    for i, line in enumerate(lines):
+        text += f"{line.get('text')}\n"
+        if i == len(lines) - 1 or lines[i + 1].get("par") != line.get("par"):
+            # Paragraphs are followed by an empty line.
+            text += "\n"
+    return text
+
+
+def crop_line(img, box, scale=DEFAULT_RERUN_SCALE):
+    from PIL import Image
+
+    left, top, right, bottom = box
+    crop = img.crop(
+        (
+            max(0, left - LINE_PAD),
+            max(0, top - LINE_PAD),
+            min(img.width, right + LINE_PAD),
+            min(img.height, bottom + LINE_PAD),
+        )
+    )
+    if scale != 1:
+        size = (round(crop.width * scale), round(crop.height * scale))
+        crop = crop.resize(size, Image.Resampling.LANCZOS)
+    return crop
+
+
+def stack_lines(crops):
+    """return (image of crops one below the other, top of each crop in it)"""
+    from PIL import Image
+
+    tops = []
+    y = LINE_GAP
+    for crop in crops:
+        tops.append(y)
+        y += crop.height + LINE_GAP
+    width = max(crop.width for crop in crops) + 2 * LINE_GAP
+    stack = Image.new("L", (width, y), 255)
+    for crop, top in zip(crops, tops):
+        stack.paste(crop.convert("L"), (LINE_GAP, top))
+    return stack, tops
+
+
+def ocr_stacked_lines(crops, model, config=""):
+    """return text of each line image in crops, read together in one tesseract run"""
+    stack, tops = stack_lines(crops)
+    _, tsv = run_tesseract(stack, model, f"--psm {BLOCK_PSM} {config}".strip())
+    texts = [[] for _ in crops]
+    for line in get_data_lines(parse_tsv(tsv)):
+        _, top, _, bottom = line.get("box")
+        # Each text line belongs to the crop its vertical center falls in.
+        i = bisect.bisect_right(tops, (top + bottom) / 2) - 1
+        texts[max(i, 0)].append(line.get("text"))
+    return [" ".join(t) for t in texts]
+
+
+def ocr_cascade(
+    img,
+    fast_model=DEFAULT_FAST_MODEL,
+    slow_model=DEFAULT_SLOW_MODEL,
+    min_confidence=DEFAULT_MIN_CONFIDENCE,
+    scale=DEFAULT_RERUN_SCALE,
+    profile=None,
+    first_pass=None,
+):
+    """return (text, number of lines, number of lines re-read) of img
+
+    first_pass is the fast model's (text, word data) of img, if already known.
+    """
+    config = get_profile_config(profile)
+    if first_pass is None:
+        text, tsv = run_tesseract(img, fast_model, config)
+        first_pass = (text, parse_tsv(tsv))
+    text, data = first_pass
+    lines = get_data_lines(data)
+    doubtful = [line for line in lines if line.get("conf") < min_confidence]
+    if not doubtful:
+        return text, len(lines), 0
+    if len(doubtful) > MAX_RERUN_FRACTION * len(lines):
+        text, _ = run_tesseract(img, slow_model, config)
+        return text, len(lines), len(lines)
+    crops = [crop_line(img, line.get("box"), scale) for line in doubtful]
+    for line, line_text in zip(doubtful, ocr_stacked_lines(crops, slow_model, config)):
+        line["text"] = line_text
+    return get_lines_text(lines), len(lines), len(doubtful)
+
+
+def ocr_cascade_bytes(
+    image_bytes,
+    fast_model=DEFAULT_FAST_MODEL,
+    slow_model=DEFAULT_SLOW_MODEL,
+    min_confidence=DEFAULT_MIN_CONFIDENCE,
+    scale=DEFAULT_RERUN_SCALE,
+    profile=None,
+):
+    """return text of image_bytes read by the cascade; runs in a worker process"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img.load()
+        text, _, _ = ocr_cascade(
+            img, fast_model, slow_model, min_confidence, scale, profile
+        )
+    return text
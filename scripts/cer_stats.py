@@ -0,0 +1,137 @@
+"""bootstrap confidence intervals & paired tests of group CER between models"""
+
+# With only a few dozen evaluation pages, two models' group CERs can differ by
+# chance alone. Pages are resampled to estimate how much: each bootstrap replicate
+# weights every page by a Poisson(1) count (the "Poisson bootstrap"), which for
+# many pages is equivalent to resampling them with replacement, but lets models
+# evaluated on different pages share the same replicates. Group CER of every
+# replicate is then one matrix product:
+#   CER[b, k] = (weights @ errors)[b, k] / (weights @ truth)[b, k]
+# for replicates b and columns k (a model, or a model's pages in one iso_lang).
+# Paired tests use only the pages both models were evaluated on.
+
+import numpy as np
+import warnings
+
+DEFAULT_RESAMPLES = 5000
+DEFAULT_SEED = 0
+CI_LEVEL = 0.95
+
+
+def get_page_name(row):
+    """return "<iso_lang>/<image file name>" of a data.csv row"""
+    return f"{row.get('iso_lang')}/{row.get('image-file').split('/')[-1]}"
+
+
+def get_newest_rows(csv_data):
+    """return data.csv rows, keeping only the newest of each (model, page)"""
+    newest = {}
+    for r in csv_data:
+        key = (r.get("model"), get_page_name(r))
+        if key not in newest or float(r.get("timestamp")) > float(
+            newest[key].get("timestamp")
+        ):
+            newest[key] = r
+    return list(newest.values())
+
+
+class PageCounts:
+    """errors & truth chars of each (page, model) from data.csv rows"""
+
+    def __init__(self, csv_data):
+        # Only the newest evaluation of each (model, page) counts.
+        newest = {
+            (r.get("model"), get_page_name(r)): r for r in get_newest_rows(csv_data)
+        }
+        self.model_names = sorted({m for m, _ in newest})
+        self.pages = sorted({p for _, p in newest})
+        m_idx = {m: i for i, m in enumerate(self.model_names)}
+        p_idx = {p: i for i, p in enumerate(self.pages)}
+        self.iso_langs = [""] * len(self.pages)
+
+        shape = (len(self.pages), len(self.model_names))
+        self.errors = np.zeros(shape)
+        self.truth = np.zeros(shape)
+        self.present = np.zeros(shape, dtype=bool)
+        for (m, p), r in newest.items():
+            i = p_idx.get(p)
+            j = m_idx.get(m)
+            s = float(r.get("substitutions"))
+            d = float(r.get("deletions"))
+            self.errors[i, j] = s + d + float(r.get("insertions"))
+            self.truth[i, j] = s + d + float(r.get("hits"))
+            self.present[i, j] = True
+            self.iso_langs[i] = r.get("iso_lang")
+        self.iso_langs = np.array(self.iso_langs)
+
+    def get_columns(self, model_name, iso_lang=None):
+        """return (errors, truth) of model's pages, zero for other pages"""
+        j = self.model_names.index(model_name)
+        keep = self.present[:, j]
+        if iso_lang is not None:
+            keep = keep & (self.iso_langs == iso_lang)
+        return self.errors[:, j] * keep, self.truth[:, j] * keep
+
+
+def get_bootstrap_weights(num_pages, resamples=DEFAULT_RESAMPLES, seed=DEFAULT_SEED):
+    """return (resamples, num_pages) array of Poisson(1) page weights"""
+    rng = np.random.default_rng(seed)
+    return rng.poisson(1.0, size=(resamples, num_pages)).astype(float)
+
+
+def get_replicate_cers(weights, errors, truth):
+    """return (resamples, columns) array of group CER of each replicate"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (weights @ errors) / (weights @ truth)
+
+
+def get_intervals(replicates, level=CI_LEVEL):
+    """return (low, high) arrays of the percentile interval of each column"""
+    tail = (1 - level) / 2 * 100
+    with warnings.catch_warnings():
+        # Columns without any pages (e.g. models sharing none) are all NaN.
+        warnings.simplefilter("ignore", RuntimeWarning)
+        low, high = np.nanpercentile(replicates, [tail, 100 - tail], axis=0)
+    return low, high
+
+
+def get_cer_intervals(weights, errors, truth, level=CI_LEVEL):
+    """return (low, high) arrays of the CI of group CER of each column"""
+    return get_intervals(get_replicate_cers(weights, errors, truth), level)
+
+
+def get_paired_tests(weights, counts, pairs, level=CI_LEVEL):
+    """return (CER difference, CI low, CI high, p-value) arrays for model pairs
+
+    The difference is CER(a) - CER(b) over the pages both a & b were evaluated
+    on; the p-value is two-sided, for the difference being 0. All are NaN for
+    pairs that share no pages.
+    """
+    cols = [[], [], [], []]
+    for a, b in pairs:
+        i = counts.model_names.index(a)
+        j = counts.model_names.index(b)
+        shared = counts.present[:, i] & counts.present[:, j]
+        cols[0].append(counts.errors[:, i] * shared)
+        cols[1].append(counts.truth[:, i] * shared)
+        cols[2].append(counts.errors[:, j] * shared)
+        cols[3].append(counts.truth[:, j] * shared)
+    e_a, t_a, e_b, t_b = (np.column_stack(c) for c in cols)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        diff = e_a.sum(axis=0) / t_a.sum(axis=0) - e_b.sum(axis=0) / t_b.sum(axis=0)
+    replicates = get_replicate_cers(weights, e_a, t_a) - get_replicate_cers(
+        weights, e_b, t_b
+    )
+    low, high = get_intervals(replicates, level)
+    valid = ~np.isnan(replicates)
+    n = valid.sum(axis=0).clip(min=1)
+    below = ((replicates <= 0) & valid).sum(axis=0) / n
+    above = ((replicates >= 0) & valid).sum(axis=0) / n
+    p = np.minimum(1.0, 2 * np.minimum(below, above))
+    p = np.where(valid.any(axis=0), p, np.nan)
+    return diff, low, high, p
+
+
+def format_stat(value, spec):
+    """return value formatted with spec, or "n/a" if it's NaN"""
+    return "n/a" if np.isnan(value) else format(value, spec)
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+"""per-iso_lang character profiles used as tesseract whitelists"""
+
+# Each profile is "precompiled" once into a tesseract config file,
+# data/char-profiles/<iso_lang>.config, holding a single line:
+#   tessedit_char_whitelist <characters>
+# The file path is then passed to tesseract as a config file. Profiles are built
+# from the iso_lang's .gt.txt files in data/evaluation, or from a character list
+# such as the output of list-unique-characers.py.
+
+import argparse
+import csv
+import shlex
+import unicodedata
+
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+PROFILES_DIR = ROOT_DIR / "data" / "char-profiles"
+EVAL_DIR = ROOT_DIR / "data" / "evaluation"
+# Appended to model names in data.csv, e.g. "Latin+whitelist".
+WHITELIST_LABEL = "whitelist"
+
+
+def get_profile_chars(text):
+    """return sorted string of unique non-whitespace chars in text, NFC & NFD"""
+    chars = set()
+    for form in ("NFC", "NFD"):
+        chars.update(unicodedata.normalize(form, text))
+    return "".join(sorted(c for c in chars if not c.isspace()))
+
+
+def read_char_list(char_file):
+    # Output of list-unique-characers.py ends with "Characters:" then the list.
+    text = char_file.read_text()
+    _, found, chars = text.rpartition("Characters:\n")
+    return chars if found else text
+
+
+def get_profile_path(iso_lang, profiles_dir=PROFILES_DIR):
+    return profiles_dir / f"{iso_lang}.config"
+
+
+def write_profile(iso_lang, chars, profiles_dir=PROFILES_DIR):
+    profile = get_profile_path(iso_lang, profiles_dir)
+    profile.parent.mkdir(parents=True, exist_ok=True)
+    profile.write_text(f"tessedit_char_whitelist {chars}\n")
+    return profile
+
+
+def build_profile(iso_lang, eval_dir=EVAL_DIR, profiles_dir=PROFILES_DIR):
+    """write profile from iso_lang's .gt.txt files and return its path, or None"""
+    gt_files = sorted((eval_dir / iso_lang).glob("*.gt.txt"))
+    if not gt_files:
+        return None
+    text = "".join(f.read_text() for f in gt_files)
+    return write_profile(iso_lang, get_profile_chars(text), profiles_dir)
+
+
+def get_iso_langs(eval_dir=EVAL_DIR):
+    """return sorted names of the iso_lang folders in eval_dir"""
+    return sorted(d.name for d in eval_dir.iterdir() if d.is_dir())
+
+
+def get_profile(iso_lang, eval_dir=EVAL_DIR, profiles_dir=PROFILES_DIR):
+    """return path of iso_lang's profile, building it if needed, or None
+
+    iso_lang must name a folder of eval_dir, since it may come from outside
+    (e.g. ocr_service.py's whitelist) and becomes part of file paths.
+    """
+    if iso_lang not in get_iso_langs(eval_dir):
+        return None
+    profile = get_profile_path(iso_lang, profiles_dir)
+    if profile.is_file():
+        return profile
+    return build_profile(iso_lang, eval_dir, profiles_dir)
+
+
+def get_profile_config(profile):
+    """return tesseract config argument for profile (a path), or "" if None
+
+    The path is quoted, since config strings are split like a shell command line.
+    """
+    return shlex.quote(str(profile)) if profile else ""
+
+
+def get_whitelist_report(data_csv, model):
+    """return {iso_lang: {label: {cer, seconds}}} for model with & without whitelist"""
+    wl_model = f"{model}+{WHITELIST_LABEL}"
+    sums = {}
+    with data_csv.open(newline="") as c:
+        for r in csv.DictReader(c):
+            if r.get("model") not in (model, wl_model):
+                continue
+            s = sums.setdefault(r.get("iso_lang"), {}).setdefault(
+                r.get("model"), {"errors": 0, "total": 0, "seconds": []}
+            )
+            s["errors"] += sum(
+                int(r.get(k)) for k in ("substitutions", "deletions", "insertions")
+            )
+            s["total"] += sum(
+                int(r.get(k)) for k in ("substitutions", "deletions", "hits")
+            )
+            if r.get("ocr-seconds"):
+                s["seconds"].append(float(r.get("ocr-seconds")))
+    report = {}
+    for iso_lang, by_model in sorted(sums.items()):
+        report[iso_lang] = {}
+        for m, s in by_model.items():
+            report[iso_lang][m] = {
+                "cer": s.get("errors") / s.get("total") if s.get("total") else None,
+                "seconds": (
+                    sum(s.get("seconds")) / len(s.get("seconds"))
+                    if s.get("seconds")
+                    else None
+                ),
+            }
+    return report
+
+
+def show_whitelist_report(data_csv, model):
+    wl_model = f"{model}+{WHITELIST_LABEL}"
+    report = get_whitelist_report(data_csv, model)
+    print(f"iso_lang\t\tCER {model}\tCER +wl\tΔCER\tsec {model}\tsec +wl\tΔsec")
+    for iso_lang, by_model in report.items():
+        plain = by_model.get(model, {})
+        wl = by_model.get(wl_model, {})
+        cols = []
+        for k, fmt in (("cer", "{:.4f}"), ("seconds", "{:.2f}")):
+            a = plain.get(k)
+            b = wl.get(k)
+            cols.append(fmt.format(a) if a is not None else "-")
+            cols.append(fmt.format(b) if b is not None else "-")
+            cols.append(fmt.format(b - a) if a is not None and b is not None else "-")
+        print(f"{iso_lang:<16}\t" + "\t".join(cols))
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Build per-iso_lang tesseract whitelist profiles and compare their results."
+    )
+    parser.add_argument(
+        "-c",
+        "--char-list",
+        type=str,
+        help="build ISO_LANG's profile from this character list (e.g. saved list-unique-characers.py output)",
+    )
+    parser.add_argument(
+        "-r",
+        "--report",
+        type=str,
+        metavar="MODEL",
+        help="show CER & OCR seconds by iso_lang for MODEL with and without whitelist",
+    )
+    parser.add_argument(
+        "iso_lang",
+        nargs="*",
+        help="iso_lang folder names in data/evaluation to (re)build profiles for [all]",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    if args.report:
+        show_whitelist_report(EVAL_DIR / "data.csv", args.report)
+        return
+
+    if args.char_list:
+        if len(args.iso_lang) != 1:
+            print("Error: Give exactly one iso_lang with -c.")
+            exit(1)
+        chars = get_profile_chars(read_char_list(Path(args.char_list)))
+        print(write_profile(args.iso_lang[0], chars))
+        return
+
+    iso_langs = args.iso_lang
+    if not iso_langs:
+        iso_langs = get_iso_langs()
+    for iso_lang in iso_langs:
+        profile = build_profile(iso_lang)
+        if profile is None:
+            print(f"Warning: No .gt.txt files found for {iso_lang}")
+            continue
+        print(profile)
+
+
+if __name__ == "__main__":
+    main()
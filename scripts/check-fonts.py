@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+# Check that each font used for training data actually renders every character
+# cluster that generate-training-data.py can produce. All clusters (each base
+# character alone and with each diacritic it can take) are drawn once per font
+# file on a grid, the same way the generator renders lines, and the cells are
+# compared at once as a numpy array. A cluster is flagged when it:
+#   - has no ink at all ("empty"),
+#   - looks like the font's .notdef glyph, or like its base followed by it ("notdef"),
+#   - looks the same as its base character, i.e. the diacritic isn't drawn ("same as base").
+# Cells are compared by their number of differing ink pixels: the same glyphs
+# always render the same, while a drawn diacritic changes at least a couple of
+# pixels, even where it overlaps a capital base. A diacritic is only blamed when
+# it fails on several bases that render fine on their own.
+# Results are cached by font file hash, and "-u" writes the bad characters of each
+# checked font family to fonts.txt.
+
+import argparse
+import importlib.util
+import multiprocessing
+import sys
+
+from cache_utils import get_file_hash
+from cache_utils import load_json
+from cache_utils import save_json
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parents[1]
+GENERATOR_SCRIPT = Path(__file__).resolve().parent / "generate-training-data.py"
+CACHE_FILE = ROOT_DIR / "data" / "font-checks.json"
+# Bump when the clusters or checks change so that cached results are redone.
+CHECK_VERSION = 2
+# A codepoint that no font maps, so it's always drawn with the .notdef glyph.
+NOTDEF_CHAR = "\uffff"
+FONT_SIZE = 12  # pt
+CELL_SIZE = 36  # pt; room for a wide glyph plus diacritics above & below
+GRID_COLUMNS = 40
+DPI = 144  # 24 px characters, as small as diacritics stay distinct
+# Gray levels darker than this count as ink.
+INK_LEVEL = 128
+# Clusters whose ink differs in fewer than this many pixels are the same.
+SAME_PIXELS = 1
+# A diacritic is bad if it fails on at least this many bases, and on at least
+# MIN_BAD_FRACTION of the (fine) bases it's drawn on.
+MIN_BAD_BASES = 2
+MIN_BAD_FRACTION = 0.5
+
+
+def load_generator():
+    """return generate-training-data.py as a module"""
+    spec = importlib.util.spec_from_file_location("generator", GENERATOR_SCRIPT)
+    generator = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(generator)
+    return generator
+
+
+def get_clusters(variables):
+    """return list of (cluster, base, mark or None) the generator can produce"""
+    bases = []
+    for c in variables.get("consonants") + variables.get("vowels"):
+        bases.extend(dict.fromkeys([c, c.upper()]))
+    top = [d.decode("unicode-escape") for d in variables.get("diac_top")]
+    bottom = [d.decode("unicode-escape") for d in variables.get("diac_bot")]
+    vowels = set(variables.get("vowels"))
+
+    clusters = [(b, b, None) for b in bases]
+    for b in bases:
+        marks = top + bottom if b.lower() in vowels else top
+        clusters.extend((f"{b}{m}", b, m) for m in marks)
+    for c in variables.get("numbers") + variables.get("punctuation"):
+        clusters.append((c, c, None))
+    return clusters
+
+
+def render_cells(texts, fontfile):
+    """return uint8 array (len(texts), px, px) of each text's ink in its own cell"""
+    import fitz  # PyMuPDF
+    import numpy as np
+
+    rows = -(-len(texts) // GRID_COLUMNS)
+    fontname = "checked"
+    with fitz.open() as doc:
+        page = doc.new_page(width=GRID_COLUMNS * CELL_SIZE, height=rows * CELL_SIZE)
+        page.insert_font(fontname=fontname, fontfile=fontfile)
+        for i, text in enumerate(texts):
+            row, col = divmod(i, GRID_COLUMNS)
+            # Baseline leaves room for diacritics above & below.
+            origin = (col * CELL_SIZE + FONT_SIZE / 2, (row + 0.65) * CELL_SIZE)
+            page.insert_text(origin, text, fontname=fontname, fontsize=FONT_SIZE)
+        pix = page.get_pixmap(dpi=DPI, colorspace=fitz.csGRAY)
+    px = CELL_SIZE * DPI // 72
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    img = img[: rows * px, : GRID_COLUMNS * px]
+    cells = img.reshape(rows, px, GRID_COLUMNS, px).swapaxes(1, 2)
+    return (cells.reshape(-1, px, px) < INK_LEVEL)[: len(texts)]
+
+
+def get_difference(a, b):
+    """return number of differing ink pixels of each pair of cells in a & b"""
+    return (a != b).sum(axis=(1, 2))
+
+
+def check_font(fontfile, clusters):
+    """return {cluster: problem} for the clusters fontfile doesn't render properly"""
+    import numpy as np
+
+    bases = list(dict.fromkeys(b for _, b, m in clusters if m))
+    texts = [c for c, _, _ in clusters]
+    texts += [NOTDEF_CHAR] + [f"{b}{NOTDEF_CHAR}" for b in bases]
+    ink = render_cells(texts, fontfile)
+
+    n = len(clusters)
+    cluster_ink = ink[:n]
+    notdef_ink = ink[n]
+    base_index = {c: i for i, (c, _, m) in enumerate(clusters) if m is None}
+    base_notdef_index = {b: n + 1 + i for i, b in enumerate(bases)}
+    base_ink = ink[[base_index.get(b) for _, b, _ in clusters]]
+    base_notdef_ink = ink[
+        [base_notdef_index.get(b, n) if m else n for _, b, m in clusters]
+    ]
+
+    empty = ~cluster_ink.any(axis=(1, 2))
+    notdef = get_difference(cluster_ink, base_notdef_ink) < SAME_PIXELS
+    if notdef_ink.any():
+        # An empty .notdef glyph can't be told apart from a missing diacritic.
+        notdef |= get_difference(cluster_ink, notdef_ink[np.newaxis]) < SAME_PIXELS
+    has_mark = np.array([m is not None for _, _, m in clusters])
+    same = has_mark & (get_difference(cluster_ink, base_ink) < SAME_PIXELS)
+
+    problems = {}
+    for i, (c, _, _) in enumerate(clusters):
+        if c.isspace():
+            continue
+        if empty[i]:
+            problems[c] = "empty"
+        elif notdef[i]:
+            problems[c] = "notdef"
+        elif same[i]:
+            problems[c] = "same as base"
+    return problems
+
+
+def get_bad_chars(problems, clusters):
+    """return sorted list of base characters & diacritics to avoid"""
+    bad = set()
+    tries = {}
+    fails = {}
+    for c, base, mark in clusters:
+        if mark is None:
+            if c in problems:
+                bad.add(base)
+        elif base not in problems:
+            # Only blame the diacritic on bases that are fine on their own.
+            tries[mark] = tries.get(mark, 0) + 1
+            if c in problems:
+                fails[mark] = fails.get(mark, 0) + 1
+    for mark, n in fails.items():
+        if n >= MIN_BAD_BASES and n >= MIN_BAD_FRACTION * tries.get(mark):
+            bad.add(mark)
+    return sorted(bad)
+
+
+def run_check(args):
+    fontfile, clusters = args
+    from matplotlib import font_manager
+
+    font = font_manager.get_font(fontfile)
+    try:
+        problems = check_font(fontfile, clusters)
+    except RuntimeError as e:
+        # e.g. a font format that MuPDF can't load
+        return fontfile, {"family": font.family_name, "error": str(e)}
+    return fontfile, {
+        "family": font.family_name,
+        "style": font.style_name,
+        "bad": get_bad_chars(problems, clusters),
+        "problems": problems,
+    }
+
+
+def check_fonts(fontfiles, clusters, jobs=None, use_cache=True):
+    """return {font file: result}, checking only files not in the cache"""
+    cache = load_json(CACHE_FILE, {})
+    hashes = cache.setdefault("hashes", {})
+    results = cache.setdefault("results", {})
+    key_by_file = {
+        f: f"{get_file_hash(Path(f), hashes)}-v{CHECK_VERSION}" for f in fontfiles
+    }
+    todo = [f for f in fontfiles if not use_cache or key_by_file.get(f) not in results]
+    if todo:
+        with multiprocessing.Pool(processes=jobs) as pool:
+            for fontfile, result in pool.imap_unordered(
+                run_check, [(f, clusters) for f in todo]
+            ):
+                results[key_by_file.get(fontfile)] = result
+            pool.close()
+            pool.join()
+        save_json(CACHE_FILE, cache, indent=None)
+    return {f: results.get(key_by_file.get(f)) for f in fontfiles}
+
+
+def escape_chars(chars):
+    return " ".join(c.encode("unicode-escape").decode() for c in chars)
+
+
+def update_fonts_file(fonts_file, bad_by_family):
+    """rewrite bad characters of the given families in fonts_file; return changed families"""
+    changed = []
+    lines = fonts_file.read_text().splitlines()
+    for i, line in enumerate(lines):
+        if not line.strip() or line.startswith("#"):
+            continue
+        entry, sep, comment = line.partition("#")
+        family = entry.split("|")[0].strip()
+        if family not in bad_by_family:
+            continue
+        new_line = family
+        bad = bad_by_family.get(family)
+        if bad:
+            new_line += f" | {escape_chars(bad)}"
+        if sep:
+            new_line += f" #{comment}"
+        if new_line != line:
+            lines[i] = new_line
+            changed.append(family)
+    fonts_file.write_text("\n".join(lines) + "\n")
+    return changed
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Find characters that training fonts don't render properly."
+    )
+    parser.add_argument(
+        "-f",
+        "--fontfile",
+        action="append",
+        help="check this font file instead of the installed fonts listed in fonts.txt; can be given more than once",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of fonts to check at once [# of CPUs]",
+    )
+    parser.add_argument(
+        "-n",
+        "--no-cache",
+        action="store_true",
+        help="check fonts again even if their results are cached",
+    )
+    parser.add_argument(
+        "-u",
+        "--update",
+        action="store_true",
+        help="write bad characters of each checked font family to fonts.txt",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="show each cluster that failed and why",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    generator = load_generator()
+    variables = generator.get_script_variables()
+    model_fonts = variables.get("fonts")
+
+    if args.fontfile:
+        fontfiles = [str(Path(f).expanduser().resolve()) for f in args.fontfile]
+        for f in fontfiles:
+            if not Path(f).is_file():
+                print(f"Error: Could not find file: {f}")
+                exit(1)
+    else:
+        installed = generator.get_available_fonts()
+        fontfiles = [
+            f
+            for family in model_fonts
+            for style, f in installed.get(family, {}).items()
+            if style in variables.get("styles")
+        ]
+    if not fontfiles:
+        print("Error: No fonts to check.")
+        exit(1)
+
+    clusters = get_clusters(variables)
+    results = check_fonts(fontfiles, clusters, args.jobs, not args.no_cache)
+
+    bad_by_family = {}
+    for f, r in results.items():
+        if r.get("error"):
+            print(f"Error: {f}: {r.get('error')}", file=sys.stderr)
+            continue
+        family = r.get("family")
+        bad = r.get("bad")
+        listed = model_fonts.get(family)
+        note = ""
+        if listed is not None and set(listed) != set(bad):
+            note = f"\t(fonts.txt: {escape_chars(listed) or '-'})"
+        print(f"{family} {r.get('style')}: {escape_chars(bad) or 'OK'}{note}")
+        if args.verbose:
+            for c, problem in r.get("problems").items():
+                print(f"  {escape_chars(c)}\t{c}\t{problem}")
+        # A family's characters are bad if any of its styles is bad.
+        bad_by_family.setdefault(family, set()).update(bad)
+
+    if args.update:
+        fonts_file = (
+            generator.get_model_dir(generator.WRITING_SYSTEM_NAME) / "fonts.txt"
+        )
+        bad_by_family = {
+            f: sorted(b) for f, b in bad_by_family.items() if f in model_fonts
+        }
+        for family in update_fonts_file(fonts_file, bad_by_family):
+            print(f"Updated {fonts_file.name}: {family}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+# Evaluate training checkpoints (or traineddata models) with lstmeval on the
+# training's list.eval and rank them by BCER. Several lstmeval jobs are run at
+# once, and results are cached by the content hashes of the checkpoint, the eval
+# list and (for checkpoints) the traineddata they're evaluated with, so that only
+# new checkpoints are evaluated on later runs.
+# This replaces the Makefile's "evaluation" target, which evaluates one
+# checkpoint at a time and rebuilds the results from the logs with grep & sed.
+
+import argparse
+import multiprocessing
+import os
+import re
+import subprocess
+import time
+
+from cache_utils import get_file_hash
+from cache_utils import load_json
+from cache_utils import save_json
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from pathlib import Path
+
+DEFAULT_DATA_DIR = Path.home() / "tesstrain" / "data"
+DEFAULT_MODEL_NAME = "Latin_afr"
+# e.g. "BCER eval=2.134, BWER eval=7.321"
+LSTMEVAL_RE = re.compile(r"BCER eval=([\d.]+), BWER eval=([\d.]+)")
+
+
+def find_checkpoints(output_dir, model_name):
+    checkpoints = list((output_dir / "checkpoints").glob(f"{model_name}*.checkpoint"))
+    checkpoints.sort()
+    return checkpoints
+
+
+def run_lstmeval(model_file, traineddata, eval_list):
+    """return (BCER, BWER, seconds) from running lstmeval, or None on failure"""
+    cmd = [
+        "lstmeval",
+        "--verbosity=0",
+        f"--model={model_file}",
+        f"--eval_listfile={eval_list}",
+    ]
+    if model_file.suffix == ".checkpoint":
+        cmd.append(f"--traineddata={traineddata}")
+    # Each job gets one thread; parallelism comes from running several jobs.
+    env = {**os.environ, "OMP_THREAD_LIMIT": "1"}
+    t_start = time.monotonic()
+    proc = subprocess.run(cmd, capture_output=True, env=env)
+    seconds = round(time.monotonic() - t_start, 1)
+    m = LSTMEVAL_RE.search((proc.stdout + proc.stderr).decode(errors="replace"))
+    if proc.returncode != 0 or not m:
+        print(f"Error: lstmeval failed for {model_file.name}")
+        return None
+    return float(m.group(1)), float(m.group(2)), seconds
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Evaluate and rank checkpoints with lstmeval in parallel."
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        type=str,
+        default=str(DEFAULT_DATA_DIR),
+        help=f"tesstrain data folder [{DEFAULT_DATA_DIR}]",
+    )
+    parser.add_argument(
+        "-e",
+        "--eval-list",
+        type=str,
+        help="list of lstmf files to evaluate with [DATA_DIR/MODEL_NAME/list.eval]",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help="number of lstmeval jobs to run at once [# of CPUs]",
+    )
+    parser.add_argument(
+        "-m",
+        "--model-name",
+        type=str,
+        default=DEFAULT_MODEL_NAME,
+        help=f"name of the trained model [{DEFAULT_MODEL_NAME}]",
+    )
+    parser.add_argument(
+        "model_file",
+        nargs="*",
+        help="checkpoint or traineddata files to evaluate [all checkpoints of MODEL_NAME]",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    data_dir = Path(args.data_dir).expanduser().resolve()
+    output_dir = data_dir / args.model_name
+    traineddata = output_dir / f"{args.model_name}.traineddata"
+    eval_list = output_dir / "list.eval"
+    if args.eval_list:
+        eval_list = Path(args.eval_list).expanduser().resolve()
+    cache_file = output_dir / "lstmeval-cache.json"
+
+    model_files = [Path(f).expanduser().resolve() for f in args.model_file]
+    if not model_files:
+        model_files = find_checkpoints(output_dir, args.model_name)
+    for f in [eval_list, *model_files]:
+        if not f.is_file():
+            print(f"Error: Could not find file: {f}")
+            exit(1)
+    if not model_files:
+        print(f"Error: No checkpoints found in {output_dir / 'checkpoints'}")
+        exit(1)
+    if (
+        any(f.suffix == ".checkpoint" for f in model_files)
+        and not traineddata.is_file()
+    ):
+        print(f"Error: Could not find file: {traineddata}")
+        exit(1)
+
+    cache = load_json(cache_file, {"hashes": {}, "results": {}})
+    eval_hash = get_file_hash(eval_list, cache.get("hashes"))
+    keys = {
+        f: f"{get_file_hash(f, cache.get('hashes'))}:{eval_hash}" for f in model_files
+    }
+    checkpoints = [f for f in model_files if f.suffix == ".checkpoint"]
+    if checkpoints:
+        # Checkpoints are evaluated with the traineddata's unicharset & recoder.
+        traineddata_hash = get_file_hash(traineddata, cache.get("hashes"))
+        for f in checkpoints:
+            keys[f] += f":{traineddata_hash}"
+    todo = [f for f in model_files if keys.get(f) not in cache.get("results")]
+    print(
+        f"Evaluating {len(todo)} of {len(model_files)} models with {args.jobs} jobs "
+        f"({len(model_files) - len(todo)} cached)..."
+    )
+
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {
+            executor.submit(run_lstmeval, f, traineddata, eval_list): f for f in todo
+        }
+        for future in as_completed(futures):
+            f = futures.get(future)
+            result = future.result()
+            if result is None:
+                continue
+            bcer, bwer, seconds = result
+            print(f"  {f.name}: BCER {bcer}, BWER {bwer} ({seconds}s)")
+            cache["results"][keys.get(f)] = {
+                "bcer": bcer,
+                "bwer": bwer,
+                "name": f.name,
+                "seconds": seconds,
+            }
+            save_json(cache_file, cache)
+    save_json(cache_file, cache)
+
+    ranked = [
+        (cache.get("results").get(keys.get(f)), f)
+        for f in model_files
+        if keys.get(f) in cache.get("results")
+    ]
+    ranked.sort(key=lambda r: (r[0].get("bcer"), r[0].get("bwer")))
+    print()
+    print("Rank\tBCER\tBWER\tModel")
+    for i, (r, f) in enumerate(ranked, start=1):
+        print(f"{i}\t{r.get('bcer')}\t{r.get('bwer')}\t{f.name}")
+
+
+if __name__ == "__main__":
+    main()
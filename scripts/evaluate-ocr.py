@@ -2,13 +2,20 @@
 
 import argparse
 import csv
-import jiwer
 import os
-import pytesseract
+import time
 import unicodedata
 
 from pathlib import Path
-from PIL import Image
+from profiling import init_profiling
+from profiling import stage
+
+# NOTE: jiwer, PIL, preprocess & ocr_data (numpy) and cascade are imported only in the functions that need
+# them; scan-data.py runs this script once per (model, image) pair, so startup
+# time matters.
+# Besides the text, each OCR run stores tesseract's word data (boxes and
+# confidences) next to the hypothesis file (see ocr_data.py), so that e.g. mean
+# confidence in data.csv, or a cascade's first pass, don't need another run.
 
 
 def validate_filelike_input(input_text, ftype="file"):
@@ -39,6 +46,8 @@ def compare_text_files(truth_file, hypothesis_file):
     """
     Calculate and return CER between two text files.
     """
+    import jiwer
+
     with open(truth_file) as t:
         truth = convert_to_nfc(t.read())
 
@@ -94,13 +103,94 @@ def get_all_ocr_models(tessdata_dir):
     return [f.stem for f in model_files if f.stem != "Latin_afr"]
 
 
-def run_ocr(infile_path, model, outfile_path):
+def update_csv_header(data_csv, fieldnames):
+    """rewrite data_csv with fieldnames as header if its header differs"""
+    with open(data_csv, newline="") as c:
+        reader = csv.DictReader(c)
+        if reader.fieldnames == fieldnames:
+            return
+        rows = list(reader)
+    tmp_csv = data_csv.with_name(f"{data_csv.name}.tmp")
+    with open(tmp_csv, "w", newline="") as c:
+        dwriter = csv.DictWriter(c, fieldnames=fieldnames, restval="")
+        dwriter.writeheader()
+        dwriter.writerows(rows)
+    os.replace(tmp_csv, data_csv)
+
+
+def get_page_key(row):
+    """return (model, iso_lang, image file name) of a data.csv row"""
+    return row.get("model"), row.get("iso_lang"), Path(row.get("image-file")).name
+
+
+def add_csv_row(data_csv, fieldnames, row):
+    """add row to data_csv, replacing earlier rows of the same model & page"""
+    # A page is evaluated again when its image, truth or model has changed
+    # (see scan-data.py); only the new results should count.
+    with open(data_csv, newline="") as c:
+        rows = [r for r in csv.DictReader(c) if get_page_key(r) != get_page_key(row)]
+    tmp_csv = data_csv.with_name(f"{data_csv.name}.tmp")
+    with open(tmp_csv, "w", newline="") as c:
+        dwriter = csv.DictWriter(c, fieldnames=fieldnames, restval="")
+        dwriter.writeheader()
+        dwriter.writerows(rows)
+        dwriter.writerow(row)
+    os.replace(tmp_csv, data_csv)
+
+
+def run_ocr(
+    infile_path, model, outfile_path, steps=None, config_file=None, cascade=None
+):
+    """OCR infile_path into outfile_path and return seconds taken by tesseract
+
+    If cascade is (slow model, min. confidence, first pass text file), lines
+    that model isn't confident about are read again with the slow model; the
+    first pass is reused if its output was stored.
+    """
+    from char_profiles import get_profile_config
+    from ocr_data import get_word_data_file
+    from ocr_data import load_word_data
+    from ocr_data import parse_tsv
+    from ocr_data import run_tesseract
+    from ocr_data import save_word_data
+
     print(f"Recognizing text from {infile_path.name} using model {model}...")
-    with Image.open(infile_path) as img:
-        htext = pytesseract.image_to_string(
-            img, lang=model, config="-c page_separator=''"
-        )
+    image_path = infile_path
+    if steps:
+        from preprocess import get_preprocessed_image
+
+        with stage("preprocess"):
+            image_path = get_preprocessed_image(infile_path, steps)
+    if cascade:
+        from PIL import Image
+        from cascade import ocr_cascade
+
+        slow_model, min_confidence, first_file = cascade
+        first_pass = None
+        data = load_word_data(get_word_data_file(first_file))
+        if data is not None and first_file.is_file():
+            first_pass = (first_file.read_text(), data)
+        with Image.open(image_path) as img, stage("cascade"):
+            # With a stored first pass, only re-read lines are timed.
+            t_start = time.monotonic()
+            htext, _, _ = ocr_cascade(
+                img,
+                model,
+                slow_model,
+                min_confidence,
+                profile=config_file,
+                first_pass=first_pass,
+            )
+            seconds = time.monotonic() - t_start
+        outfile_path.write_text(htext)
+        return seconds
+    with stage("tesseract"):
+        t_start = time.monotonic()
+        htext, tsv = run_tesseract(image_path, model, get_profile_config(config_file))
+        seconds = time.monotonic() - t_start
     outfile_path.write_text(htext)
+    save_word_data(get_word_data_file(outfile_path), parse_tsv(tsv))
+    return seconds
 
 
 def main():
@@ -111,6 +201,14 @@ def main():
         description=description,
         # formatter_class=argparse.RawDescriptionHelpFormatter,
     )
+    parser.add_argument(
+        "-c",
+        "--cascade",
+        nargs=1,
+        type=str,
+        metavar="MODEL",
+        help="read lines that the -l model is less than -m confident about again with MODEL (see cascade.py)",
+    )
     parser.add_argument(
         "-l",
         "--model",
@@ -118,11 +216,24 @@ def main():
         type=str,
         help="name of tesseract model used to create hypothesis file",
     )
+    parser.add_argument(
+        "-m",
+        "--min-confidence",
+        type=float,
+        help="with -c, mean word confidence (0-100) below which a line is read again [85]",
+    )
     # parser.add_argument(
     #     '-s', '--update-spreadsheet',
     #     action='store_true',
     #     help="update spreadsheet with character comparison data",
     # )
+    parser.add_argument(
+        "-p",
+        "--preprocess",
+        nargs=1,
+        type=str,
+        help="comma-separated image preprocessing steps to apply before OCR, e.g. 'sauvola,deskew,despeckle'",
+    )
     parser.add_argument(
         "-t",
         "--truth",
@@ -137,6 +248,19 @@ def main():
         type=str,
         help="path to recognized (hypothesis) text file",
     )
+    parser.add_argument(
+        "-w",
+        "--whitelist",
+        action="store_true",
+        help="restrict OCR to the characters of the image's iso_lang profile (see char_profiles.py)",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="stages",
+        choices=["stages", "cprofile"],
+        help="print time spent in each stage at exit; 'cprofile' also saves cProfile stats of each process to data/profile [stages]",
+    )
     parser.add_argument(
         "image_file",
         nargs="?",
@@ -144,6 +268,7 @@ def main():
     )
 
     args = parser.parse_args()
+    init_profiling("evaluate-ocr", args.profile)
     # Set env variables.
     tessdata_dir = Path(__file__).parents[1] / "tessdata"
     os.environ["TESSDATA_PREFIX"] = str(tessdata_dir)
@@ -158,7 +283,8 @@ def main():
         if hypothesis is False:
             print(f"Error: Could not find file: {args.hypothesis[0]}")
             exit(1)
-        results = compare_text_files(truth, hypothesis)
+        with stage("compare"):
+            results = compare_text_files(truth, hypothesis)
         for k, v in results.items():
             print(f"{k}: {v}")
         exit()
@@ -166,6 +292,7 @@ def main():
     # Set default evaluation folder and data CSV file.
     eval_dir = Path(__file__).parents[1] / "data" / "evaluation"
     data_csv = eval_dir / "data.csv"
+    lines_csv = eval_dir / "lines.csv"
     csv_fieldnames = [
         "timestamp",
         "iso_lang",
@@ -179,6 +306,8 @@ def main():
         "deletions",
         "insertions",
         "hits",
+        "ocr-seconds",
+        "mean-confidence",
     ]
 
     if not data_csv.is_file():
@@ -186,6 +315,9 @@ def main():
         with open(data_csv, "w", newline="") as c:
             dwriter = csv.DictWriter(c, fieldnames=csv_fieldnames)
             dwriter.writeheader()
+    else:
+        # Add columns introduced since data_csv was created.
+        update_csv_header(data_csv, csv_fieldnames)
 
     # Set default language model.
     if not args.model:
@@ -201,6 +333,17 @@ def main():
     if model_names == ["all"]:
         model_names = get_all_ocr_models(tessdata_dir)
 
+    steps = []
+    if args.preprocess:
+        from preprocess import get_model_label
+        from preprocess import parse_steps
+
+        try:
+            steps = parse_steps(args.preprocess[0])
+        except ValueError as e:
+            print(f"Error: {e}")
+            exit(1)
+
     image_file = validate_filelike_input(args.image_file)
     if image_file is False:
         print(f"Error: Could not find file: {args.image_file}")
@@ -222,11 +365,40 @@ def main():
     if truth is False:
         print(f"Error: Could not find file: {t_file}")
         exit(1)
+
+    profile = None
+    if args.whitelist:
+        from char_profiles import WHITELIST_LABEL
+        from char_profiles import get_profile
+
+        profile = get_profile(base_dir.name)
+        if profile is None:
+            print(f"Error: No character profile for {base_dir.name}")
+            exit(1)
+
     for model_name in model_names:
-        h_file = base_dir / f"{stem}.{model_name}.txt"
+        label = get_model_label(model_name, steps) if steps else model_name
+        if profile:
+            label = f"{label}+{WHITELIST_LABEL}"
+        cascade = None
+        if args.cascade:
+            from cascade import DEFAULT_MIN_CONFIDENCE
+            from cascade import get_cascade_label
+
+            min_confidence = args.min_confidence or DEFAULT_MIN_CONFIDENCE
+            first_file = base_dir / f"{stem}.{label}.txt"
+            cascade = (args.cascade[0], min_confidence, first_file)
+            model_label = get_cascade_label(
+                model_name, args.cascade[0], min_confidence, 1
+            )
+            label = label.replace(model_name, model_label, 1)
+        h_file = base_dir / f"{stem}.{label}.txt"
         hypothesis = validate_filelike_input(h_file)
+        ocr_seconds = ""
         if hypothesis is False:
-            run_ocr(image_file, model_name, h_file)
+            ocr_seconds = round(
+                run_ocr(image_file, model_name, h_file, steps, profile, cascade), 3
+            )
             hypothesis = validate_filelike_input(h_file)
             if hypothesis is False:
                 print(f"Error: File not properly created: {str(h_file)}")
@@ -244,14 +416,34 @@ def main():
             results["iso_lang"] = base_dir.name
             results["image-file"] = str(image_file)
             results["truth-text-file"] = str(t_file)
-            results["model"] = model_name
+            results["model"] = label
             results["ocr-text-file"] = str(h_file)
-
-            results.update(compare_text_files(truth, hypothesis))
+            results["ocr-seconds"] = ocr_seconds
+            from ocr_data import get_mean_confidence
+            from ocr_data import get_word_data_file
+            from ocr_data import load_word_data
+
+            data = load_word_data(get_word_data_file(h_file))
+            mean_confidence = get_mean_confidence(data) if data else None
+            if mean_confidence is not None:
+                results["mean-confidence"] = round(mean_confidence, 2)
+
+            with stage("compare"):
+                results.update(compare_text_files(truth, hypothesis))
             results["cer"] = round(results.get("cer"), 4)
-            with open(data_csv, "a", newline="") as c:
-                dwriter = csv.DictWriter(c, fieldnames=csv_fieldnames)
-                dwriter.writerow(results)
+            add_csv_row(data_csv, csv_fieldnames, results)
+
+            # Per-line CER, to find which lines of a page failed (see worst-lines.py).
+            from line_alignment import append_line_results
+            from line_alignment import get_line_results
+
+            with stage("align lines"):
+                line_results = get_line_results(
+                    truth.read_text(), hypothesis.read_text()
+                )
+            common = {k: results.get(k) for k in ("timestamp", "iso_lang", "model")}
+            common["truth-text-file"] = str(t_file)
+            append_line_results(lines_csv, common, line_results)
 
 
 if __name__ == "__main__":
@@ -4,12 +4,12 @@
 
 # https://tesseract-ocr.github.io/tessdoc/tess5/TrainingTesseract-5.html
 # Generate training data for Tesseract:
-#   - data folder: "data/training/Latin_afr-ground-truth"
+#   - data folder: "data/training/Latin_afr-ground-truth", a symlink to the
+#     active version in "data/training/Latin_afr-ground-truth.versions"
 #   - image files of individual lines of text: "img.tif|img.png"
 #   - text files of individual lines of text: "img.gt.txt"
 
 import argparse
-import fitz  # PyMuPDF: https://pymupdf.readthedocs.io/en/latest/
 import multiprocessing
 import random
 import subprocess
@@ -17,21 +17,55 @@ import sys
 import tempfile
 import time
 
-from matplotlib import font_manager
 from os import environ
 from pathlib import Path
 from PIL import Image
 from PIL import ImageFilter
-
+from gt_lists import add_lines
+from gt_versions import activate_version
+from gt_versions import adopt_legacy_dir
+from gt_versions import collect_garbage
+from gt_versions import create_version
+from gt_versions import get_active_version
+from gt_versions import get_version_config
+from gt_versions import get_versions
+from gt_versions import get_versions_dir
+from hard_examples import DEFAULT_EASY_FRACTION
+from hard_examples import get_line_errors
+from ocr_pipeline import TESSDATA_DIR
+from ocr_pipeline import TESSEROCR_WARNING
+from ocr_pipeline import has_tesserocr
+from ocr_pipeline import init_ocr_worker
+from ocr_pipeline import ocr_line
+from profiling import init_profiling
+from profiling import stage
+
+# NOTE: PyMuPDF (fitz) and matplotlib's font_manager are imported only where
+# they're used so that informational options (-c, -w, -r) start quickly.
 
 # Global variables.
 WRITING_SYSTEM_NAME = "Latin_afr"
 DEFAULT_CHARACTER_HEIGHT = 48
 DEFAULT_ITERATIONS = 1
 DEFAULT_LINE_LENGTH = 50
+DEFAULT_TEXT2IMAGE_BATCH_SIZE = 100
 MAX_LINE_LENGTH = 80
 IMAGE_BLEND_ALPHA = 0.4
 IMAGE_NOISE_SIGMA = 50
+# Encodings for lines without degradations; degraded lines are always saved as
+# grayscale (or RGB) PNGs so that blur & noise aren't thresholded away.
+#   encoding: (PIL mode, file extension, save options)
+# Compression levels are from "benchmark-generator.py -e": clean lines are ~10%
+# smaller at level 6 than 3, level 9 is ~10x slower for ~5% less; noisy lines
+# hardly compress, so they are saved quickly at level 1.
+IMAGE_ENCODINGS = {
+    "rgb": ("RGB", ".png", {"compress_level": 6}),
+    "gray": ("L", ".png", {"compress_level": 6}),
+    "1bit": ("1", ".png", {"compress_level": 6}),
+    "g4": ("1", ".tif", {"compression": "group4"}),
+}
+DEFAULT_IMAGE_ENCODING = "gray"
+DEGRADED_COMPRESS_LEVEL = 1
 
 
 # Function definitions.
@@ -325,12 +359,14 @@ def get_ground_truth_dir(script):
     return get_git_root(__file__) / "data" / "training" / f"{script}-ground-truth"
 
 
-def reset_ground_truth(gt_dir_path):
-    """delete all files in the ground-truth folder except .placeholder file, then exit"""
-    for c in gt_dir_path.iterdir():
-        if c.name == ".placeholder":
-            continue
-        c.unlink()
+def show_ground_truth_versions(gt_link):
+    active = get_active_version(gt_link)
+    for d in get_versions(gt_link):
+        num_lines = sum(1 for _ in d.glob("*.gt.txt"))
+        config = get_version_config(d)
+        settings = ", ".join(f"{k}={v}" for k, v in sorted(config.items()))
+        flag = "*" if d == active else " "
+        print(f"{flag} {d.name}\t{num_lines} lines\t{settings}")
 
 
 def get_random_index(num_opt):
@@ -347,6 +383,8 @@ def get_binary_choice(prob=0.5):
 
 def get_available_fonts():
     # https://stackoverflow.com/a/68810954
+    from matplotlib import font_manager
+
     fonts = {}
     search_paths = [
         "/usr/share/fonts",
@@ -551,18 +589,23 @@ def generate_text_line_weighted_chars(vs, length=40):
     return s.decode("unicode-escape")
 
 
-def generate_text_line_png(chars, fontfile):
-    def add_noise(image):
-        noise = Image.effect_noise(size=image.size, sigma=IMAGE_NOISE_SIGMA)
-        noisy_image = Image.blend(image, noise.convert(image.mode), IMAGE_BLEND_ALPHA)
-        del image
-        return noisy_image
-
-    def add_blur(image):
-        px_radius = CHARACTER_HEIGHT / 30
-        blurry_image = image.filter(ImageFilter.GaussianBlur(px_radius))
-        del image
-        return blurry_image
+def add_noise(image):
+    noise = Image.effect_noise(size=image.size, sigma=IMAGE_NOISE_SIGMA)
+    noisy_image = Image.blend(image, noise.convert(image.mode), IMAGE_BLEND_ALPHA)
+    del image
+    return noisy_image
+
+
+def add_blur(image):
+    px_radius = CHARACTER_HEIGHT / 30
+    blurry_image = image.filter(ImageFilter.GaussianBlur(px_radius))
+    del image
+    return blurry_image
+
+
+def render_text_line(chars, fontfile):
+    """return PIL image of a page with chars rendered at CHARACTER_HEIGHT"""
+    import fitz  # PyMuPDF: https://pymupdf.readthedocs.io/en/latest/
 
     fontname = Path(fontfile).stem
     with fitz.open() as doc:
@@ -585,9 +628,13 @@ def generate_text_line_png(chars, fontfile):
         dpi = int(CHARACTER_HEIGHT / (fontsize / 72))
         pix = page.get_pixmap(dpi=dpi)
 
-    # Crop the pixmap to remove extra whitespace; convert to PIL Image.
+    # Convert pixmap to PIL Image.
     #   Ref: https://github.com/pymupdf/PyMuPDF/issues/322#issuecomment-512561756
-    img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+
+def crop_text_line(img):
+    """return img cropped to its text plus a few px of padding"""
     # Get boundary extents.
     box_extents = list(get_box_extents_pil(img))
     # Add padding around text.
@@ -599,22 +646,38 @@ def generate_text_line_png(chars, fontfile):
             box_extents[i] += pad
 
     # Crop the image.
-    img = img.crop(box_extents)
+    return img.crop(box_extents)
 
+
+def degrade_text_line(img):
+    """return (img, True if any degradation was applied)"""
+    degraded = False
     # Apply indicated degradations.
     if get_binary_choice(DEGRADED_IMAGE_PROBABILITY * 2):
         # Ensure at least one degradation is applied, with equal probability
         # for all possibilities.
         if get_binary_choice():
             img = add_blur(img)
+            degraded = True
         if get_binary_choice():
             img = add_noise(img)
+            degraded = True
+    return img, degraded
+
 
-    return img
+def generate_text_line_png(chars, fontfile):
+    """return (line image, True if degradations were applied)"""
+    with stage("render"):
+        img = render_text_line(chars, fontfile)
+    # Crop the image to remove extra whitespace.
+    with stage("crop"):
+        img = crop_text_line(img)
+    with stage("degrade"):
+        return degrade_text_line(img)
 
 
 def generate_training_data_pair(chars, fontfile):
-    pngdata = generate_text_line_png(chars, fontfile)
+    pngdata, degraded = generate_text_line_png(chars, fontfile)
     return chars, pngdata
 
 
@@ -639,6 +702,96 @@ def generate_text2image_data_pair(basedir, filename, chars, fontname, fontstyle)
         subprocess.run(cmd)
 
 
+def read_box_file_lines(box_file):
+    """return list of lines of box entries [char, left, bottom, right, top, page]"""
+    # text2image ends each line of text with a box for a tab character.
+    lines = []
+    boxes = []
+    for entry in box_file.read_text().splitlines():
+        c, *coords = entry.rsplit(" ", 5)
+        boxes.append([c, *[int(n) for n in coords]])
+        if c == "\t":
+            lines.append(boxes)
+            boxes = []
+    return lines
+
+
+def save_text2image_line(img, boxes, pad, gt_dir, name, chars):
+    # Box coordinates have their origin at the bottom left of the page.
+    x0 = max(0, min(b[1] for b in boxes) - pad)
+    y0 = max(0, img.height - max(b[4] for b in boxes) - pad)
+    x1 = min(img.width, max(b[3] for b in boxes) + pad)
+    y1 = min(img.height, img.height - min(b[2] for b in boxes) + pad)
+    y_offset = img.height - y1
+    img.crop((x0, y0, x1, y1)).save(gt_dir / f"{name}.tif")
+    (gt_dir / f"{name}.gt.txt").write_text(chars)
+    box_lines = [
+        f"{c} {left - x0} {bottom - y_offset} {right - x0} {top - y_offset} 0"
+        for c, left, bottom, right, top, page in boxes
+    ]
+    (gt_dir / f"{name}.box").write_text("\n".join(box_lines) + "\n")
+
+
+def generate_text2image_batch(basedir, filename, lines, fontname, fontstyle):
+    """render lines with a single text2image run, then split into line images
+
+    return [(name, chars)] of saved lines, or None if text2image failed
+    """
+    if fontstyle == "Regular":
+        font = fontname
+    else:
+        font = f"{fontname} {fontstyle}"
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        text_file = Path(tmpdir) / "lines.txt"
+        text_file.write_text("\n".join(lines) + "\n")
+        outputbase = Path(tmpdir) / "page"
+        cmd = [
+            "text2image",
+            f"--text={text_file}",
+            f"--outputbase={outputbase}",
+            "--fonts_dir=/usr/share/fonts",
+            f"--font={font}",
+            # Make pages wide enough that no line gets wrapped.
+            f"--xsize={max(3600, MAX_LINE_LENGTH * 60)}",
+        ]
+        proc = subprocess.run(cmd, capture_output=True)
+        box_file = Path(f"{outputbase}.box")
+        tif_file = Path(f"{outputbase}.tif")
+        if proc.returncode != 0 or not box_file.is_file():
+            print(f"ERROR: text2image failed for font: {font}")
+            return None
+        box_lines = read_box_file_lines(box_file)
+        if len(box_lines) != len(lines):
+            print(
+                f"WARNING: Expected {len(lines)} lines from text2image but found {len(box_lines)}"
+            )
+            return None
+        if SIMULATE:
+            return []
+
+        pad = 3  # px
+        saved = []
+        with Image.open(tif_file) as pages:
+            for i, (chars, boxes) in enumerate(zip(lines, box_lines)):
+                name = f"{filename}_{i:04d}"
+                # text2image writes a box for each space, but not for every
+                # other kind of whitespace, so compare without any.
+                box_text = "".join(b[0] for b in boxes[:-1])
+                if "".join(box_text.split()) != "".join(chars.split()):
+                    print(
+                        f"WARNING: Box text doesn't match line; rendering alone: {chars}"
+                    )
+                    generate_text2image_data_pair(
+                        basedir, name, chars, fontname, fontstyle
+                    )
+                else:
+                    pages.seek(boxes[0][5])
+                    save_text2image_line(pages, boxes, pad, basedir, name, chars)
+                saved.append((name, chars))
+    return saved
+
+
 def choose_font_family(desired_fonts, system_fonts):
     """Choose font family randomly from desired_fonts that are also installed."""
     fonts = desired_fonts.copy()
@@ -663,17 +816,49 @@ def verify_fonts(needed_fonts, installed_fonts):
         exit(1)
 
 
-def save_training_data_pair(gt_dir, name, txtdata, pngdata):
+def encode_line_image(img, encoding, degraded=False):
+    """return (converted image, file extension, save options) for encoding"""
+    if degraded and encoding != "rgb":
+        encoding = "gray"
+    mode, ext, options = IMAGE_ENCODINGS.get(encoding)
+    if degraded:
+        options = {**options, "compress_level": DEGRADED_COMPRESS_LEVEL}
+    if mode == "1":
+        # Threshold at mid-gray; PIL's own "1" conversion dithers.
+        img = img.convert("L").point(lambda p: 255 if p >= 128 else 0, mode="1")
+    else:
+        img = img.convert(mode)
+    return img, ext, options
+
+
+def save_training_data_pair(
+    gt_dir, name, txtdata, pngdata, degraded=False, encoding=DEFAULT_IMAGE_ENCODING
+):
     txtfile = gt_dir / f"{name}.gt.txt"
-    pngfile = gt_dir / f"{name}.png"
+    img, ext, options = encode_line_image(pngdata, encoding, degraded)
+    imgfile = gt_dir / f"{name}{ext}"
 
     # Write out file contents.
     txtfile.write_text(txtdata)
-    pngdata.save(pngfile)
+    img.save(imgfile, **options)
 
 
 def get_parsed_args():
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a",
+        "--activate",
+        type=str,
+        metavar="VERSION",
+        help="switch the ground truth to an existing version (see -l), then exit",
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=DEFAULT_TEXT2IMAGE_BATCH_SIZE,
+        help=f"number of lines rendered per text2image run [{DEFAULT_TEXT2IMAGE_BATCH_SIZE}]",
+    )
     parser.add_argument(
         "-c",
         "--combinations",
@@ -686,11 +871,25 @@ def get_parsed_args():
         action="store_true",
         help="list installed fonts, then exit",
     )
+    parser.add_argument(
+        "-k",
+        "--keep-easy",
+        type=float,
+        default=DEFAULT_EASY_FRACTION,
+        metavar="FRACTION",
+        help=f"with -m, fraction of lines read without errors that are kept anyway [{DEFAULT_EASY_FRACTION}]",
+    )
+    parser.add_argument(
+        "-l",
+        "--list-versions",
+        action="store_true",
+        help="list ground truth versions (* = active), then exit",
+    )
     parser.add_argument(
         "-r",
         "--reset",
         action="store_true",
-        help=reset_ground_truth.__doc__,
+        help="generate into a new ground truth version and switch to it once finished; older versions except the previous one are deleted in the background",
     )
     parser.add_argument(
         "-w",
@@ -705,6 +904,13 @@ def get_parsed_args():
         default=0,
         help="probability of degradations getting applied to generated images [0.0]",
     )
+    parser.add_argument(
+        "-E",
+        "--encoding",
+        choices=list(IMAGE_ENCODINGS),
+        default=DEFAULT_IMAGE_ENCODING,
+        help=f"image encoding for lines without degradations; degraded lines are saved as grayscale PNG [{DEFAULT_IMAGE_ENCODING}]",
+    )
     parser.add_argument(
         "-F",
         "--font",
@@ -733,6 +939,13 @@ def get_parsed_args():
         default=DEFAULT_LINE_LENGTH,
         help="number of characters per generated line of text",
     )
+    parser.add_argument(
+        "-m",
+        "--mine",
+        type=str,
+        metavar="MODEL",
+        help="OCR each generated line with MODEL (in tessdata) and only keep the lines it gets wrong, plus a fraction of the others (see -k)",
+    )
     parser.add_argument(
         "-n",
         "--simulate",
@@ -748,13 +961,18 @@ def get_parsed_args():
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="show verbose output"
     )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="stages",
+        choices=["stages", "cprofile"],
+        help="print time spent in each stage at exit; 'cprofile' also saves cProfile stats of each process to data/profile [stages]",
+    )
     return parser.parse_args()
 
 
-def run_iteration(iter_num):
-    if VERBOSE:
-        print(f"INFO: Iteration: {iter_num}")
-
+def choose_font(iter_num):
+    """return (font family, font style, font file) for the iteration, or None"""
     # Choose font family.
     font_families = list(CHAR_VARS.get("fonts").keys())
     if FORCED_FONT:
@@ -771,17 +989,6 @@ def run_iteration(iter_num):
         print(f"ERROR: No valid font found; skipping iteration: {iter_num}")
         return
 
-    # Remove any 'bad_chars' items from 'dirty_char_str' to create clean 'char_line'.
-    bad_chars = CHAR_VARS.get("fonts").get(font_fam)
-    dirty_char_str = generate_text_line_weighted_chars(CHAR_VARS, length=LINE_LENGTH)
-    clean_unicode_list = [c for c in dirty_char_str if c not in bad_chars]
-    char_line = "".join(clean_unicode_list)
-    if VERBOSE:
-        print(f"INFO: start ({len(dirty_char_str)}): {dirty_char_str}")
-        print(f"INFO: bad:   {bad_chars}")
-        print(f"INFO: clean ({len(char_line)}): {char_line}")
-        print(f"INFO: {b''.join([c.encode('unicode-escape') for c in char_line])}")
-
     # Choose font style.
     fontfile = None
     styles = CHAR_VARS.get("styles")
@@ -800,6 +1007,35 @@ def run_iteration(iter_num):
             f'WARNING: "{font_fam}" doesn\'t have any matching font styles; skipping.'
         )
         return
+    return font_fam, font_sty, fontfile
+
+
+def generate_clean_text_line(font_fam):
+    # Remove any 'bad_chars' items from 'dirty_char_str' to create clean 'char_line'.
+    bad_chars = CHAR_VARS.get("fonts").get(font_fam)
+    dirty_char_str = generate_text_line_weighted_chars(CHAR_VARS, length=LINE_LENGTH)
+    clean_unicode_list = [c for c in dirty_char_str if c not in bad_chars]
+    char_line = "".join(clean_unicode_list)
+    if VERBOSE:
+        print(f"INFO: start ({len(dirty_char_str)}): {dirty_char_str}")
+        print(f"INFO: bad:   {bad_chars}")
+        print(f"INFO: clean ({len(char_line)}): {char_line}")
+        print(f"INFO: {b''.join([c.encode('unicode-escape') for c in char_line])}")
+    return char_line
+
+
+def run_iteration(iter_num):
+    """return [(name, text, font family, font style)] of saved lines"""
+    if VERBOSE:
+        print(f"INFO: Iteration: {iter_num}")
+
+    with stage("choose font"):
+        font = choose_font(iter_num)
+    if not font:
+        return []
+    font_fam, font_sty, fontfile = font
+    with stage("sample text"):
+        char_line = generate_clean_text_line(font_fam)
 
     # Generate files.
     filename = set_data_filename(font_fam, font_sty)
@@ -809,21 +1045,71 @@ def run_iteration(iter_num):
     if not USE_TEXT2IMAGE:
         # name, txtdata, pngdata = generate_training_data_pair(char_line, font_fam, font_sty, fontfile)
         # txtdata, pngdata = generate_training_data_pair(char_line, fontfile)
-        pngdata = generate_text_line_png(txtdata, fontfile)
+        pngdata, degraded = generate_text_line_png(txtdata, fontfile)
+        if MINE_MODEL:
+            with stage("mine"):
+                errors = get_line_errors(txtdata, ocr_line(pngdata, MINE_MODEL))
+            if VERBOSE:
+                print(f"INFO: {MINE_MODEL} errors: {errors}")
+            if errors == 0 and not get_binary_choice(EASY_FRACTION):
+                return []
         if not SIMULATE:
             # if VERBOSE:
             #     print(f"INFO: base name: {name}")
             # save_training_data_pair(GROUND_TRUTH_DIR, name, txtdata, pngdata)
-            save_training_data_pair(GROUND_TRUTH_DIR, filename, txtdata, pngdata)
+            with stage("save"):
+                save_training_data_pair(
+                    GROUND_TRUTH_DIR,
+                    filename,
+                    txtdata,
+                    pngdata,
+                    degraded,
+                    IMAGE_ENCODING,
+                )
     else:
-        generate_text2image_data_pair(
-            GROUND_TRUTH_DIR, filename, txtdata, font_fam, font_sty
+        with stage("text2image"):
+            generate_text2image_data_pair(
+                GROUND_TRUTH_DIR, filename, txtdata, font_fam, font_sty
+            )
+    return [(filename, txtdata, font_fam, font_sty)]
+
+
+def run_text2image_batch(iter_nums):
+    """return [(name, text, font family, font style)] of saved lines"""
+    # All lines in a batch use the same font & style so that text2image only
+    # needs to be run (and to scan the installed fonts) once per batch.
+    if VERBOSE:
+        print(f"INFO: Iterations: {iter_nums[0]}-{iter_nums[-1]}")
+
+    with stage("choose font"):
+        font = choose_font(iter_nums[0])
+    if not font:
+        return []
+    font_fam, font_sty, fontfile = font
+    with stage("sample text"):
+        lines = [generate_clean_text_line(font_fam) for i in iter_nums]
+    filename = set_data_filename(font_fam, font_sty)
+    if VERBOSE:
+        print(f"INFO: base name: {filename}")
+    with stage("text2image batch"):
+        saved = generate_text2image_batch(
+            GROUND_TRUTH_DIR, filename, lines, font_fam, font_sty
         )
+    if saved is None and not SIMULATE:
+        # Fall back to rendering each line on its own.
+        saved = []
+        for i, line in enumerate(lines):
+            generate_text2image_data_pair(
+                GROUND_TRUTH_DIR, f"{filename}_{i:04d}", line, font_fam, font_sty
+            )
+            saved.append((f"{filename}_{i:04d}", line))
+    return [(name, chars, font_fam, font_sty) for name, chars in saved or []]
 
 
 def main():
     # Handle command args.
     args = get_parsed_args()
+    init_profiling("generate-training-data", args.profile)
 
     # FIXME: Using globals is not ideal, but it makes setting up muliprocessing
     # a lot easier.
@@ -842,43 +1128,130 @@ def main():
     global USE_TEXT2IMAGE
     USE_TEXT2IMAGE = args.use_text2image
 
-    global GROUND_TRUTH_DIR
-    GROUND_TRUTH_DIR = get_ground_truth_dir(WRITING_SYSTEM_NAME)
-
     global CHAR_VARS
     CHAR_VARS = get_script_variables()
 
-    global SYSTEM_FONTS
-    SYSTEM_FONTS = get_available_fonts()
-
     global FORCED_FONT
     FORCED_FONT = args.font
 
     global DEGRADED_IMAGE_PROBABILITY
     DEGRADED_IMAGE_PROBABILITY = args.degraded_image_probability
 
+    global IMAGE_ENCODING
+    IMAGE_ENCODING = args.encoding
+
+    global MINE_MODEL
+    MINE_MODEL = args.mine
+
+    global EASY_FRACTION
+    EASY_FRACTION = args.keep_easy
+
     if args.combinations:
         show_character_combinations(CHAR_VARS)
         exit()
 
-    if args.installed_fonts:
-        show_installed_fonts(SYSTEM_FONTS)
-        exit()
-
     if args.weights:
         show_character_weights(CHAR_VARS)
         exit()
 
-    if args.reset:
-        reset_ground_truth(GROUND_TRUTH_DIR)
+    # Ground truth is written to a version folder; the ground truth "folder" is
+    # a symlink to the active one.
+    gt_link = get_ground_truth_dir(WRITING_SYSTEM_NAME)
+    adopt_legacy_dir(gt_link)
+
+    if args.list_versions:
+        show_ground_truth_versions(gt_link)
+        exit()
+
+    if args.activate:
+        version_dir = get_versions_dir(gt_link) / args.activate
+        if version_dir not in get_versions(gt_link):
+            print(f"ERROR: No such ground truth version: {args.activate}")
+            exit(1)
+        activate_version(gt_link, version_dir)
+        print(f"INFO: Active ground truth version: {version_dir.name}")
+        exit()
+
+    # Scanning installed fonts is slow, so only do it once it's needed.
+    global SYSTEM_FONTS
+    SYSTEM_FONTS = get_available_fonts()
+
+    if args.installed_fonts:
+        show_installed_fonts(SYSTEM_FONTS)
         exit()
 
     # Ensure training fonts are installed.
     # verify_fonts(CHAR_VARS.get("fonts"), SYSTEM_FONTS)
 
+    if MINE_MODEL:
+        if USE_TEXT2IMAGE:
+            print("ERROR: Mining (-m) only works with the built-in renderer, not -t.")
+            exit(1)
+        model_file = TESSDATA_DIR / f"{MINE_MODEL}.traineddata"
+        if not model_file.is_file():
+            print(f"ERROR: Could not find file: {model_file}")
+            exit(1)
+        if not has_tesserocr():
+            print(TESSEROCR_WARNING)
+        # Pool workers inherit this environment; each one loads the model
+        # once, on its first line, and keeps it for the rest of the run.
+        init_ocr_worker(TESSDATA_DIR)
+
+    prev_version = get_active_version(gt_link)
+    global GROUND_TRUTH_DIR
+    GROUND_TRUTH_DIR = prev_version or gt_link
+    if not SIMULATE and (args.reset or prev_version is None):
+        config = {
+            "character_height": CHARACTER_HEIGHT,
+            "degraded_image_probability": DEGRADED_IMAGE_PROBABILITY,
+            "easy_fraction": EASY_FRACTION if MINE_MODEL else None,
+            "encoding": IMAGE_ENCODING,
+            "font": FORCED_FONT,
+            "line_length": LINE_LENGTH,
+            "mine_model": MINE_MODEL,
+            "use_text2image": USE_TEXT2IMAGE,
+        }
+        GROUND_TRUTH_DIR = create_version(gt_link, config)
+        if VERBOSE:
+            print(f"INFO: New ground truth version: {GROUND_TRUTH_DIR.name}")
+
     procs = multiprocessing.cpu_count()
     with multiprocessing.Pool(processes=procs) as pool:
-        pool.map(run_iteration, range(args.iterations))
+        if USE_TEXT2IMAGE and args.batch_size > 1:
+            iterations = range(args.iterations)
+            batches = [
+                iterations[i : i + args.batch_size]
+                for i in range(0, args.iterations, args.batch_size)
+            ]
+            results = pool.map(run_text2image_batch, batches)
+        else:
+            results = pool.map(run_iteration, range(args.iterations))
+        # Let workers exit on their own (rather than be terminated) so that
+        # they can save their profiling stats.
+        pool.close()
+        pool.join()
+
+    if MINE_MODEL:
+        num_kept = sum(len(r) for r in results)
+        print(f"INFO: Kept {num_kept} of {args.iterations} lines")
+
+    if not SIMULATE:
+        # Keep list.train, list.eval & all-chars.txt up to date as lines are
+        # added, rather than deriving them from the whole dataset when training.
+        with stage("lists"):
+            num_train, num_eval = add_lines(
+                GROUND_TRUTH_DIR, [line for r in results for line in r]
+            )
+        if VERBOSE:
+            print(f"INFO: Added {num_train} training & {num_eval} eval lines to lists")
+
+    if not SIMULATE and GROUND_TRUTH_DIR != prev_version:
+        # Only switch once the new version is complete. The previous version is
+        # kept, since a running training may still be using it.
+        activate_version(gt_link, GROUND_TRUTH_DIR)
+        print(f"INFO: Active ground truth version: {GROUND_TRUTH_DIR.name}")
+        for name in collect_garbage(gt_link, keep=[GROUND_TRUTH_DIR, prev_version]):
+            print(f"INFO: Deleting old ground truth version: {name}")
 
     if SIMULATE:
         # TODO: Is there some way to verify TXT and PNG file contents without saving them to disk?
@@ -0,0 +1,103 @@
+"""train/eval lists & character inventory of ground truth, updated as lines are added"""
+
+# generate-training-data.py adds every line it saves to these files in the
+# ground truth folder, so that the Makefile doesn't need to shuffle all .lstmf
+# files or run unicharset_extractor over all .gt.txt files afterwards:
+#   - list.train, list.eval: .lstmf file names. Each font & style gets its share
+#     of eval lines, and a character cluster already seen in training lines goes
+#     to eval the first time it appears again, so eval covers rare characters.
+#   - all-chars.txt: every character cluster once, as unicharset_extractor input
+#   - .lists-state.json: line counts needed to continue the split next time
+
+import os
+import unicodedata
+
+from cache_utils import load_json
+from cache_utils import save_json
+
+# Same as tesstrain's default RATIO_TRAIN of 0.90.
+EVAL_RATIO = 0.10
+TRAIN_LIST_NAME = "list.train"
+EVAL_LIST_NAME = "list.eval"
+CHARS_FILE_NAME = "all-chars.txt"
+STATE_FILE_NAME = ".lists-state.json"
+ZERO_WIDTH_JOINER = "\u200d"
+
+
+def get_clusters(text):
+    """return text split into base characters with their combining marks"""
+    clusters = []
+    for c in text:
+        if clusters and (
+            unicodedata.category(c).startswith("M")
+            or c == ZERO_WIDTH_JOINER
+            or clusters[-1].endswith(ZERO_WIDTH_JOINER)
+        ):
+            clusters[-1] += c
+        else:
+            clusters.append(c)
+    return clusters
+
+
+def is_eval_line(state, font, style, clusters, eval_ratio=EVAL_RATIO):
+    """return True if the line goes to eval; update state with it"""
+    # {font|style: [lines, eval lines]}
+    stratum = state.setdefault("strata", {}).setdefault(f"{font}|{style}", [0, 0])
+    # {cluster: [train lines, eval lines]}
+    char_counts = state.setdefault("chars", {})
+    to_eval = int((stratum[0] + 1) * eval_ratio) > stratum[1]
+    if not to_eval:
+        for c in clusters:
+            train, evals = char_counts.get(c, [0, 0])
+            if train > 0 and evals == 0:
+                to_eval = True
+                break
+    stratum[0] += 1
+    if to_eval:
+        stratum[1] += 1
+    for c in clusters:
+        char_counts.setdefault(c, [0, 0])[1 if to_eval else 0] += 1
+    return to_eval
+
+
+def get_existing_lines(gt_dir, skip_names):
+    """return [(name, text, font, style)] of .gt.txt files not in skip_names"""
+    lines = []
+    for gt_file in sorted(gt_dir.glob("*.gt.txt")):
+        name = gt_file.name[: -len(".gt.txt")]
+        if name in skip_names:
+            continue
+        # Names are "<time>-<font>-<style>", with spaces replaced by "_".
+        parts = name.split("-", 1)[-1].rsplit("-", 1)
+        font, style = parts if len(parts) == 2 else (parts[0], "")
+        lines.append((name, gt_file.read_text().strip(), font, style))
+    return lines
+
+
+def add_lines(gt_dir, lines, eval_ratio=EVAL_RATIO):
+    """add lines [(name, text, font, style)] to gt_dir's lists & character file"""
+    state_file = gt_dir / STATE_FILE_NAME
+    state = load_json(state_file, {})
+    if not state:
+        # Ground truth made before lists were kept (e.g. an adopted legacy
+        # folder) is added once, so that the lists cover all of it.
+        lines = get_existing_lines(gt_dir, {line[0] for line in lines}) + lines
+    train = []
+    evals = []
+    for name, text, font, style in lines:
+        clusters = {c for c in get_clusters(text) if not c.isspace()}
+        if is_eval_line(state, font, style, clusters, eval_ratio):
+            evals.append(f"{name}.lstmf\n")
+        else:
+            train.append(f"{name}.lstmf\n")
+
+    with (gt_dir / TRAIN_LIST_NAME).open("a") as f:
+        f.writelines(train)
+    with (gt_dir / EVAL_LIST_NAME).open("a") as f:
+        f.writelines(evals)
+    chars_file = gt_dir / CHARS_FILE_NAME
+    tmp_file = chars_file.with_name(f"{chars_file.name}.tmp")
+    tmp_file.write_text("".join(f"{c}\n" for c in sorted(state.get("chars", {}))))
+    os.replace(tmp_file, chars_file)
+    save_json(state_file, state, indent=None)
+    return len(train), len(evals)
@@ -0,0 +1,124 @@
+"""versioned ground-truth folders, switched atomically via a symlink"""
+
+# Generated ground truth is written to its own version folder, e.g.
+#   data/training/Latin_afr-ground-truth.versions/20250101-120000-1a2b3c4d/
+# named by creation time and a hash of the generator's settings, and
+#   data/training/Latin_afr-ground-truth -> Latin_afr-ground-truth.versions/<version>
+# is a symlink to the active version. The symlink is only replaced (atomically,
+# by rename) once a version is complete, so an interrupted run never leaves a
+# half-written dataset in place, and switching datasets is instant. Old versions
+# are renamed out of the way at once and deleted by a background process.
+
+import hashlib
+import json
+import os
+import subprocess
+import time
+
+VERSIONS_SUFFIX = ".versions"
+CONFIG_FILE_NAME = ".config.json"
+TRASH_PREFIX = ".trash-"
+
+
+def get_versions_dir(gt_link):
+    return gt_link.with_name(f"{gt_link.name}{VERSIONS_SUFFIX}")
+
+
+def get_config_hash(config):
+    data = json.dumps(config, sort_keys=True).encode()
+    return hashlib.sha256(data).hexdigest()[:8]
+
+
+def get_versions(gt_link):
+    """return list of version folders, oldest first"""
+    versions_dir = get_versions_dir(gt_link)
+    if not versions_dir.is_dir():
+        return []
+    return sorted(
+        d
+        for d in versions_dir.iterdir()
+        if d.is_dir() and not d.name.startswith(TRASH_PREFIX)
+    )
+
+
+def get_active_version(gt_link):
+    """return the version folder gt_link points to, or None"""
+    if not gt_link.is_symlink() or not gt_link.exists():
+        return None
+    return gt_link.resolve()
+
+
+def get_version_config(version_dir):
+    config_file = version_dir / CONFIG_FILE_NAME
+    if not config_file.is_file():
+        return {}
+    return json.loads(config_file.read_text())
+
+
+def adopt_legacy_dir(gt_link):
+    """move a plain ground-truth folder into the versions folder & activate it"""
+    if gt_link.is_symlink() or not gt_link.is_dir():
+        return None
+    versions_dir = get_versions_dir(gt_link)
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    mtime = time.strftime("%Y%m%d-%H%M%S", time.localtime(gt_link.stat().st_mtime))
+    version_dir = versions_dir / f"{mtime}-legacy"
+    gt_link.rename(version_dir)
+    activate_version(gt_link, version_dir)
+    return version_dir
+
+
+def create_version(gt_link, config):
+    """return a new, empty version folder for ground truth made with config"""
+    versions_dir = get_versions_dir(gt_link)
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{get_config_hash(config)}"
+    version_dir = versions_dir / name
+    n = 1
+    while version_dir.exists():
+        # Several versions started in the same second with the same config.
+        n += 1
+        version_dir = versions_dir / f"{name}-{n}"
+    version_dir.mkdir()
+    (version_dir / CONFIG_FILE_NAME).write_text(
+        json.dumps(config, indent=1, sort_keys=True)
+    )
+    return version_dir
+
+
+def activate_version(gt_link, version_dir):
+    """point gt_link at version_dir; readers see either the old or new version"""
+    target = os.path.relpath(version_dir, gt_link.parent)
+    tmp_link = gt_link.with_name(f".{gt_link.name}.{os.getpid()}.tmp")
+    if tmp_link.is_symlink():
+        tmp_link.unlink()
+    tmp_link.symlink_to(target, target_is_directory=True)
+    os.replace(tmp_link, gt_link)
+
+
+def collect_garbage(gt_link, keep):
+    """delete all versions not in keep in a background process; return their names"""
+    versions_dir = get_versions_dir(gt_link)
+    keep = {d.resolve() for d in keep if d is not None}
+    trash = []
+    for d in get_versions(gt_link):
+        if d.resolve() in keep:
+            continue
+        # Renaming is instant; the slow deletion of many files happens after.
+        trash_dir = versions_dir / f"{TRASH_PREFIX}{d.name}"
+        d.rename(trash_dir)
+        trash.append(trash_dir)
+    # Also finish deletions interrupted in an earlier run.
+    leftovers = [
+        d
+        for d in versions_dir.glob(f"{TRASH_PREFIX}*")
+        if d not in trash and d.is_dir()
+    ]
+    if trash or leftovers:
+        subprocess.Popen(
+            ["rm", "-rf", *[str(d) for d in trash + leftovers]],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    return [d.name[len(TRASH_PREFIX) :] for d in trash]
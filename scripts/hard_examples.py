@@ -0,0 +1,22 @@
+"""find generated training lines that the current model doesn't read correctly"""
+
+# Most generated lines are already read perfectly by the current model, and
+# training on them mostly adds iterations. Each line is OCR'd right after it's
+# generated, in the generator's own pool worker, with an engine that stays loaded
+# for the life of the worker (see ocr_pipeline.ocr_line). Lines with errors are
+# kept; lines without errors are only kept now and then, so that the dataset
+# still shows the model what it already gets right.
+
+import unicodedata
+
+DEFAULT_EASY_FRACTION = 0.1
+
+
+def get_line_errors(truth, text):
+    """return number of character errors (edit distance) in text vs. truth"""
+    from rapidfuzz.distance import Levenshtein  # installed with jiwer
+
+    return Levenshtein.distance(
+        unicodedata.normalize("NFC", truth.strip()),
+        unicodedata.normalize("NFC", text.strip()),
+    )
@@ -0,0 +1,136 @@
+"""align OCR output to ground truth line by line, for per-line CER"""
+
+# Page OCR output rarely has exactly the truth's lines: some are dropped, some
+# are split or merged, some are noise. Lines are aligned with dynamic programming,
+# where pairing a truth line with an OCR line costs their edit distance, and
+# leaving either line unpaired costs its length. Since lines stay in roughly the
+# same order, only pairs near the (scaled) diagonal are considered, so a page
+# needs O(lines x LINE_BAND) edit distances instead of O(lines^2).
+
+import csv
+import math
+import unicodedata
+
+from pathlib import Path
+from rapidfuzz.distance import Levenshtein  # installed with jiwer
+
+# Number of lines on each side of the diagonal that can be paired.
+LINE_BAND = 3
+LINES_CSV_FIELDNAMES = [
+    "timestamp",
+    "iso_lang",
+    "model",
+    "truth-text-file",
+    "line",
+    "truth",
+    "ocr",
+    "errors",
+    "number-truth",
+    "cer",
+]
+
+
+def split_lines(text):
+    """return NFC-normalized, stripped, non-empty lines of text"""
+    lines = [line.strip() for line in unicodedata.normalize("NFC", text).splitlines()]
+    return [line for line in lines if line]
+
+
+def align_lines(truth_lines, ocr_lines, band=LINE_BAND):
+    """return list of (truth line index or None, OCR line index or None, errors)"""
+    m = len(truth_lines)
+    n = len(ocr_lines)
+    inf = float("inf")
+    # cost[i][j]: least errors aligning the first i truth & first j OCR lines
+    cost = [[inf] * (n + 1) for _ in range(m + 1)]
+    step = [[None] * (n + 1) for _ in range(m + 1)]
+    cost[0][0] = 0
+    # The diagonal moves ceil(n / m) OCR lines per truth line; the band must be
+    # at least that wide for neighboring rows to connect (e.g. 3 truth lines vs.
+    # 30 OCR lines of noise).
+    if m:
+        band += math.ceil(n / m)
+    for i in range(m + 1):
+        center = i * n / m if m else 0
+        j_min = max(0, int(center) - band)
+        # The first & last rows are open so that leading & trailing OCR lines
+        # can always be left unpaired.
+        j_max = n if i in (0, m) else min(n, int(center) + band + 1)
+        for j in range(j_min, j_max + 1):
+            if i > 0 and cost[i - 1][j] + len(truth_lines[i - 1]) < cost[i][j]:
+                # Truth line missing from OCR output.
+                cost[i][j] = cost[i - 1][j] + len(truth_lines[i - 1])
+                step[i][j] = (i - 1, j)
+            if j > 0 and cost[i][j - 1] + len(ocr_lines[j - 1]) < cost[i][j]:
+                # OCR line not in truth.
+                cost[i][j] = cost[i][j - 1] + len(ocr_lines[j - 1])
+                step[i][j] = (i, j - 1)
+            if i > 0 and j > 0 and cost[i - 1][j - 1] < inf:
+                d = Levenshtein.distance(truth_lines[i - 1], ocr_lines[j - 1])
+                if cost[i - 1][j - 1] + d < cost[i][j]:
+                    cost[i][j] = cost[i - 1][j - 1] + d
+                    step[i][j] = (i - 1, j - 1)
+
+    alignment = []
+    i, j = m, n
+    while (i, j) != (0, 0):
+        pi, pj = step[i][j]
+        t = i - 1 if pi < i else None
+        o = j - 1 if pj < j else None
+        if t is not None and o is not None:
+            errors = int(cost[i][j] - cost[pi][pj])
+        elif t is not None:
+            errors = len(truth_lines[t])
+        else:
+            errors = len(ocr_lines[o])
+        alignment.append((t, o, errors))
+        i, j = pi, pj
+    alignment.reverse()
+    return alignment
+
+
+def get_line_results(truth_text, ocr_text):
+    """return list of per-line results of aligning ocr_text to truth_text"""
+    truth_lines = split_lines(truth_text)
+    ocr_lines = split_lines(ocr_text)
+    results = []
+    for t, o, errors in align_lines(truth_lines, ocr_lines):
+        truth = truth_lines[t] if t is not None else ""
+        results.append(
+            {
+                "line": t + 1 if t is not None else "",
+                "truth": truth,
+                "ocr": ocr_lines[o] if o is not None else "",
+                "errors": errors,
+                "number-truth": len(truth),
+                "cer": round(errors / len(truth), 4) if truth else "",
+            }
+        )
+    return results
+
+
+def append_line_results(lines_csv, common, line_results):
+    """append line_results, each with common fields (timestamp, etc.), to lines_csv"""
+    new_file = not lines_csv.is_file()
+    with open(lines_csv, "a", newline="") as c:
+        dwriter = csv.DictWriter(c, fieldnames=LINES_CSV_FIELDNAMES)
+        if new_file:
+            dwriter.writeheader()
+        for r in line_results:
+            dwriter.writerow({**common, **r})
+
+
+def load_line_results(lines_csv):
+    if not lines_csv.is_file():
+        return []
+    with open(lines_csv, newline="") as c:
+        return list(csv.DictReader(c))
+
+
+def get_local_path(path_str, eval_dir):
+    """return path_str if it exists, else the same file in eval_dir/<iso_lang>"""
+    path = Path(path_str).expanduser()
+    if path.is_file():
+        return path
+    # data.csv holds absolute paths from whichever computer ran the evaluation.
+    return eval_dir / path.parent.name / path.name
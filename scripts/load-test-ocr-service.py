@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+# Send concurrent OCR requests to a running ocr_service.py and report throughput,
+# latency percentiles and the number of requests rejected by backpressure (503).
+# Images default to the evaluation images in data/evaluation.
+
+import argparse
+import base64
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+
+from concurrent.futures import ThreadPoolExecutor
+from ocr_service import DEFAULT_HOST
+from ocr_service import DEFAULT_PORT
+from pathlib import Path
+from urllib.parse import urlencode
+
+EVAL_DIR = Path(__file__).resolve().parents[1] / "data" / "evaluation"
+
+
+def get_percentile(values, pct):
+    values = sorted(values)
+    i = min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)
+    return values[i]
+
+
+def send_request(base_url, images, options):
+    """return (HTTP status, seconds) of one /ocr or /batch request"""
+    if len(images) == 1:
+        query = urlencode({k: v for k, v in options.items() if v})
+        req = urllib.request.Request(f"{base_url}/ocr?{query}", data=images[0])
+    else:
+        data = {"images": [base64.b64encode(i).decode() for i in images]}
+        data.update({k: v for k, v in options.items() if v})
+        req = urllib.request.Request(
+            f"{base_url}/batch",
+            data=json.dumps(data).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+    t_start = time.monotonic()
+    try:
+        with urllib.request.urlopen(req) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except urllib.error.URLError as e:
+        # e.g. service not running
+        print(f"Error: {e.reason}")
+        status = None
+    return status, time.monotonic() - t_start
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Load-test a running ocr_service.py on local images."
+    )
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        default=1,
+        help="images per request; >1 uses the /batch endpoint [1]",
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=4,
+        help="number of requests in flight at once [4]",
+    )
+    parser.add_argument(
+        "-n",
+        "--requests",
+        type=int,
+        default=50,
+        help="total number of requests to send [50]",
+    )
+    parser.add_argument(
+        "-p",
+        "--preprocess",
+        type=str,
+        help="preprocessing steps to request, e.g. 'sauvola,deskew'",
+    )
+    parser.add_argument(
+        "-u",
+        "--url",
+        type=str,
+        default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}",
+        help=f"service URL [http://{DEFAULT_HOST}:{DEFAULT_PORT}]",
+    )
+    parser.add_argument(
+        "-w",
+        "--whitelist",
+        type=str,
+        metavar="ISO_LANG",
+        help="character profile to request",
+    )
+    parser.add_argument(
+        "image_file",
+        nargs="*",
+        help="images to send, cycled through in order [data/evaluation/*/*.png]",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    image_files = [Path(f) for f in args.image_file]
+    if not image_files:
+        image_files = sorted(EVAL_DIR.glob("*/*.png"))
+    if not image_files:
+        print("Error: No images found.")
+        exit(1)
+    images = [f.read_bytes() for f in image_files]
+    batches = [
+        [
+            images[(i * args.batch_size + j) % len(images)]
+            for j in range(args.batch_size)
+        ]
+        for i in range(args.requests)
+    ]
+    options = {"preprocess": args.preprocess, "whitelist": args.whitelist}
+
+    t_start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(
+            executor.map(lambda b: send_request(args.url, b, options), batches)
+        )
+    seconds = time.monotonic() - t_start
+
+    ok = [s for status, s in results if status == 200]
+    rejected = len([r for r in results if r[0] == 503])
+    failed = len(results) - len(ok) - rejected
+    print(
+        f"{len(results)} requests ({args.batch_size} image(s) each, {args.concurrency} concurrent) in {seconds:.1f}s"
+    )
+    print(f"  OK: {len(ok)}; rejected (503): {rejected}; failed: {failed}")
+    if ok:
+        print(f"  images/sec: {len(ok) * args.batch_size / seconds:.2f}")
+        print(
+            f"  latency (s): mean {statistics.mean(ok):.3f}, p50 {get_percentile(ok, 50):.3f}, "
+            f"p95 {get_percentile(ok, 95):.3f}, p99 {get_percentile(ok, 99):.3f}, max {max(ok):.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+# OCR the pages of PDF documents in parallel and output their text in page order.
+# Pages are separated by form feed characters, like tesseract's default output.
+# With "-c MODEL", each page is read with the "-l" model first, and only the lines
+# it isn't confident about are read again with MODEL (see cascade.py).
+
+import argparse
+import sys
+import time
+
+from cascade import DEFAULT_MIN_CONFIDENCE
+from cascade import DEFAULT_RERUN_SCALE
+from char_profiles import get_profile
+from char_profiles import get_profile_config
+from ocr_pipeline import DEFAULT_MODEL
+from ocr_pipeline import ocr_pdf
+from ocr_pipeline import parse_page_ranges
+from pathlib import Path
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="OCR PDF pages in parallel and output text in page order."
+    )
+    parser.add_argument(
+        "-c",
+        "--cascade",
+        type=str,
+        metavar="MODEL",
+        help="read lines with confidence below -m again with this (slower) model, e.g. '-l Latin -c Latin_afr'",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of pages to OCR at once [# of CPUs]",
+    )
+    parser.add_argument(
+        "-l",
+        "--model",
+        type=str,
+        default=DEFAULT_MODEL,
+        help=f"name of tesseract model to use [{DEFAULT_MODEL}]",
+    )
+    parser.add_argument(
+        "-m",
+        "--min-confidence",
+        type=float,
+        default=DEFAULT_MIN_CONFIDENCE,
+        help=f"with -c, mean word confidence (0-100) below which a line is read again [{DEFAULT_MIN_CONFIDENCE}]",
+    )
+    parser.add_argument(
+        "-o",
+        "--outfile",
+        type=str,
+        help="write text to this file instead of stdout",
+    )
+    parser.add_argument(
+        "-p",
+        "--pages",
+        type=str,
+        help="pages to OCR, e.g. '1-3,7' [all]",
+    )
+    parser.add_argument(
+        "-r",
+        "--dpi",
+        type=int,
+        help="render pages at this DPI [estimated from text size for 48px characters]",
+    )
+    parser.add_argument(
+        "-s",
+        "--rerun-scale",
+        type=float,
+        default=DEFAULT_RERUN_SCALE,
+        help=f"with -c, scale lines that are read again by this factor, like a higher DPI [{DEFAULT_RERUN_SCALE}]",
+    )
+    parser.add_argument(
+        "-w",
+        "--whitelist",
+        type=str,
+        metavar="ISO_LANG",
+        help="restrict OCR to the characters of ISO_LANG's profile (see char_profiles.py)",
+    )
+    parser.add_argument("pdf_file", help="PDF document to OCR")
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    pdf_file = Path(args.pdf_file).expanduser().resolve()
+    if not pdf_file.is_file():
+        print(f"Error: Could not find file: {args.pdf_file}")
+        exit(1)
+    pages = parse_page_ranges(args.pages) if args.pages else None
+    config = ""
+    if args.whitelist:
+        profile = get_profile(args.whitelist)
+        if profile is None:
+            print(f"Error: No character profile for {args.whitelist}")
+            exit(1)
+        config = get_profile_config(profile)
+    cascade = None
+    if args.cascade:
+        cascade = (args.cascade, args.min_confidence, args.rerun_scale)
+
+    out = sys.stdout
+    if args.outfile:
+        out = open(args.outfile, "w")
+    t_start = time.monotonic()
+    num_pages = 0
+    try:
+        for n, text in ocr_pdf(
+            pdf_file,
+            model=args.model,
+            pages=pages,
+            dpi=args.dpi,
+            jobs=args.jobs,
+            config=config,
+            cascade=cascade,
+        ):
+            if num_pages:
+                out.write("\f")
+            out.write(text)
+            out.flush()
+            num_pages += 1
+    finally:
+        if args.outfile:
+            out.close()
+    seconds = time.monotonic() - t_start
+    print(
+        f"INFO: OCR'd {num_pages} pages in {seconds:.1f}s ({num_pages / seconds:.2f} pages/sec)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+# OCR every image in a directory tree, running several tesseract processes (or
+# requests to ocr_service.py) at once. Text is written to "<stem>.<model>.txt",
+# either next to each image or at the same relative path in an output folder.
+# Outputs are written atomically, so an interrupted run can simply be run again:
+# images whose output is newer than the image are skipped.
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+import urllib.request
+
+from char_profiles import get_profile
+from ocr_pipeline import DEFAULT_MODEL
+from ocr_pipeline import TESSDATA_DIR
+from pathlib import Path
+from urllib.parse import urlencode
+
+IMAGE_EXTS = {".jpeg", ".jpg", ".png", ".tif", ".tiff"}
+
+
+def find_images(in_dir):
+    return sorted(
+        f for f in in_dir.glob("**/*") if f.suffix.lower() in IMAGE_EXTS and f.is_file()
+    )
+
+
+def get_outfile_path(image_file, model, in_dir, out_dir=None):
+    name = f"{image_file.stem}.{model}.txt"
+    if out_dir is None:
+        return image_file.with_name(name)
+    return out_dir / image_file.relative_to(in_dir).with_name(name)
+
+
+def is_done(image_file, outfile):
+    return outfile.is_file() and outfile.stat().st_mtime >= image_file.stat().st_mtime
+
+
+def write_text_atomic(outfile, text):
+    outfile.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = outfile.with_name(f"{outfile.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(text)
+    os.replace(tmp_file, outfile)
+
+
+async def ocr_with_tesseract(image_file, model, profile=None):
+    cmd = ["tesseract", str(image_file), "stdout", "-l", model]
+    cmd.extend(["-c", "page_separator="])
+    if profile:
+        cmd.append(str(profile))
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(stderr.decode().strip())
+    return stdout.decode()
+
+
+def post_to_service(url, image_file, model, whitelist=None):
+    query = urlencode(
+        {k: v for k, v in {"model": model, "whitelist": whitelist}.items() if v}
+    )
+    req = urllib.request.Request(f"{url}/ocr?{query}", data=image_file.read_bytes())
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read()).get("text")
+
+
+async def ocr_with_service(url, image_file, model, whitelist=None):
+    # urllib blocks, so each request waits in its own thread.
+    return await asyncio.to_thread(post_to_service, url, image_file, model, whitelist)
+
+
+async def ocr_tree(
+    images, outfiles, model, jobs, profile=None, service=None, whitelist=None
+):
+    """OCR images into outfiles; return list of (image, seconds or error)"""
+    limit = asyncio.Semaphore(jobs)
+    results = []
+
+    async def ocr_one(image_file, outfile):
+        async with limit:
+            t_start = time.monotonic()
+            try:
+                if service:
+                    text = await ocr_with_service(service, image_file, model, whitelist)
+                else:
+                    text = await ocr_with_tesseract(image_file, model, profile)
+            except Exception as e:
+                print(f"Error: {image_file}: {e}", file=sys.stderr)
+                results.append((image_file, e))
+                return
+            write_text_atomic(outfile, text)
+            seconds = time.monotonic() - t_start
+            results.append((image_file, seconds))
+            print(f"{seconds:6.2f}s  {outfile}")
+
+    await asyncio.gather(*(ocr_one(i, o) for i, o in zip(images, outfiles)))
+    return results
+
+
+def get_percentile(values, pct):
+    values = sorted(values)
+    return values[min(int(round(pct / 100 * (len(values) - 1))), len(values) - 1)]
+
+
+def show_report(results, num_skipped, seconds):
+    times = [r for _, r in results if isinstance(r, float)]
+    num_failed = len(results) - len(times)
+    print(
+        f"OCR'd {len(times)} pages in {seconds:.1f}s; skipped {num_skipped} done; {num_failed} failed",
+        file=sys.stderr,
+    )
+    if times:
+        print(
+            f"  pages/sec: {len(times) / seconds:.2f}\n"
+            f"  latency (s): mean {statistics.mean(times):.2f}, p50 {get_percentile(times, 50):.2f}, "
+            f"p95 {get_percentile(times, 95):.2f}, p99 {get_percentile(times, 99):.2f}, max {max(times):.2f}",
+            file=sys.stderr,
+        )
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="OCR all images in a directory tree with several OCR processes at once."
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="OCR images again even if their output is up to date",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of images to OCR at once [# of CPUs]",
+    )
+    parser.add_argument(
+        "-l",
+        "--model",
+        type=str,
+        default=DEFAULT_MODEL,
+        help=f"name of tesseract model to use [{DEFAULT_MODEL}]",
+    )
+    parser.add_argument(
+        "-o",
+        "--outdir",
+        type=str,
+        help="write text files to this folder, mirroring the input tree [next to images]",
+    )
+    parser.add_argument(
+        "-s",
+        "--service",
+        type=str,
+        metavar="URL",
+        help="send images to a running ocr_service.py, e.g. http://127.0.0.1:8765",
+    )
+    parser.add_argument(
+        "-w",
+        "--whitelist",
+        type=str,
+        metavar="ISO_LANG",
+        help="restrict OCR to the characters of ISO_LANG's profile (see char_profiles.py)",
+    )
+    parser.add_argument("in_dir", help="folder to search for images")
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    in_dir = Path(args.in_dir).expanduser().resolve()
+    if not in_dir.is_dir():
+        print(f"Error: Folder does not exist: {args.in_dir}")
+        exit(1)
+    out_dir = Path(args.outdir).expanduser().resolve() if args.outdir else None
+    profile = None
+    if args.whitelist:
+        profile = get_profile(args.whitelist)
+        if profile is None:
+            print(f"Error: No character profile for {args.whitelist}")
+            exit(1)
+    os.environ["TESSDATA_PREFIX"] = str(TESSDATA_DIR)
+    # Parallelism comes from running several processes; keep each single-threaded.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+    images = []
+    outfiles = []
+    num_skipped = 0
+    for image_file in find_images(in_dir):
+        outfile = get_outfile_path(image_file, args.model, in_dir, out_dir)
+        if not args.force and is_done(image_file, outfile):
+            num_skipped += 1
+            continue
+        images.append(image_file)
+        outfiles.append(outfile)
+
+    jobs = args.jobs or multiprocessing.cpu_count()
+    t_start = time.monotonic()
+    results = asyncio.run(
+        ocr_tree(
+            images,
+            outfiles,
+            args.model,
+            jobs,
+            profile=profile,
+            service=args.service,
+            whitelist=args.whitelist,
+        )
+    )
+    show_report(results, num_skipped, time.monotonic() - t_start)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
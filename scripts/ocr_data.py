@@ -0,0 +1,115 @@
+"""tesseract text & word data (boxes, confidences) from a single run, stored per page"""
+
+# Each run writes both the text and the TSV output of tesseract. The TSV's word
+# rows are kept next to the text file, "<stem>.<label>.txt", as
+# "<stem>.<label>.words.npz": one compressed numpy array per column, so that
+# e.g. all confidences of a page load at once without parsing text. Word data
+# has the same columns as pytesseract's image_to_data(output_type=DICT), so
+# it can be used wherever that is (e.g. by cascade.py) without running OCR again.
+
+import csv
+import io
+import shlex
+import subprocess
+import tempfile
+
+from pathlib import Path
+
+WORD_DATA_SUFFIX = ".words.npz"
+# Tesseract TSV level of word rows.
+WORD_LEVEL = 5
+INT_COLUMNS = [
+    "level",
+    "page_num",
+    "block_num",
+    "par_num",
+    "line_num",
+    "word_num",
+    "left",
+    "top",
+    "width",
+    "height",
+]
+
+
+def run_tesseract(image, model, config=""):
+    """return (text, TSV) of image (file path or PIL image) from one tesseract run"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        image_file = image
+        if not isinstance(image, (str, Path)):
+            image_file = Path(tmp_dir) / "page.png"
+            image.save(image_file)
+        out_base = Path(tmp_dir) / "out"
+        cmd = ["tesseract", str(image_file), str(out_base), "-l", model]
+        cmd.extend(["-c", "tessedit_create_txt=1", "-c", "tessedit_create_tsv=1"])
+        cmd.extend(["-c", "page_separator="])
+        cmd.extend(shlex.split(config))
+        proc = subprocess.run(cmd, capture_output=True)
+        if proc.returncode != 0:
+            raise RuntimeError(proc.stderr.decode().strip())
+        return (
+            Path(f"{out_base}.txt").read_text(),
+            Path(f"{out_base}.tsv").read_text(),
+        )
+
+
+def ocr_image_data_bytes(image_bytes, model, config=""):
+    """return (text, word data, (width, height)) of image_bytes; runs in a worker process"""
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        text, tsv = run_tesseract(img, model, config)
+        return text, parse_tsv(tsv), img.size
+
+
+def parse_tsv(tsv):
+    """return {column: list} of the word rows of tesseract TSV output"""
+    reader = csv.DictReader(io.StringIO(tsv), delimiter="\t", quoting=csv.QUOTE_NONE)
+    data = {k: [] for k in [*INT_COLUMNS, "conf", "text"]}
+    for r in reader:
+        if int(r.get("level")) != WORD_LEVEL:
+            continue
+        for k in INT_COLUMNS:
+            data.get(k).append(int(r.get(k)))
+        data.get("conf").append(float(r.get("conf")))
+        data.get("text").append(r.get("text") or "")
+    return data
+
+
+def get_word_data_file(text_file):
+    """return path of the word data stored with text_file"""
+    return text_file.with_name(
+        f"{text_file.name.removesuffix('.txt')}{WORD_DATA_SUFFIX}"
+    )
+
+
+def save_word_data(word_data_file, data):
+    import numpy as np
+
+    columns = {k: np.array(data.get(k), dtype=np.int32) for k in INT_COLUMNS}
+    columns["conf"] = np.array(data.get("conf"), dtype=np.float32)
+    columns["text"] = np.array(data.get("text"), dtype=str)
+    # np.savez adds ".npz" unless the name already ends with it.
+    tmp_file = word_data_file.with_name(f"{word_data_file.stem}.tmp.npz")
+    np.savez_compressed(tmp_file, **columns)
+    tmp_file.replace(word_data_file)
+
+
+def load_word_data(word_data_file):
+    """return {column: list} of word data, or None if there is none"""
+    import numpy as np
+
+    if not word_data_file.is_file():
+        return None
+    with np.load(word_data_file, allow_pickle=False) as columns:
+        return {k: columns[k].tolist() for k in columns.files}
+
+
+def get_mean_confidence(data):
+    """return mean confidence of the recognized words in data, or None"""
+    confs = [
+        c for c, t in zip(data.get("conf"), data.get("text")) if c >= 0 and t.strip()
+    ]
+    if not confs:
+        return None
+    return sum(confs) / len(confs)
@@ -0,0 +1,170 @@
+"""stream pages from PDF files through a pool of tesseract OCR workers"""
+
+# Pages are rendered one at a time with PyMuPDF and passed to the workers as PNG
+# bytes. Only a limited number of pages are in flight at once, and results are
+# yielded in page order, so memory use stays flat even for whole books.
+
+import importlib.util
+import io
+import multiprocessing
+import os
+import statistics
+
+from char_profiles import get_profile_config
+from collections import deque
+from pathlib import Path
+
+DEFAULT_MODEL = "Latin_afr"
+# Generated training images render 12 pt text at 48 px character height (see
+# generate-training-data.py); pages are rendered to match.
+CHARACTER_HEIGHT = 48
+DEFAULT_FONT_SIZE = 12  # pts; used if a page has no text layer to measure
+MAX_PAGES_PER_WORKER = 2  # pages waiting or being OCR'd per worker process
+# Tesseract page segmentation mode for a single line of text.
+LINE_PSM = 7
+TESSDATA_DIR = Path(__file__).resolve().parents[1] / "tessdata"
+TESSEROCR_WARNING = (
+    "WARNING: tesserocr isn't installed, so each image starts its own tesseract"
+    " process; install it with: pip install -r requirements.txt"
+)
+
+
+def get_render_dpi(font_size=DEFAULT_FONT_SIZE, char_height=CHARACTER_HEIGHT):
+    # font_size pt / 72 pt/in x D dpi = char_height px
+    return int(round(char_height / (font_size / 72)))
+
+
+def estimate_font_size(page):
+    """return median font size (pts) of page's text layer, or None if it has none"""
+    sizes = []
+    for block in page.get_text("dict").get("blocks"):
+        for line in block.get("lines", []):
+            sizes.extend(s.get("size") for s in line.get("spans") if s.get("text"))
+    if not sizes:
+        return None
+    return statistics.median(sizes)
+
+
+def iter_pdf_page_images(pdf_file, pages=None, dpi=None):
+    """yield (page number, PNG bytes) for pages (1-based) of pdf_file, one at a time"""
+    import fitz  # PyMuPDF: https://pymupdf.readthedocs.io/en/latest/
+
+    with fitz.open(pdf_file) as doc:
+        page_nums = pages if pages else range(1, doc.page_count + 1)
+        for n in page_nums:
+            page = doc[n - 1]
+            page_dpi = dpi
+            if page_dpi is None:
+                page_dpi = get_render_dpi(estimate_font_size(page) or DEFAULT_FONT_SIZE)
+            pix = page.get_pixmap(dpi=page_dpi, colorspace=fitz.csGRAY)
+            yield n, pix.tobytes("png")
+
+
+def init_ocr_worker(tessdata_dir):
+    os.environ["TESSDATA_PREFIX"] = str(tessdata_dir)
+    # Parallelism comes from the worker processes; keep tesseract single-threaded.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def has_tesserocr():
+    """return whether tesserocr is installed, i.e. engines can stay loaded"""
+    return importlib.util.find_spec("tesserocr") is not None
+
+
+def ocr_image_bytes(image_bytes, model=DEFAULT_MODEL, config=""):
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        return pytesseract.image_to_string(
+            img, lang=model, config=f"-c page_separator='' {config}".strip()
+        )
+
+
+def ocr_line(img, model=DEFAULT_MODEL, profile=None):
+    """return text of line image img; uses the worker's warm engine if there is one"""
+    from ocr_service import get_engine
+
+    engine = get_engine(model, profile, LINE_PSM)
+    if engine is not None:
+        engine.SetImage(img)
+        return engine.GetUTF8Text()
+    import pytesseract
+
+    config = f"--psm {LINE_PSM} -c page_separator=''"
+    if profile:
+        config = f"{config} {get_profile_config(profile)}"
+    return pytesseract.image_to_string(img, lang=model, config=config)
+
+
+def ocr_page_images(
+    page_images,
+    model=DEFAULT_MODEL,
+    jobs=None,
+    config="",
+    tessdata_dir=TESSDATA_DIR,
+    cascade=None,
+    with_data=False,
+):
+    """yield (page number, text) in order for (page number, image bytes) items
+
+    If cascade is (slow model, min. confidence, rerun scale), pages are read
+    with model first, and lines it isn't confident about are read again with
+    the slow model (see cascade.py); config is then a tesseract config file.
+    If with_data, (text, word data, image size) is yielded instead of text (see
+    ocr_data.py).
+    """
+    ocr_func = ocr_image_bytes
+    ocr_args = (model, config)
+    if cascade:
+        from cascade import ocr_cascade_bytes
+
+        ocr_func = ocr_cascade_bytes
+        ocr_args = (model, *cascade, config or None)
+    elif with_data:
+        from ocr_data import ocr_image_data_bytes
+
+        ocr_func = ocr_image_data_bytes
+    jobs = jobs or multiprocessing.cpu_count()
+    max_pending = jobs * MAX_PAGES_PER_WORKER
+    pending = deque()
+    with multiprocessing.Pool(
+        processes=jobs, initializer=init_ocr_worker, initargs=(tessdata_dir,)
+    ) as pool:
+        for n, image_bytes in page_images:
+            pending.append((n, pool.apply_async(ocr_func, (image_bytes, *ocr_args))))
+            # Wait for the oldest page before rendering more pages.
+            while len(pending) >= max_pending:
+                n0, result = pending.popleft()
+                yield n0, result.get()
+        while pending:
+            n0, result = pending.popleft()
+            yield n0, result.get()
+
+
+def ocr_pdf(
+    pdf_file,
+    model=DEFAULT_MODEL,
+    pages=None,
+    dpi=None,
+    jobs=None,
+    config="",
+    cascade=None,
+):
+    """yield (page number, text) in page order for pages of pdf_file"""
+    yield from ocr_page_images(
+        iter_pdf_page_images(pdf_file, pages=pages, dpi=dpi),
+        model=model,
+        jobs=jobs,
+        config=config,
+        cascade=cascade,
+    )
+
+
+def parse_page_ranges(text):
+    """return sorted list of page numbers from e.g. '1-3,7'"""
+    pages = set()
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        pages.update(range(int(first), int(last or first) + 1))
+    return sorted(pages)
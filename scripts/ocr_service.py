@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+
+"""local HTTP service that OCRs images with a pool of warm tesseract engines"""
+
+# Endpoints (JSON responses):
+#   POST /ocr    body: image bytes; query: model, preprocess, whitelist
+#   POST /batch  body: {"images": [base64, ...], "model": ..., "preprocess": ...,
+#                "whitelist": ...}
+#   GET  /health pool size, queue usage and whether engines stay warm
+# e.g.
+#   $ curl --data-binary @page.png "http://127.0.0.1:8765/ocr?whitelist=liy_banda-linda"
+#   {"text": "...", "seconds": {"queue": 0.001, "ocr": 0.84, "total": 0.85}}
+#
+# Each worker process keeps one engine per (model, whitelist) loaded for its
+# lifetime with tesserocr (see requirements.txt). Without it, the service warns
+# at startup and falls back to pytesseract, which still avoids Python startup
+# but runs tesseract once per image. The whitelist must be the name of an
+# iso_lang folder in data/evaluation (see char_profiles.py). At most
+# MAX_QUEUE_PER_WORKER images per worker are accepted at once; requests beyond
+# that get "503 Service Unavailable" with a Retry-After header.
+
+import argparse
+import base64
+import io
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+from char_profiles import get_profile
+from char_profiles import get_profile_config
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from ocr_pipeline import DEFAULT_MODEL
+from ocr_pipeline import TESSDATA_DIR
+from ocr_pipeline import TESSEROCR_WARNING
+from ocr_pipeline import has_tesserocr
+from ocr_pipeline import init_ocr_worker
+from preprocess import parse_steps
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+DEFAULT_HOST = "127.0.0.1"  # local only
+DEFAULT_PORT = 8765
+MAX_QUEUE_PER_WORKER = 4  # images waiting or being OCR'd per worker process
+RETRY_AFTER = 1  # seconds
+
+# Per-worker-process engines: {(model, profile, psm): tesserocr.PyTessBaseAPI}
+ENGINES = {}
+
+
+def init_engine_worker(tessdata_dir, model):
+    init_ocr_worker(tessdata_dir)
+    # Load the default model now so the first request doesn't pay for it.
+    get_engine(model, None)
+
+
+def get_engine(model, profile, psm=None):
+    """return warm tesserocr engine for (model, profile, psm), or None if unavailable"""
+    key = (model, profile, psm)
+    if key not in ENGINES:
+        try:
+            import tesserocr
+        except ImportError:
+            return None
+        configs = [profile] if profile else []
+        options = {"psm": psm} if psm is not None else {}
+        ENGINES[key] = tesserocr.PyTessBaseAPI(
+            path=os.environ.get("TESSDATA_PREFIX"),
+            lang=model,
+            configs=configs,
+            **options,
+        )
+    return ENGINES.get(key)
+
+
+def ocr_image(image_bytes, model, steps, profile):
+    """return (text, seconds) for image_bytes; runs in a worker process"""
+    from PIL import Image
+
+    img = Image.open(io.BytesIO(image_bytes))
+    if steps:
+        from preprocess import preprocess_image
+
+        img = preprocess_image(img, steps)
+    t_start = time.monotonic()
+    engine = get_engine(model, profile)
+    if engine is not None:
+        engine.SetImage(img)
+        text = engine.GetUTF8Text()
+    else:
+        import pytesseract
+
+        config = "-c page_separator=''"
+        if profile:
+            config = f"{config} {get_profile_config(profile)}"
+        text = pytesseract.image_to_string(img, lang=model, config=config)
+    return text, time.monotonic() - t_start
+
+
+class OcrService:
+    """worker pool plus the bookkeeping needed for backpressure"""
+
+    def __init__(self, model=DEFAULT_MODEL, jobs=None, tessdata_dir=TESSDATA_DIR):
+        self.model = model
+        self.jobs = jobs or multiprocessing.cpu_count()
+        self.max_queue = self.jobs * MAX_QUEUE_PER_WORKER
+        self.queued = 0
+        self.lock = threading.Lock()
+        self.pool = multiprocessing.Pool(
+            processes=self.jobs,
+            initializer=init_engine_worker,
+            initargs=(tessdata_dir, model),
+        )
+
+    def reserve(self, n):
+        """reserve queue slots for n images; return False if the queue is full"""
+        with self.lock:
+            if self.queued + n > self.max_queue and self.queued > 0:
+                return False
+            self.queued += n
+            return True
+
+    def release(self, n):
+        with self.lock:
+            self.queued -= n
+
+    def ocr(self, images, model=None, preprocess=None, whitelist=None):
+        """return list of {text, seconds} for images; caller reserves slots"""
+        steps = parse_steps(preprocess) if preprocess else []
+        profile = None
+        if whitelist:
+            profile = get_profile(whitelist)
+            if profile is None:
+                raise ValueError(f"No character profile for {whitelist}")
+            profile = str(profile)
+        t_start = time.monotonic()
+        results = [
+            self.pool.apply_async(
+                ocr_image, (image_bytes, model or self.model, steps, profile)
+            )
+            for image_bytes in images
+        ]
+        output = []
+        for r in results:
+            text, ocr_seconds = r.get()
+            total = time.monotonic() - t_start
+            output.append(
+                {
+                    "text": text,
+                    "seconds": {
+                        "queue": round(max(total - ocr_seconds, 0), 3),
+                        "ocr": round(ocr_seconds, 3),
+                        "total": round(total, 3),
+                    },
+                }
+            )
+        return output
+
+    def get_status(self):
+        return {
+            "model": self.model,
+            "jobs": self.jobs,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "warm_engines": has_tesserocr(),
+        }
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
+
+
+class OcrRequestHandler(BaseHTTPRequestHandler):
+    # Set on the handler class by serve().
+    service = None
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path != "/health":
+            self.send_json(404, {"error": "Not found"})
+            return
+        self.send_json(200, self.service.get_status())
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if url.path == "/ocr":
+            options = {k: v[0] for k, v in parse_qs(url.query).items()}
+            images = [body]
+        elif url.path == "/batch":
+            try:
+                options = json.loads(body)
+                if not isinstance(options, dict):
+                    raise TypeError("body must be a JSON object")
+                images = [base64.b64decode(i) for i in options.pop("images")]
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json(400, {"error": f"Invalid batch request: {e}"})
+                return
+        else:
+            self.send_json(404, {"error": "Not found"})
+            return
+        if not images or not all(images):
+            self.send_json(400, {"error": "No images given"})
+            return
+
+        if not self.service.reserve(len(images)):
+            self.send_json(
+                503,
+                {"error": "Queue is full", **self.service.get_status()},
+                headers={"Retry-After": str(RETRY_AFTER)},
+            )
+            return
+        try:
+            results = self.service.ocr(
+                images,
+                model=options.get("model"),
+                preprocess=options.get("preprocess"),
+                whitelist=options.get("whitelist"),
+            )
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            # e.g. unreadable image or unknown model reported by tesseract
+            self.send_json(500, {"error": str(e)})
+            return
+        finally:
+            self.service.release(len(images))
+
+        if url.path == "/ocr":
+            self.send_json(200, results[0])
+        else:
+            self.send_json(200, {"results": results})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def serve(
+    host=DEFAULT_HOST, port=DEFAULT_PORT, model=DEFAULT_MODEL, jobs=None, verbose=False
+):
+    if not has_tesserocr():
+        print(TESSEROCR_WARNING, file=sys.stderr)
+    service = OcrService(model=model, jobs=jobs)
+    OcrRequestHandler.service = service
+    server = ThreadingHTTPServer((host, port), OcrRequestHandler)
+    server.verbose = verbose
+    print(
+        f"Serving {model} OCR with {service.jobs} workers at http://{host}:{port}/ (Ctrl+C to stop)"
+    )
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        service.close()
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Serve OCR over local HTTP with a pool of warm tesseract engines."
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of OCR worker processes [# of CPUs]",
+    )
+    parser.add_argument(
+        "-l",
+        "--model",
+        type=str,
+        default=DEFAULT_MODEL,
+        help=f"default tesseract model [{DEFAULT_MODEL}]",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        type=int,
+        default=DEFAULT_PORT,
+        help=f"port to listen on [{DEFAULT_PORT}]",
+    )
+    parser.add_argument(
+        "-H",
+        "--host",
+        type=str,
+        default=DEFAULT_HOST,
+        help=f"address to listen on [{DEFAULT_HOST}]",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="log each request",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    if not (TESSDATA_DIR / f"{args.model}.traineddata").is_file():
+        print(f"Error: Could not find model: {args.model}")
+        exit(1)
+    serve(args.host, args.port, args.model, args.jobs, args.verbose)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        pass
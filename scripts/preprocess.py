@@ -0,0 +1,205 @@
+"""image preprocessing steps applied before OCR, with outputs cached on disk"""
+
+# Steps are chosen by name, e.g. "sauvola,deskew,despeckle", and applied in the
+# given order to a grayscale version of the image. Preprocessed images are cached
+# by (image hash, steps, PIPELINE_VERSION) so that evaluating the same image with
+# many models only preprocesses it once.
+
+import hashlib
+import os
+
+import numpy as np
+
+from cache_utils import get_file_hash
+from pathlib import Path
+from PIL import Image
+
+# Increment when a step's implementation or defaults change to invalidate cache.
+PIPELINE_VERSION = 1
+DEFAULT_CACHE_DIR = Path(__file__).resolve().parents[1] / "data" / "preprocessed"
+SAUVOLA_WINDOW = 25  # px
+SAUVOLA_K = 0.2
+SAUVOLA_R = 128
+DESKEW_MAX_ANGLE = 5.0  # degrees
+DESKEW_STEP = 0.25  # degrees
+# Largest speck (px) removed; kept well below the size of diacritic dots at the
+# 48 px character height used in training.
+SPECK_SIZE = 2
+
+
+def get_integral_image(a):
+    """return summed-area table of a with a zero row & column prepended"""
+    ii = np.zeros((a.shape[0] + 1, a.shape[1] + 1), dtype=np.float64)
+    ii[1:, 1:] = a.cumsum(axis=0).cumsum(axis=1)
+    return ii
+
+
+def get_box_sums(a, height, width):
+    """return sums of a over every height x width window (top-left aligned)"""
+    ii = get_integral_image(a)
+    return (
+        ii[height:, width:]
+        - ii[:-height, width:]
+        - ii[height:, :-width]
+        + ii[:-height, :-width]
+    )
+
+
+def get_centered_box_means(a, size):
+    # Pad with edge values so every pixel has a full window centered on it.
+    r = size // 2
+    padded = np.pad(a.astype(np.float64), r, mode="edge")
+    return get_box_sums(padded, size, size) / (size * size)
+
+
+def binarize_otsu(gray):
+    """return boolean array of dark pixels using Otsu's global threshold"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    levels = np.arange(256)
+    w0 = hist.cumsum()
+    w1 = w0[-1] - w0
+    m0 = (hist * levels).cumsum()
+    mean0 = np.divide(m0, w0, out=np.zeros(256), where=w0 > 0)
+    mean1 = np.divide(m0[-1] - m0, w1, out=np.zeros(256), where=w1 > 0)
+    between_var = w0 * w1 * (mean0 - mean1) ** 2
+    return gray <= np.argmax(between_var)
+
+
+def binarize_sauvola(gray, window=SAUVOLA_WINDOW, k=SAUVOLA_K, r=SAUVOLA_R):
+    """return boolean array of dark pixels using Sauvola's local thresholds"""
+    # Ref: https://doi.org/10.1016/S0031-3203(99)00055-2
+    mean = get_centered_box_means(gray, window)
+    mean_sq = get_centered_box_means(gray.astype(np.float64) ** 2, window)
+    std = np.sqrt(np.maximum(mean_sq - mean**2, 0))
+    return gray <= mean * (1 + k * (std / r - 1))
+
+
+def get_skew_angle(dark, max_angle=DESKEW_MAX_ANGLE, step=DESKEW_STEP):
+    """return angle (degrees) that best aligns text lines with the x-axis"""
+    # Projection profile method: shear the dark pixels' coordinates by each
+    # candidate angle; the correct angle gives the sharpest row histogram.
+    ys, xs = np.nonzero(dark)
+    if len(ys) == 0:
+        return 0.0
+    angles = np.arange(-max_angle, max_angle + step, step)
+    best_angle = 0.0
+    best_score = -1.0
+    for a in angles:
+        rows = np.round(ys - xs * np.tan(np.radians(a))).astype(np.int64)
+        hist = np.bincount(rows - rows.min())
+        score = np.sum(hist.astype(np.float64) ** 2)
+        if score > best_score:
+            best_angle = a
+            best_score = score
+    return float(best_angle)
+
+
+def remove_specks(dark, size=SPECK_SIZE):
+    """return dark with isolated specks no larger than size x size px removed"""
+    # A speck fits inside a size x size window whose 1 px surrounding ring is
+    # entirely white.
+    d = dark.astype(np.float64)
+    padded = np.pad(d, 1)
+    outer = get_box_sums(padded, size + 2, size + 2)
+    inner = get_box_sums(d, size, size)
+    n_rows = min(outer.shape[0], inner.shape[0])
+    n_cols = min(outer.shape[1], inner.shape[1])
+    outer = outer[:n_rows, :n_cols]
+    inner = inner[:n_rows, :n_cols]
+    speck_windows = (inner > 0) & (outer == inner)
+    # Clear every pixel covered by one of the speck windows.
+    # Padding on all sides makes the sums cover the bottom & right edges too.
+    pad = size - 1
+    covered = get_box_sums(
+        np.pad(speck_windows.astype(np.float64), ((pad, pad), (pad, pad))),
+        size,
+        size,
+    )
+    cleared = np.zeros(dark.shape, dtype=bool)
+    rows = min(covered.shape[0], dark.shape[0])
+    cols = min(covered.shape[1], dark.shape[1])
+    cleared[:rows, :cols] = covered[:rows, :cols] > 0
+    return dark & ~cleared
+
+
+def to_image(dark):
+    return Image.fromarray(np.where(dark, 0, 255).astype(np.uint8), mode="L")
+
+
+def to_dark(img):
+    # Images from earlier steps are already bilevel; otherwise use Otsu.
+    gray = np.asarray(img.convert("L"))
+    if np.isin(gray, (0, 255)).all():
+        return gray == 0
+    return binarize_otsu(gray)
+
+
+def step_otsu(img):
+    return to_image(binarize_otsu(np.asarray(img.convert("L"))))
+
+
+def step_sauvola(img):
+    return to_image(binarize_sauvola(np.asarray(img.convert("L"))))
+
+
+def step_deskew(img):
+    angle = get_skew_angle(to_dark(img))
+    if angle == 0:
+        return img
+    return img.convert("L").rotate(
+        angle, resample=Image.BICUBIC, expand=True, fillcolor=255
+    )
+
+
+def step_despeckle(img):
+    return to_image(remove_specks(to_dark(img)))
+
+
+STEPS = {
+    "deskew": step_deskew,
+    "despeckle": step_despeckle,
+    "otsu": step_otsu,
+    "sauvola": step_sauvola,
+}
+
+
+def parse_steps(text):
+    """return list of step names from e.g. 'sauvola,deskew'; raise ValueError if invalid"""
+    steps = [s.strip() for s in text.split(",") if s.strip()]
+    invalid = [s for s in steps if s not in STEPS]
+    if invalid:
+        raise ValueError(
+            f"Invalid preprocessing step(s): {', '.join(invalid)}; valid steps: {', '.join(sorted(STEPS))}"
+        )
+    return steps
+
+
+def get_model_label(model, steps):
+    """return name under which results of model with preprocessing steps are stored"""
+    # e.g. Latin_afr+sauvola+deskew; hypothesis files and data.csv entries of
+    # preprocessed runs don't collide with those of the plain model.
+    return "+".join([model, *steps])
+
+
+def preprocess_image(img, steps):
+    for s in steps:
+        img = STEPS.get(s)(img)
+    return img
+
+
+def get_preprocessed_image(image_file, steps, cache_dir=DEFAULT_CACHE_DIR):
+    """return path of image_file preprocessed with steps, creating it if not cached"""
+    config = f"{PIPELINE_VERSION}:{','.join(steps)}"
+    config_hash = hashlib.sha256(config.encode()).hexdigest()[:12]
+    cached = cache_dir / f"{get_file_hash(image_file)}-{config_hash}.png"
+    if cached.is_file():
+        return cached
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with Image.open(image_file) as img:
+        out = preprocess_image(img, steps)
+    # Save under a temporary name so concurrent runs never read a partial file.
+    tmp_file = cached.with_name(f"{cached.stem}-{os.getpid()}.tmp.png")
+    out.save(tmp_file)
+    os.replace(tmp_file, cached)
+    return cached
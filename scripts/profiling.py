@@ -0,0 +1,145 @@
+"""opt-in timing of script stages, aggregated across processes"""
+
+# Enable with a script's "--profile" option or by setting OCR_PROFILE=1 (or
+# OCR_PROFILE=cprofile to also save cProfile stats of every process), e.g.
+#   $ OCR_PROFILE=1 ./scripts/scan-data.py
+# The first process to start profiling creates a run folder in data/profile and
+# passes it to pool workers and subprocesses (e.g. evaluate-ocr.py run by
+# scan-data.py) in OCR_PROFILE_DIR. Each process writes its stage times there
+# when it exits, and the first process then prints a summary table of all of
+# them. When profiling is off, stage() costs one function call and a dict lookup.
+
+import atexit
+import json
+import os
+import sys
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+
+PROFILE_ENV = "OCR_PROFILE"
+PROFILE_DIR_ENV = "OCR_PROFILE_DIR"
+PROFILES_DIR = Path(__file__).resolve().parents[1] / "data" / "profile"
+
+# Stage times of this process: {stage: [calls, wall seconds, CPU seconds]}
+STAGES = {}
+# pid that STAGES belongs to; forked pool workers start over with their own.
+_PID = None
+_PROFILER = None
+
+
+def is_enabled():
+    return PROFILE_DIR_ENV in os.environ
+
+
+def init_profiling(script_name, option=None):
+    """enable profiling if option (e.g. from --profile) or OCR_PROFILE is set"""
+    mode = option or os.environ.get(PROFILE_ENV)
+    if not mode and not is_enabled():
+        return False
+    if mode and not is_enabled():
+        # Top-level process: create run folder & show summary at exit.
+        run_name = f"{time.strftime('%Y%m%d-%H%M%S')}-{script_name}-{os.getpid()}"
+        run_dir = PROFILES_DIR / run_name
+        run_dir.mkdir(parents=True, exist_ok=True)
+        os.environ[PROFILE_DIR_ENV] = str(run_dir)
+        os.environ[PROFILE_ENV] = mode
+        atexit.register(show_summary, run_dir)
+    start_process(script_name)
+    return True
+
+
+def start_process(script_name=None):
+    global _PID
+    global _PROFILER
+    _PID = os.getpid()
+    STAGES.clear()
+    name = script_name or Path(sys.argv[0]).stem
+    if _PROFILER is not None:
+        # Inherited from the parent process when forked.
+        _PROFILER.disable()
+        _PROFILER = None
+    if os.environ.get(PROFILE_ENV) == "cprofile":
+        import cProfile
+
+        _PROFILER = cProfile.Profile()
+        _PROFILER.enable()
+    if script_name:
+        # atexit handlers run in reverse order, so this process's stats are
+        # saved before show_summary reads them.
+        atexit.register(save_stats, name)
+    else:
+        # Pool workers don't run atexit handlers; multiprocessing runs its own
+        # finalizers when a worker exits after pool.close() & pool.join().
+        from multiprocessing.util import Finalize
+
+        Finalize(None, save_stats, args=(name,), exitpriority=10)
+
+
+def save_stats(name):
+    run_dir = Path(os.environ.get(PROFILE_DIR_ENV))
+    pid = os.getpid()
+    if _PROFILER is not None:
+        _PROFILER.disable()
+        _PROFILER.dump_stats(run_dir / f"{name}-{pid}.pstats")
+    if STAGES:
+        data = {"name": name, "pid": pid, "stages": STAGES}
+        (run_dir / f"{name}-{pid}.json").write_text(json.dumps(data))
+
+
+@contextmanager
+def stage(name):
+    """record wall & CPU time of the enclosed block under name"""
+    if PROFILE_DIR_ENV not in os.environ:
+        yield
+        return
+    if _PID != os.getpid():
+        # First stage in a pool worker (or a process that didn't call init).
+        start_process()
+    t_wall = time.perf_counter()
+    t_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        s = STAGES.setdefault(name, [0, 0.0, 0.0])
+        s[0] += 1
+        s[1] += time.perf_counter() - t_wall
+        s[2] += time.process_time() - t_cpu
+
+
+def load_stats(run_dir):
+    """return {(process name, stage): [calls, wall, cpu, number of processes]}"""
+    totals = {}
+    for f in sorted(run_dir.glob("*.json")):
+        data = json.loads(f.read_text())
+        for s, (calls, wall, cpu) in data.get("stages").items():
+            t = totals.setdefault((data.get("name"), s), [0, 0.0, 0.0, 0])
+            t[0] += calls
+            t[1] += wall
+            t[2] += cpu
+            t[3] += 1
+    return totals
+
+
+def show_summary(run_dir):
+    totals = load_stats(run_dir)
+    if not totals:
+        return
+    print(f"\nProfile: {run_dir}", file=sys.stderr)
+    print(
+        "Calls\tWall (s)\tCPU (s)\tms/call\tProcs\tStage",
+        file=sys.stderr,
+    )
+    for (name, s), (calls, wall, cpu, procs) in sorted(
+        totals.items(), key=lambda kv: kv[1][1], reverse=True
+    ):
+        print(
+            f"{calls}\t{wall:.3f}\t\t{cpu:.3f}\t{wall / calls * 1000:.2f}\t{procs}\t{name}: {s}",
+            file=sys.stderr,
+        )
+    if any(run_dir.glob("*.pstats")):
+        print(
+            f"cProfile stats: python -m pstats {run_dir}/<name>-<pid>.pstats",
+            file=sys.stderr,
+        )
@@ -1,10 +1,28 @@
 #!/usr/bin/env python3
 
 # Scan data/evaluation folder and ensure that OCR evalulation data is added to data.csv.
+# Only (model, image) pairs that are new, or whose model, image or ground truth
+# content has changed since they were last evaluated, are passed to evaluate-ocr.py.
 
+import argparse
+import csv
 import subprocess
+import time
 
+from cache_utils import get_file_hash
+from cache_utils import load_json
+from cache_utils import save_json
+from char_profiles import WHITELIST_LABEL
+from ocr_data import get_word_data_file
 from pathlib import Path
+from preprocess import get_model_label
+from preprocess import parse_steps
+from profiling import init_profiling
+from profiling import stage
+
+# Initial guess of seconds needed to evaluate one (model, image) pair; replaced
+# by measured times once some evaluations have been run.
+DEFAULT_PAIR_SECONDS = 5.0
 
 
 def list_png_files(base_dir):
@@ -57,7 +75,140 @@ def get_ocr_recognized_files_by_model(base_dir, model):
     return files
 
 
+def load_scan_state(state_file):
+    state = {"hashes": {}, "pairs": {}}
+    state.update(load_json(state_file, {}))
+    return state
+
+
+def get_evaluated_pairs(data_csv):
+    """return set of (model, iso_lang, image filename) already recorded in data.csv"""
+    pairs = set()
+    if not data_csv.is_file():
+        return pairs
+    with data_csv.open(newline="") as c:
+        for r in csv.DictReader(c):
+            image_name = Path(r.get("image-file")).name
+            pairs.add((r.get("model"), r.get("iso_lang"), image_name))
+    return pairs
+
+
+def get_pair_key(model, image_file, eval_dir):
+    return f"{model}|{image_file.relative_to(eval_dir)}"
+
+
+def plan_evaluations(
+    models,
+    gt_files,
+    models_dir,
+    eval_dir,
+    state,
+    evaluated,
+    steps=None,
+    whitelist=False,
+):
+    """return list of (model, image) evaluation tasks still needing to be run"""
+    tasks = []
+    hash_cache = state.get("hashes")
+    model_hashes = {
+        m: get_file_hash(models_dir / f"{m}.traineddata", hash_cache) for m in models
+    }
+    for gt_file in gt_files:
+        image_file = Path(str(gt_file).replace(".gt.txt", ".png"))
+        image_hash = get_file_hash(image_file, hash_cache)
+        truth_hash = get_file_hash(gt_file, hash_cache)
+        iso_lang = gt_file.parent.name
+        for m in models:
+            label = get_model_label(m, steps) if steps else m
+            if whitelist:
+                label = f"{label}+{WHITELIST_LABEL}"
+            key = get_pair_key(label, image_file, eval_dir)
+            hashes = {
+                "image": image_hash,
+                "model": model_hashes.get(m),
+                "truth": truth_hash,
+            }
+            done = state.get("pairs").get(key)
+            if done is None and (label, iso_lang, image_file.name) in evaluated:
+                # Evaluated before hashes were tracked; adopt current content as
+                # the baseline rather than re-running it.
+                state["pairs"][key] = {**hashes, "seconds": None}
+                continue
+            if done is None:
+                reason = "new"
+            elif any(done.get(k) != v for k, v in hashes.items()):
+                reason = "changed"
+            else:
+                continue
+            tasks.append(
+                {
+                    "gt_file": gt_file,
+                    "hashes": hashes,
+                    "image_file": image_file,
+                    "key": key,
+                    "label": label,
+                    "model": m,
+                    "reason": reason,
+                }
+            )
+    return tasks
+
+
+def get_pair_seconds_estimates(state):
+    """return average recorded seconds per pair by model, plus an overall average"""
+    times = {}
+    for key, v in state.get("pairs").items():
+        if v.get("seconds") is None:
+            continue
+        times.setdefault(key.split("|")[0], []).append(v.get("seconds"))
+    estimates = {m: sum(t) / len(t) for m, t in times.items()}
+    all_times = [s for t in times.values() for s in t]
+    default = sum(all_times) / len(all_times) if all_times else DEFAULT_PAIR_SECONDS
+    return estimates, default
+
+
+def format_duration(seconds):
+    m, s = divmod(int(round(seconds)), 60)
+    h, m = divmod(m, 60)
+    return f"{h}h{m:02d}m{s:02d}s" if h else f"{m}m{s:02d}s"
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Run OCR evaluations for new or changed (model, image) pairs."
+    )
+    parser.add_argument(
+        "-n",
+        "--dry-run",
+        action="store_true",
+        help="list planned evaluations and estimated run time, then exit",
+    )
+    parser.add_argument(
+        "-p",
+        "--preprocess",
+        type=str,
+        help="comma-separated image preprocessing steps to apply before OCR; results are recorded under 'model+step+...'",
+    )
+    parser.add_argument(
+        "-w",
+        "--whitelist",
+        action="store_true",
+        help=f"restrict OCR to each iso_lang's character profile; results are recorded under 'model+{WHITELIST_LABEL}'",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="stages",
+        choices=["stages", "cprofile"],
+        help="print time spent in each stage at exit; 'cprofile' also saves cProfile stats of each process to data/profile [stages]",
+    )
+    return parser.parse_args()
+
+
 def main():
+    args = get_parsed_args()
+    init_profiling("scan-data", args.profile)
+
     script = Path(__file__).expanduser().resolve()
     scripts_dir = script.parent
     root_dir = scripts_dir.parent
@@ -67,34 +218,94 @@ def main():
         if not d.is_dir():
             print(f"Error: Folder does not exist: {d}")
             exit(1)
+    data_csv = eval_dir / "data.csv"
+    state_file = eval_dir / "scan-state.json"
 
-    # ocr_ready_files = get_ocr_files_by_ext('.png', eval_dir)
-    ocr_gt_files = find_files_by_ext(".gt.txt", eval_dir)
+    ocr_gt_files = get_ocr_ready_files(eval_dir)
     ocr_gt_files.sort()
     models = [
-        f.stem for f in models_dir.iterdir() if not f.is_dir() and f.stem != "Latin_afr"
+        f.stem
+        for f in models_dir.glob("*.traineddata")
+        if not f.is_dir() and f.stem != "Latin_afr"
     ]
     models.sort()
 
+    steps = []
+    if args.preprocess:
+        try:
+            steps = parse_steps(args.preprocess)
+        except ValueError as e:
+            print(f"Error: {e}")
+            exit(1)
+
     print(f"Base dir: {eval_dir}")
-    for m in models:
-        # # Verify that model has been used to create OCR output.
-        # ocr_recognized_files = get_ocr_files_by_ext(f".{m}.txt", eval_dir)
-        # # Verify that a corresponding gt file exists.
-        print(f"  Running OCR evaluations for {m}...")
-        # for f in ocr_recognized_files:
-        #     gt_file = Path(str(f).replace(f".{m}.", '.gt.'))
-        #     if gt_file.is_file():
-        #         # Ensure that model evaluation is added to data.csv.
-        #         cmd = [scripts_dir / 'evaluate-ocr.py', '-l', m, gt_file]
-        #         proc = subprocess.run(cmd, capture_output=True)
-        #         print(proc.stdout.decode(), end='')
-        ## Idea 2
-        for gt_file in ocr_gt_files:
-            # Ensure that model evaluation is added to data.csv.
-            cmd = [scripts_dir / "evaluate-ocr.py", "-l", m, gt_file]
+    state = load_scan_state(state_file)
+    with stage("plan"):
+        tasks = plan_evaluations(
+            models,
+            ocr_gt_files,
+            models_dir,
+            eval_dir,
+            state,
+            get_evaluated_pairs(data_csv),
+            steps,
+            args.whitelist,
+        )
+    estimates, default_seconds = get_pair_seconds_estimates(state)
+    est_total = sum(estimates.get(t.get("label"), default_seconds) for t in tasks)
+    num_new = len([t for t in tasks if t.get("reason") == "new"])
+    num_pairs = len(models) * len(ocr_gt_files)
+    print(
+        f"Planned evaluations: {len(tasks)} of {num_pairs} "
+        f"({num_new} new, {len(tasks) - num_new} changed); "
+        f"estimated time: {format_duration(est_total)}"
+    )
+
+    if args.dry_run:
+        for t in tasks:
+            print(
+                f"  {t.get('reason')}\t{t.get('label')}\t"
+                f"{t.get('image_file').relative_to(eval_dir)}"
+            )
+        # Keep hashes computed during planning so the next scan is quicker.
+        save_json(state_file, state)
+        return
+
+    save_json(state_file, state)
+    # Run each model's evaluations together.
+    model_order = {m: i for i, m in enumerate(models)}
+    tasks.sort(key=lambda t: model_order.get(t.get("model")))
+    last_model = None
+    for t in tasks:
+        m = t.get("model")
+        if t.get("label") != last_model:
+            print(f"  Running OCR evaluations for {t.get('label')}...")
+            last_model = t.get("label")
+        if t.get("reason") == "changed":
+            # Remove stale OCR output so that evaluate-ocr.py recognizes the
+            # image again; its new data.csv entry replaces the old one.
+            stem = t.get("image_file").stem
+            h_file = t.get("image_file").with_name(f"{stem}.{t.get('label')}.txt")
+            h_file.unlink(missing_ok=True)
+            get_word_data_file(h_file).unlink(missing_ok=True)
+
+        # Ensure that model evaluation is added to data.csv.
+        cmd = [scripts_dir / "evaluate-ocr.py", "-l", m]
+        if steps:
+            cmd.extend(["-p", ",".join(steps)])
+        if args.whitelist:
+            cmd.append("-w")
+        cmd.append(t.get("gt_file"))
+        t_start = time.monotonic()
+        with stage("evaluate pair"):
             proc = subprocess.run(cmd, capture_output=True)
-            print(proc.stdout.decode(), end="")
+        seconds = round(time.monotonic() - t_start, 3)
+        print(proc.stdout.decode(), end="")
+        if proc.returncode != 0:
+            print(f"Error: Evaluation failed: {t.get('key')}")
+            continue
+        state["pairs"][t.get("key")] = {**t.get("hashes"), "seconds": seconds}
+        save_json(state_file, state)
 
 
 if __name__ == "__main__":
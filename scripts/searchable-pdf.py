@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+
+# Make a searchable PDF from a PDF document or a set of images: pages are OCR'd
+# in parallel, and each page's text is added as an invisible layer over the
+# page, positioned line by line from tesseract's word boxes (see ocr_data.py).
+# Pages are added to the output in order as soon as they're OCR'd. Every
+# FLUSH_PAGES pages, the output is saved incrementally and reopened, so that
+# finished pages don't stay in memory, even for books of hundreds of pages.
+# The text layer's font is embedded once and shared by all pages.
+
+import argparse
+import os
+import sys
+import time
+
+from cascade import get_data_lines
+from char_profiles import get_profile
+from char_profiles import get_profile_config
+from ocr_pipeline import DEFAULT_MODEL
+from ocr_pipeline import iter_pdf_page_images
+from ocr_pipeline import ocr_page_images
+from ocr_pipeline import parse_page_ranges
+from pathlib import Path
+
+IMAGE_EXTS = {".jpeg", ".jpg", ".png", ".tif", ".tiff"}
+DEFAULT_IMAGE_DPI = 300  # for images that don't say
+FLUSH_PAGES = 20
+TEXT_FONT_NAME = "ocr"
+# Any font with the model's characters will do, since the text is invisible;
+# matplotlib ships DejaVu Sans, which has them.
+DEFAULT_TEXT_FONT = "DejaVu Sans"
+
+
+def find_images(paths):
+    """return image files given directly or found in given folders"""
+    images = []
+    for path in paths:
+        if path.is_dir():
+            images.extend(
+                sorted(
+                    f
+                    for f in path.glob("**/*")
+                    if f.suffix.lower() in IMAGE_EXTS and f.is_file()
+                )
+            )
+        else:
+            images.append(path)
+    return images
+
+
+def iter_image_files(image_files):
+    """yield (page number, image bytes) for image_files, one at a time"""
+    for n, image_file in enumerate(image_files, start=1):
+        yield n, image_file.read_bytes()
+
+
+def get_text_font_file(family=DEFAULT_TEXT_FONT):
+    from matplotlib import font_manager
+
+    return str(font_manager.findfont(family, fallback_to_default=False))
+
+
+def add_image_page(doc, image_file):
+    """add a page showing image_file at its DPI to doc; return the page"""
+    import fitz  # PyMuPDF
+    from PIL import Image
+
+    with Image.open(image_file) as img:
+        dpi = img.info.get("dpi", (DEFAULT_IMAGE_DPI, DEFAULT_IMAGE_DPI))
+        width = img.width * 72 / (dpi[0] or DEFAULT_IMAGE_DPI)
+        height = img.height * 72 / (dpi[1] or DEFAULT_IMAGE_DPI)
+    page = doc.new_page(width=width, height=height)
+    page.insert_image(fitz.Rect(0, 0, width, height), filename=str(image_file))
+    return page
+
+
+def add_pdf_page(doc, src, n):
+    """add a page showing page n (1-based) of src to doc; return the page"""
+    src_page = src[n - 1]
+    page = doc.new_page(width=src_page.rect.width, height=src_page.rect.height)
+    page.show_pdf_page(page.rect, src, n - 1)
+    return page
+
+
+def add_text_layer(page, data, image_size, font, fontfile, font_xref=None):
+    """add invisible text of word data to page; return the text font's xref
+
+    font_xref is that of the font already embedded for an earlier page, if any.
+    """
+    import fitz  # PyMuPDF
+
+    if font_xref:
+        # New pages' resources are their own object.
+        doc = page.parent
+        _, resources = doc.xref_get_key(page.xref, "Resources")
+        doc.xref_set_key(
+            int(resources.split()[0]), f"Font/{TEXT_FONT_NAME}", f"{font_xref} 0 R"
+        )
+    else:
+        font_xref = page.insert_font(fontname=TEXT_FONT_NAME, fontfile=fontfile)
+    scale_x = page.rect.width / image_size[0]
+    scale_y = page.rect.height / image_size[1]
+    for line in get_data_lines(data):
+        left, top, right, bottom = line.get("box")
+        # Fit the font's full height (ascender to descender) to the line box.
+        fontsize = (bottom - top) * scale_y / (font.ascender - font.descender)
+        if fontsize <= 0:
+            continue
+        origin = fitz.Point(left * scale_x, top * scale_y + font.ascender * fontsize)
+        length = font.text_length(line.get("text"), fontsize=fontsize)
+        morph = None
+        if length > 0:
+            # Stretch the line to the width of its box, so that selections of
+            # the text match the page image.
+            morph = (origin, fitz.Matrix((right - left) * scale_x / length, 1))
+        page.insert_text(
+            origin,
+            line.get("text"),
+            fontname=TEXT_FONT_NAME,
+            fontsize=fontsize,
+            render_mode=3,  # invisible
+            morph=morph,
+        )
+    return font_xref
+
+
+def flush_pdf(doc, out_file, saved):
+    """save doc's new pages to out_file; return doc reopened from it"""
+    import fitz  # PyMuPDF
+
+    if saved:
+        doc.saveIncr()
+    else:
+        doc.save(out_file, garbage=1, deflate=True)
+    doc.close()
+    return fitz.open(out_file)
+
+
+def write_searchable_pdf(out_file, results, add_page, fontfile):
+    """write pages made by add_page(doc, n) with text layers from OCR results
+
+    results are (page number, (text, word data, image size)) items in page
+    order; return number of pages written.
+    """
+    import fitz  # PyMuPDF
+
+    font = fitz.Font(fontfile=fontfile)
+    doc = fitz.open()
+    saved = False
+    font_xref = None
+    num_pages = 0
+    for n, (_, data, image_size) in results:
+        page = add_page(doc, n)
+        font_xref = add_text_layer(page, data, image_size, font, fontfile, font_xref)
+        num_pages += 1
+        if num_pages % FLUSH_PAGES == 0:
+            doc = flush_pdf(doc, out_file, saved)
+            saved = True
+    if num_pages % FLUSH_PAGES:
+        doc = flush_pdf(doc, out_file, saved)
+    doc.close()
+    return num_pages
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="OCR a PDF or images in parallel into a single searchable PDF."
+    )
+    parser.add_argument(
+        "-f",
+        "--font",
+        type=str,
+        default=DEFAULT_TEXT_FONT,
+        help=f"font family or file of the (invisible) text layer; it needs the model's characters [{DEFAULT_TEXT_FONT}]",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="number of pages to OCR at once [# of CPUs]",
+    )
+    parser.add_argument(
+        "-l",
+        "--model",
+        type=str,
+        default=DEFAULT_MODEL,
+        help=f"name of tesseract model to use [{DEFAULT_MODEL}]",
+    )
+    parser.add_argument(
+        "-o",
+        "--outfile",
+        type=str,
+        required=True,
+        help="searchable PDF to write",
+    )
+    parser.add_argument(
+        "-p",
+        "--pages",
+        type=str,
+        help="pages of a PDF to OCR, e.g. '1-3,7' [all]",
+    )
+    parser.add_argument(
+        "-r",
+        "--dpi",
+        type=int,
+        help="render PDF pages at this DPI [estimated from text size for 48px characters]",
+    )
+    parser.add_argument(
+        "-w",
+        "--whitelist",
+        type=str,
+        metavar="ISO_LANG",
+        help="restrict OCR to the characters of ISO_LANG's profile (see char_profiles.py)",
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="a PDF document, or image files and folders of images (pages in name order)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    paths = [Path(p).expanduser().resolve() for p in args.inputs]
+    for p in paths:
+        if not p.exists():
+            print(f"Error: Could not find file: {p}")
+            exit(1)
+    fontfile = args.font
+    if not Path(fontfile).is_file():
+        try:
+            fontfile = get_text_font_file(args.font)
+        except ValueError:
+            print(f"Error: Could not find font: {args.font}")
+            exit(1)
+    config = ""
+    if args.whitelist:
+        profile = get_profile(args.whitelist)
+        if profile is None:
+            print(f"Error: No character profile for {args.whitelist}")
+            exit(1)
+        config = get_profile_config(profile)
+
+    import fitz  # PyMuPDF
+
+    src = None
+    if len(paths) == 1 and paths[0].suffix.lower() == ".pdf":
+        src = fitz.open(paths[0])
+        pages = parse_page_ranges(args.pages) if args.pages else None
+        page_images = iter_pdf_page_images(paths[0], pages=pages, dpi=args.dpi)
+
+        def add_page(doc, n):
+            return add_pdf_page(doc, src, n)
+
+    else:
+        image_files = find_images(paths)
+        if not image_files:
+            print("Error: No images found.")
+            exit(1)
+        page_images = iter_image_files(image_files)
+
+        def add_page(doc, n):
+            return add_image_page(doc, image_files[n - 1])
+
+    out_file = Path(args.outfile).expanduser().resolve()
+    # Only replace the output once it's complete.
+    tmp_file = out_file.with_name(f"{out_file.name}.tmp")
+    t_start = time.monotonic()
+    try:
+        num_pages = write_searchable_pdf(
+            tmp_file,
+            ocr_page_images(
+                page_images,
+                model=args.model,
+                jobs=args.jobs,
+                config=config,
+                with_data=True,
+            ),
+            add_page,
+            fontfile,
+        )
+    finally:
+        if src is not None:
+            src.close()
+    if not num_pages:
+        print("Error: No pages were OCR'd.")
+        exit(1)
+    os.replace(tmp_file, out_file)
+    seconds = time.monotonic() - t_start
+    print(
+        f"INFO: Wrote {num_pages} pages to {out_file.name} in {seconds:.1f}s ({num_pages / seconds:.2f} pages/sec)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(1)
@@ -4,11 +4,23 @@
 
 import argparse
 import csv
-import matplotlib.pyplot as plt
+import multiprocessing
 import numpy as np
 import sys
 
+from cer_stats import CI_LEVEL
+from cer_stats import PageCounts
+from cer_stats import format_stat
+from cer_stats import get_bootstrap_weights
+from cer_stats import get_cer_intervals
+from cer_stats import get_newest_rows
+from cer_stats import get_paired_tests
 from pathlib import Path
+from profiling import init_profiling
+from profiling import stage
+
+# NOTE: matplotlib is only imported when a chart is drawn so that printing the
+# data tables stays quick.
 
 CHART_TYPES = {
     "3d",
@@ -17,27 +29,30 @@ CHART_TYPES = {
     "comparison",
     "model",
     "summary",
+    "training",
 }
+SUM_FIELDS = ("hits", "substitutions", "deletions", "insertions", "cer")
 
 
 class GroupedData:
-    def __init__(self, name, csv_data):
+    def __init__(self, name, sums):
+        # sums = {'count': int, 'hits': float, 'substitutions': float, ...}
         self.name = name
-        self.data = csv_data
-        self.data_ct = len(csv_data)
+        self.data_ct = int(sums.get("count"))
         self.cer_sum = None
         self.cer_avg = None
         self.cer_group = None
+        self.lang_data = []
 
-        self.c_sum = sum([float(d.get("hits")) for d in self.data])
-        self.d_sum = sum([float(d.get("deletions")) for d in self.data])
-        self.i_sum = sum([float(d.get("insertions")) for d in self.data])
-        self.s_sum = sum([float(d.get("substitutions")) for d in self.data])
-        self.set_cer_avg()
+        self.c_sum = float(sums.get("hits"))
+        self.d_sum = float(sums.get("deletions"))
+        self.i_sum = float(sums.get("insertions"))
+        self.s_sum = float(sums.get("substitutions"))
+        self.set_cer_avg(sums)
         self.set_group_cer()
 
-    def set_cer_avg(self):
-        self.cer_sum = sum([float(d.get("cer")) for d in self.data])
+    def set_cer_avg(self, sums):
+        self.cer_sum = float(sums.get("cer"))
         self.cer_avg = round(self.cer_sum / self.data_ct, 4)
 
     def set_group_cer(self):
@@ -49,6 +64,69 @@ class GroupedData:
         )
 
 
+class AggregatedData:
+    """sums of evaluation counts by model and by (model, iso_lang)"""
+
+    def __init__(self, csv_data):
+        # Factorize the grouping columns, then sum every value column per group
+        # with a single bincount each; i.e. one pass over the rows.
+        self.model_names, model_idx = np.unique(
+            np.array([r.get("model") for r in csv_data], dtype=str),
+            return_inverse=True,
+        )
+        self.iso_langs, lang_idx = np.unique(
+            np.array([r.get("iso_lang") for r in csv_data], dtype=str),
+            return_inverse=True,
+        )
+        self.model_names = self.model_names.tolist()
+        self.iso_langs = self.iso_langs.tolist()
+        values = np.array(
+            [[float(r.get(f)) for f in SUM_FIELDS] for r in csv_data],
+            dtype=float,
+        ).reshape(-1, len(SUM_FIELDS))
+
+        n_models = len(self.model_names)
+        n_langs = len(self.iso_langs)
+        pair_idx = model_idx * n_langs + lang_idx
+        self.by_model = self.sum_columns(model_idx, values, n_models)
+        self.by_model_lang = {
+            k: v.reshape(n_models, n_langs)
+            for k, v in self.sum_columns(pair_idx, values, n_models * n_langs).items()
+        }
+
+    @staticmethod
+    def sum_columns(group_idx, values, num_groups):
+        sums = {"count": np.bincount(group_idx, minlength=num_groups)}
+        for i, f in enumerate(SUM_FIELDS):
+            sums[f] = np.bincount(group_idx, weights=values[:, i], minlength=num_groups)
+        return sums
+
+    @staticmethod
+    def get_sums(columns, index):
+        return {k: v[index] for k, v in columns.items()}
+
+    def get_group_cers(self, columns):
+        # CER = (S + D + I) / (C + S + D); groups without data get NaN.
+        errors = columns.get("substitutions") + columns.get("deletions")
+        truth = columns.get("hits") + errors
+        errors = errors + columns.get("insertions")
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(columns.get("count") > 0, errors / truth, np.nan)
+
+    def get_model_data(self):
+        """return list of model GroupedData objects, each with its lang_data"""
+        model_data = []
+        for i, m in enumerate(self.model_names):
+            g = GroupedData(m, self.get_sums(self.by_model, i))
+            for j, lg in enumerate(self.iso_langs):
+                if self.by_model_lang.get("count")[i, j] > 0:
+                    g.lang_data.append(
+                        GroupedData(lg, self.get_sums(self.by_model_lang, (i, j)))
+                    )
+            model_data.append(g)
+        return model_data
+
+
 def get_csv_data(csv_file):
     with csv_file.open(newline="") as c:
         reader = csv.DictReader(c)
@@ -56,46 +134,35 @@ def get_csv_data(csv_file):
     return csv_data
 
 
-def build_3d_slices(data):
+def build_3d_slices(agg_data):
     # Each slice is a unique iso_lang set of (model_name, CER).
     #   slices = {iso_lang: {model_name: CER}, ...}
     slices = {}
-    # data = {
-    #   model_name: {
-    #       'cer-avg': float,
-    #       'data': [rows],
-    #   }
-    # }
-
-    # Get list of model_names.
-    model_names = list(data.keys())
-    model_names.sort()
+    cers = agg_data.get_group_cers(agg_data.by_model_lang)
+    for j, lg in enumerate(agg_data.iso_langs):
+        slices[lg] = {
+            m: round(float(cers[i, j]), 4)
+            for i, m in enumerate(agg_data.model_names)
+            if not np.isnan(cers[i, j])
+        }
+    return slices
 
-    # Get list of iso_langs.
-    iso_langs = []
-    for m, v in data.items():
-        for r in v.get("data"):
-            iso_langs.append(r.get("iso_lang"))
-    iso_langs = list(set(iso_langs))
-    iso_langs.sort()
 
-    # Get CER for each combo of (model_name, iso_lang).
-    for m in model_names:
-        rows = data.get(m).get("data")
-        for lg in iso_langs:
-            c = 0
-            for row in rows:
-                if row.get("iso_lang") == lg:
-                    c = row.get("cer")
-                    break
-            if lg not in slices.keys():
-                slices[lg] = {m: c}
-            else:
-                slices[lg][m] = c
-    return slices
+def get_pyplot(headless=False):
+    import matplotlib
+
+    if headless:
+        # Render to files only; no display needed.
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    plt.style.use("_mpl-gallery")
+    return plt
 
 
-def plot_bar2d(x, y, z, out_file, title, xlabel, ylabel):
+def plot_bar2d(x, y, z, out_file, title, xlabel, ylabel, headless=False):
+    plt = get_pyplot(headless)
+
     # Generate and format plot.
     bw = 0.3  # bar width
     lw = 0.5  # line width
@@ -111,7 +178,7 @@ def plot_bar2d(x, y, z, out_file, title, xlabel, ylabel):
         # Ref: https://stackoverflow.com/questions/10369681
         ind = np.arange(len(x))
         lx = title.split("&")[0].split()[-1].strip()  # hack
-        lz = title.split("&")[1].strip()  # hack
+        lz = title.split("&")[1].split("\n")[0].strip()  # hack
         plt.xticks(ind + bw / 2, x, horizontalalignment="right", rotation=60)
         ax.bar(ind - 0.1, y, width=bw, edgecolor="w", linewidth=lw, label=lx)
         ax.bar(
@@ -141,9 +208,49 @@ def plot_bar2d(x, y, z, out_file, title, xlabel, ylabel):
     )  # 2% CER threshold shading
 
     # Show plot.
-    plt.savefig(out_file)
-    plt.show()
-    sys.exit()
+    with stage("save chart"):
+        plt.savefig(out_file)
+    if not headless:
+        plt.show()
+    plt.close(fig)
+
+
+def render_chart(chart_data):
+    # Used as pool worker for rendering charts without a display.
+    plot_bar2d(*chart_data, headless=True)
+    return chart_data[3]
+
+
+def render_all_charts(model_data, all_model_names, out_dir, page_counts=None):
+    # Prepare all chart data up front; only rendering is done in parallel.
+    charts = [
+        prepare_chart_data(
+            "summary",
+            model_data,
+            out_dir,
+            model_names=all_model_names,
+            page_counts=page_counts,
+        ),
+        prepare_chart_data("best", model_data, out_dir),
+        prepare_chart_data(
+            "comp",
+            model_data,
+            out_dir,
+            model_names=["Latin", "best"],
+            page_counts=page_counts,
+        ),
+    ]
+    for m in all_model_names:
+        charts.append(prepare_chart_data("model", model_data, out_dir, model_names=[m]))
+
+    procs = min(len(charts), multiprocessing.cpu_count())
+    with multiprocessing.Pool(processes=procs) as pool:
+        for out_file in pool.imap_unordered(render_chart, charts):
+            print(f"INFO: Saved {out_file}")
+        # Let workers exit on their own (rather than be terminated) so that
+        # they can save their profiling stats.
+        pool.close()
+        pool.join()
 
 
 def plot_bar3d(slices_dict):
@@ -161,6 +268,8 @@ def plot_bar3d(slices_dict):
     model_names = list(set(model_names))
     model_names.sort()
 
+    plt = get_pyplot()
+
     cers = []
     for lg in iso_langs:
         for m in model_names:
@@ -231,6 +340,106 @@ def plot_bar3d(slices_dict):
     plt.show()
 
 
+def plot_convergence(logs_data, out_file, headless=False):
+    # logs_data = {log_name: training_log data}
+    import training_log
+
+    plt = get_pyplot(headless)
+
+    fig, ax = plt.subplots(figsize=(10, 7))
+    plt.subplots_adjust(left=0.1, bottom=0.1, right=0.95, top=0.9)
+    plt.title("Training Convergence", pad=12.0)
+    for name, log_data in logs_data.items():
+        train = training_log.get_records(log_data, "train")
+        evals = training_log.get_records(log_data, "eval")
+        if not train:
+            continue
+        (line,) = ax.plot(
+            [r.get("iteration") for r in train],
+            [r.get("bcer") for r in train],
+            linewidth=1,
+            label=f"{name} (train)",
+        )
+        ax.scatter(
+            [r.get("iteration") for r in evals],
+            [r.get("bcer") for r in evals],
+            marker="x",
+            color=line.get_color(),
+            label=f"{name} (eval)",
+        )
+        plateau = training_log.find_plateau(log_data)
+        if plateau is not None:
+            ax.axvline(plateau, linestyle=":", color=line.get_color())
+    ax.set_yscale("log")
+    ax.set_xlabel("Learning Iteration")
+    ax.set_ylabel("BCER (%)")
+    plt.legend(loc="best")
+
+    plt.savefig(out_file)
+    if not headless:
+        plt.show()
+    plt.close(fig)
+
+
+def show_training_chart(args):
+    import training_log
+
+    log_files = [Path(f).expanduser().resolve() for f in args.logs]
+    if not log_files:
+        log_files = training_log.find_logs()
+    if not log_files:
+        print(f"ERROR: No log files found in {training_log.DEFAULT_LOG_DIR}")
+        sys.exit(1)
+
+    logs_data = {}
+    for f in log_files:
+        if not f.is_file():
+            print(f"ERROR: File does not exist: {str(f)}")
+            sys.exit(1)
+        logs_data[f.stem] = training_log.load_training_log(f)
+        training_log.show_summary(f, logs_data.get(f.stem))
+
+    if not args.no_chart:
+        out_file = log_files[0].parent / "training-convergence.png"
+        plot_convergence(logs_data, out_file, args.headless)
+
+
+def get_model_stats(page_counts, model_names, best_model):
+    """return {model: (CI low, CI high, CER - best CER, p)} from page bootstrap"""
+    weights = get_bootstrap_weights(len(page_counts.pages))
+    columns = [page_counts.get_columns(m) for m in model_names]
+    low, high = get_cer_intervals(
+        weights,
+        np.column_stack([e for e, _ in columns]),
+        np.column_stack([t for _, t in columns]),
+    )
+    diff, _, _, p = get_paired_tests(
+        weights, page_counts, [(m, best_model) for m in model_names]
+    )
+    return {m: (low[i], high[i], diff[i], p[i]) for i, m in enumerate(model_names)}
+
+
+def get_comp_stats(page_counts, m1, m2, iso_langs):
+    """return overall (diff, low, high, p) of m1 vs m2 & {iso_lang: (pages, CI 1, CI 2)}"""
+    weights = get_bootstrap_weights(len(page_counts.pages))
+    paired = [a[0] for a in get_paired_tests(weights, page_counts, [(m1, m2)])]
+    columns = [page_counts.get_columns(m, lg) for lg in iso_langs for m in (m1, m2)]
+    low, high = get_cer_intervals(
+        weights,
+        np.column_stack([e for e, _ in columns]),
+        np.column_stack([t for _, t in columns]),
+    )
+    intervals = {
+        lg: (
+            int(np.count_nonzero(columns[2 * i][1])),
+            (low[2 * i], high[2 * i]),
+            (low[2 * i + 1], high[2 * i + 1]),
+        )
+        for i, lg in enumerate(iso_langs)
+    }
+    return paired, intervals
+
+
 def get_best_model(model_data):
     # Determine best_model and its CER.
     best_model = [None, None]
@@ -242,7 +451,9 @@ def get_best_model(model_data):
     return best_model
 
 
-def prepare_chart_data(chart_type, model_data, out_dir, model_names=None):
+def prepare_chart_data(
+    chart_type, model_data, out_dir, model_names=None, page_counts=None
+):
     x = None
     y = None
     z = None
@@ -253,10 +464,22 @@ def prepare_chart_data(chart_type, model_data, out_dir, model_names=None):
 
     if chart_type == "summary" and model_names is not None:
         # Print data table to stdout.
-        print("Model Name\tCER")
-        for m in model_data:
-            # print(f"{m.name}\t{m.cer_avg}\t{round(m.cer_sum, 4)}/{m.data_ct}")
-            print(f"{m.name}\t{m.cer_group}")
+        if page_counts is None:
+            print("Model Name\tCER")
+            for m in model_data:
+                # print(f"{m.name}\t{m.cer_avg}\t{round(m.cer_sum, 4)}/{m.data_ct}")
+                print(f"{m.name}\t{m.cer_group}")
+        else:
+            # Confidence intervals & paired tests against the best model show
+            # which differences are more than noise from too few pages.
+            best = get_best_model(model_data)[0]
+            stats = get_model_stats(page_counts, [m.name for m in model_data], best)
+            print(f"Model Name\tCER\t{CI_LEVEL:.0%} CI\t\tvs. {best}\tp")
+            for m in model_data:
+                low, high, diff, p = stats.get(m.name)
+                print(
+                    f"{m.name}\t{m.cer_group}\t[{format_stat(low, '.4f')}, {format_stat(high, '.4f')}]\t{format_stat(diff, '+.4f')}\t\t{format_stat(p, '.3f')}"
+                )
 
         # Get CER averages by model.
         # cer_values = [m.cer_avg for m in model_data]
@@ -324,6 +547,21 @@ def prepare_chart_data(chart_type, model_data, out_dir, model_names=None):
         z = y2
         out_file = out_dir / f"comp-{m1}-{m2}.png"
         title = f"CER Comparison for {m1} & {m2}"
+        if page_counts is not None:
+            (diff, low, high, p), intervals = get_comp_stats(page_counts, m1, m2, x1)
+            print(
+                f"ISO_Language\tPages\t{m1} {CI_LEVEL:.0%} CI\t{m2} {CI_LEVEL:.0%} CI"
+            )
+            for lg, (pages, ci1, ci2) in intervals.items():
+                print(
+                    f"{lg}\t{pages}\t[{format_stat(ci1[0], '.4f')}, {format_stat(ci1[1], '.4f')}]\t[{format_stat(ci2[0], '.4f')}, {format_stat(ci2[1], '.4f')}]"
+                )
+            diff, low, high = (format_stat(v, "+.4f") for v in (diff, low, high))
+            p = format_stat(p, ".3f")
+            print(
+                f"{m1} - {m2} (paired pages): {diff} CER, {CI_LEVEL:.0%} CI [{low}, {high}], p = {p}"
+            )
+            title += f"\nΔCER {diff} [{low}, {high}], p = {p}"
         xlabel = xl1
         ylabel = yl1
     elif chart_type == "model" and model_names is not None:
@@ -378,12 +616,51 @@ def get_args():
         default=list(),
         help="language models to display",
     )
+    parser.add_argument(
+        "-n",
+        "--no-chart",
+        action="store_true",
+        help="only print the chart's data table",
+    )
+    parser.add_argument(
+        "-a",
+        "--all",
+        action="store_true",
+        help="save all summary, best, comp and model charts in one pass",
+    )
+    parser.add_argument(
+        "-s",
+        "--headless",
+        action="store_true",
+        help="save charts to files without showing them (no display needed)",
+    )
+    parser.add_argument(
+        "-g",
+        "--logs",
+        nargs="+",
+        type=str,
+        default=list(),
+        help="training log files for the training chart [all in ~/tesstrain/data]",
+    )
 
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="stages",
+        choices=["stages", "cprofile"],
+        help="print time spent in each stage at exit; 'cprofile' also saves cProfile stats of each process to data/profile [stages]",
+    )
     return parser.parse_args()
 
 
 def main():
     args = get_args()
+    init_profiling("show-chart", args.profile)
+
+    if args.chart_type is not None and args.chart_type[0] == "training":
+        # Convergence curves come from training logs rather than data.csv.
+        show_training_chart(args)
+        return
 
     # Prepare csv_data.
     csv_file = (
@@ -394,29 +671,24 @@ def main():
     )
     if not csv_file.is_file():
         print(f"ERROR: File does not exist: {str(csv_file)}")
-    csv_data = get_csv_data(csv_file)
-
-    # Prepare sorted lists of model_names and iso_langs.
-    all_model_names = list(set([r.get("model") for r in csv_data]))
-    all_model_names.sort()
-    iso_langs = list(set([r.get("iso_lang") for r in csv_data]))
-    iso_langs.sort()
+    with stage("read csv"):
+        # A page evaluated more than once with the same model only counts with
+        # its newest results, in CERs, best model & bootstrap stats alike.
+        csv_data = get_newest_rows(get_csv_data(csv_file))
+
+    # Sum all evaluation counts by model and (model, iso_lang) at once.
+    with stage("aggregate"):
+        agg_data = AggregatedData(csv_data)
+    all_model_names = agg_data.model_names
+
+    # model_data is a list of GroupedData objects of models, each with a
+    # lang_data list of iso_lang GroupedData objects.
+    with stage("group"):
+        model_data = agg_data.get_model_data()
+    # Per-page counts for bootstrap CIs & paired tests in summary & comp.
+    with stage("page counts"):
+        page_counts = PageCounts(csv_data)
 
-    # model_data is a list of GroupedData objects of models.
-    model_data = [
-        GroupedData(m, [r for r in csv_data if r.get("model") == m])
-        for m in all_model_names
-    ]
-
-    # lang_data is a list of iso_lang GroupedData objects.
-    for m in model_data:
-        m.lang_data = []
-        for lg in iso_langs:
-            sub_data = [r for r in m.data if r.get("iso_lang") == lg]
-            if sub_data:
-                m.lang_data.append(GroupedData(lg, sub_data))
-
-    plt.style.use("_mpl-gallery")
     out_dir = csv_file.parent
 
     # Set output variables.
@@ -438,9 +710,18 @@ def main():
         if len(args.models) > 2:
             print(f"INFO: Ignoring extra models: {', '.join(args.models[2:])}")
 
+    if args.all:
+        if not args.headless:
+            print("INFO: Charts are only saved to files when using '--all'")
+        render_all_charts(model_data, all_model_names, out_dir, page_counts)
+        return
+
     # Output chosen chart with chosen language models.
     if chart_type == "3d":
-        data_slices = build_3d_slices(model_data)
+        if args.headless:
+            print("ERROR: The 3d chart can only be shown interactively")
+            sys.exit(1)
+        data_slices = build_3d_slices(agg_data)
         plot_bar3d(data_slices)
 
     elif chart_type == "best":
@@ -448,16 +729,18 @@ def main():
         x, y, z, out_file, title, xlabel, ylabel = prepare_chart_data(
             "best", model_data, out_dir
         )
-        plot_bar2d(x, y, z, out_file, title, xlabel, ylabel)
+        if not args.no_chart:
+            plot_bar2d(x, y, z, out_file, title, xlabel, ylabel, args.headless)
 
     elif chart_type in ["comp", "comparison"]:
         print(f"INFO: Comparing {models = }")
 
         # Produce summary chart with both 'best' and 'Latin' models together.
         x, y, z, outf, t, xl, yl = prepare_chart_data(
-            "comp", model_data, out_dir, model_names=models
+            "comp", model_data, out_dir, model_names=models, page_counts=page_counts
         )
-        plot_bar2d(x, y, z, outf, t, xl, yl)
+        if not args.no_chart:
+            plot_bar2d(x, y, z, outf, t, xl, yl, args.headless)
 
     elif chart_type == "model":
         # Show summary chart of CER by ISO_Language for the given model.
@@ -470,14 +753,20 @@ def main():
         x, y, z, outf, t, xl, yl = prepare_chart_data(
             "model", model_data, out_dir, model_names=[model]
         )
-        plot_bar2d(x, y, z, outf, t, xl, yl)
+        if not args.no_chart:
+            plot_bar2d(x, y, z, outf, t, xl, yl, args.headless)
 
     elif chart_type == "summary":
         # Show summary chart of CER by Model Name.
         x, y, z, outf, t, xl, yl = prepare_chart_data(
-            "summary", model_data, out_dir, model_names=all_model_names
+            "summary",
+            model_data,
+            out_dir,
+            model_names=all_model_names,
+            page_counts=page_counts,
         )
-        plot_bar2d(x, y, z, outf, t, xl, yl)
+        if not args.no_chart:
+            plot_bar2d(x, y, z, outf, t, xl, yl, args.headless)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+"""parse lstmtraining logs written by run-training.sh into per-iteration records"""
+
+# Records are kept column-wise in a JSON store next to each log file
+# (e.g. "Latin_afr_2022121705.log" -> "Latin_afr_2022121705.log.json") together
+# with the byte offset already parsed, so re-reading a growing log only parses
+# the new lines. Example log lines:
+#   At iteration 14615/695400/698614, mean rms=0.158%, delta=0.295%, BCER train=1.092%, BWER train=3.563%, skip ratio=0.000%,  New best BCER = 1.092 wrote best model:data/Latin_afr/checkpoints/Latin_afr_1.092_14615_695400.checkpoint wrote checkpoint.
+#   At iteration 14615, stage 0, BCER eval=2.5, BWER eval=8.1
+#   Training lasted 52135s.
+
+import argparse
+import re
+import time
+
+from cache_utils import load_json
+from cache_utils import save_json
+from pathlib import Path
+
+DEFAULT_LOG_DIR = Path.home() / "tesstrain" / "data"
+DEFAULT_PLATEAU_WINDOW = 10000  # learning iterations
+DEFAULT_PLATEAU_MIN_GAIN = 0.1  # BCER percentage points
+FOLLOW_INTERVAL = 5  # seconds
+RECORD_FIELDS = (
+    "kind",  # train, sub, eval
+    "iteration",  # learning iteration
+    "training_iteration",
+    "bcer",
+    "bwer",
+    "checkpoint",  # path of "best model" checkpoint written at this iteration
+    "time",  # wall-clock time the line was read when following a live log
+)
+TRAIN_RE = re.compile(
+    r"At iteration (\d+)/(\d+)/\d+,.*?BCER train=([\d.]+)%, BWER train=([\d.]+)%"
+)
+EVAL_RE = re.compile(
+    r"At iteration (\d+), stage \d+, BCER eval=([\d.]+), BWER eval=([\d.]+)"
+)
+BEST_RE = re.compile(r"wrote best model:(\S+\.checkpoint)")
+DURATION_RE = re.compile(r"^Training lasted (\d+)s\.")
+
+
+def get_store_path(log_file):
+    return log_file.with_name(f"{log_file.name}.json")
+
+
+def new_log_data():
+    return {
+        "duration": None,
+        "offset": 0,
+        "records": {f: [] for f in RECORD_FIELDS},
+    }
+
+
+def parse_line(line):
+    """return record dict for a log line, or None if it has no training data"""
+    m = TRAIN_RE.search(line)
+    if m:
+        best = BEST_RE.search(line)
+        return {
+            "kind": "sub" if line.startswith("UpdateSubtrainer") else "train",
+            "iteration": int(m.group(1)),
+            "training_iteration": int(m.group(2)),
+            "bcer": float(m.group(3)),
+            "bwer": float(m.group(4)),
+            "checkpoint": best.group(1) if best else None,
+            "time": None,
+        }
+    m = EVAL_RE.search(line)
+    if m:
+        return {
+            "kind": "eval",
+            "iteration": int(m.group(1)),
+            "training_iteration": None,
+            "bcer": float(m.group(2)),
+            "bwer": float(m.group(3)),
+            "checkpoint": None,
+            "time": None,
+        }
+    return None
+
+
+def parse_new_lines(log_file, log_data, follow=False):
+    """parse complete lines added to log_file since log_data's offset; yield new records"""
+    if log_file.stat().st_size < log_data.get("offset"):
+        # Log was truncated or replaced; start over.
+        log_data.update(new_log_data())
+    with log_file.open("rb") as f:
+        f.seek(log_data.get("offset"))
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                # Incomplete line still being written; read it next time.
+                break
+            log_data["offset"] += len(raw)
+            line = raw.decode(errors="replace")
+            m = DURATION_RE.match(line)
+            if m:
+                log_data["duration"] = int(m.group(1))
+                continue
+            record = parse_line(line)
+            if record is None:
+                continue
+            if follow:
+                record["time"] = time.time()
+            for k, v in record.items():
+                log_data["records"][k].append(v)
+            yield record
+
+
+def save_log_data(log_file, log_data):
+    save_json(get_store_path(log_file), log_data, indent=None)
+
+
+def load_training_log(log_file):
+    """return columnar data for log_file, parsing only lines not already in its store"""
+    log_data = load_json(get_store_path(log_file), new_log_data())
+    offset = log_data.get("offset")
+    for r in parse_new_lines(log_file, log_data):
+        pass
+    if log_data.get("offset") != offset:
+        save_log_data(log_file, log_data)
+    return log_data
+
+
+def follow_training_log(log_file, interval=FOLLOW_INTERVAL):
+    """yield records as they're appended to a live log, like 'tail -f'"""
+    log_data = load_training_log(log_file)
+    while log_data.get("duration") is None:
+        new_records = list(parse_new_lines(log_file, log_data, follow=True))
+        if new_records:
+            save_log_data(log_file, log_data)
+            yield from new_records
+        else:
+            time.sleep(interval)
+
+
+def get_records(log_data, kind):
+    """return list of record dicts of the given kind"""
+    cols = log_data.get("records")
+    return [
+        {f: cols.get(f)[i] for f in RECORD_FIELDS}
+        for i, k in enumerate(cols.get("kind"))
+        if k == kind
+    ]
+
+
+def get_iterations_per_second(log_data):
+    """return training iterations/sec between records read while following the log, or None"""
+    train = get_records(log_data, "train")
+    timed = [r for r in train if r.get("time") is not None]
+    if len(timed) < 2 or timed[-1].get("time") == timed[0].get("time"):
+        return None
+    return (timed[-1].get("iteration") - timed[0].get("iteration")) / (
+        timed[-1].get("time") - timed[0].get("time")
+    )
+
+
+def get_run_throughput(log_data):
+    """return iterations/sec over the whole run, or None if it hasn't finished
+
+    "Training lasted" covers all of run-training.sh, including making the ground
+    truth & lstmf files, so this is lower than the training rate itself.
+    """
+    train = get_records(log_data, "train")
+    if not train or not log_data.get("duration"):
+        return None
+    return train[-1].get("iteration") / log_data.get("duration")
+
+
+def find_plateau(
+    log_data, window=DEFAULT_PLATEAU_WINDOW, min_gain=DEFAULT_PLATEAU_MIN_GAIN
+):
+    """return iteration since which best train BCER improved < min_gain, or None"""
+    train = get_records(log_data, "train")
+    if not train or train[-1].get("iteration") - train[0].get("iteration") < window:
+        return None
+    # Running best BCER at each record.
+    best = []
+    for r in train:
+        b = r.get("bcer") if not best else min(best[-1][1], r.get("bcer"))
+        best.append((r.get("iteration"), b))
+    last_iter, last_best = best[-1]
+    plateau_start = None
+    for it, b in reversed(best):
+        if b - last_best >= min_gain:
+            break
+        plateau_start = it
+    if last_iter - plateau_start < window:
+        return None
+    return plateau_start
+
+
+def find_logs(log_dir=DEFAULT_LOG_DIR, model_name="Latin_afr"):
+    return sorted(log_dir.glob(f"{model_name}_*.log"))
+
+
+def show_summary(log_file, log_data):
+    train = get_records(log_data, "train")
+    evals = get_records(log_data, "eval")
+    best = [r for r in train if r.get("checkpoint")]
+    print(f"{log_file.name}:")
+    if not train:
+        print("  no training iterations found")
+        return
+    print(f"  iterations:\t{train[-1].get('iteration')}")
+    print(f"  BCER train:\t{train[-1].get('bcer')}%")
+    print(f"  BWER train:\t{train[-1].get('bwer')}%")
+    if best:
+        print(f"  best BCER:\t{best[-1].get('bcer')}% ({best[-1].get('checkpoint')})")
+    if evals:
+        print(f"  BCER eval:\t{evals[-1].get('bcer')}% @ {evals[-1].get('iteration')}")
+    rate = get_iterations_per_second(log_data)
+    if rate is not None:
+        print(f"  iter/sec:\t{rate:.2f}")
+    throughput = get_run_throughput(log_data)
+    if throughput is not None:
+        print(f"  run iter/sec:\t{throughput:.2f} (incl. data preparation)")
+    plateau = find_plateau(log_data)
+    if plateau is not None:
+        print(f"  WARNING: No BCER gain >= {DEFAULT_PLATEAU_MIN_GAIN} since {plateau}")
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Summarize lstmtraining logs written by run-training.sh."
+    )
+    parser.add_argument(
+        "-f",
+        "--follow",
+        action="store_true",
+        help="follow the (last) log file and print new records as they're written",
+    )
+    parser.add_argument(
+        "log_file",
+        nargs="*",
+        help=f"log file(s) to parse [newest in {DEFAULT_LOG_DIR}]",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    log_files = [Path(f).expanduser().resolve() for f in args.log_file]
+    if not log_files:
+        log_files = find_logs()[-1:]
+    if not log_files:
+        print(f"Error: No log files found in {DEFAULT_LOG_DIR}")
+        exit(1)
+    for f in log_files:
+        if not f.is_file():
+            print(f"Error: Could not find file: {f}")
+            exit(1)
+
+    if args.follow:
+        log_file = log_files[-1]
+        print(f"Following {log_file}...")
+        for r in follow_training_log(log_file):
+            print("\t".join(str(r.get(f)) for f in RECORD_FIELDS[:-1]))
+        show_summary(log_file, load_training_log(log_file))
+        return
+
+    for f in log_files:
+        show_summary(f, load_training_log(f))
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        exit(1)
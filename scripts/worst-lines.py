@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+# Show the lines with the highest CER across the evaluation corpus, from the
+# per-line results in data/evaluation/lines.csv that evaluate-ocr.py adds for
+# every page it evaluates. Pages evaluated before lines.csv existed can be
+# aligned with "-b". With "-o", the truth text of the lines shown is written to a
+# file, one line per line, for use as targeted training text.
+
+import argparse
+import csv
+import heapq
+import sys
+
+from line_alignment import append_line_results
+from line_alignment import get_line_results
+from line_alignment import get_local_path
+from line_alignment import load_line_results
+from pathlib import Path
+
+EVAL_DIR = Path(__file__).resolve().parents[1] / "data" / "evaluation"
+DATA_CSV = EVAL_DIR / "data.csv"
+LINES_CSV = EVAL_DIR / "lines.csv"
+DEFAULT_NUM_LINES = 20
+# Shorter truth lines are ignored; a few errors in a 3-char line says little.
+DEFAULT_MIN_CHARS = 10
+
+
+def backfill_lines(data_csv=DATA_CSV, lines_csv=LINES_CSV, eval_dir=EVAL_DIR):
+    """align pages in data_csv that aren't in lines_csv; return number aligned"""
+    done = {r.get("timestamp") for r in load_line_results(lines_csv)}
+    with open(data_csv, newline="") as c:
+        rows = [r for r in csv.DictReader(c) if r.get("timestamp") not in done]
+    num_aligned = 0
+    for r in rows:
+        truth_file = get_local_path(r.get("truth-text-file"), eval_dir)
+        ocr_file = get_local_path(r.get("ocr-text-file"), eval_dir)
+        if not truth_file.is_file() or not ocr_file.is_file():
+            continue
+        line_results = get_line_results(truth_file.read_text(), ocr_file.read_text())
+        common = {k: r.get(k) for k in ("timestamp", "iso_lang", "model")}
+        common["truth-text-file"] = r.get("truth-text-file")
+        append_line_results(lines_csv, common, line_results)
+        num_aligned += 1
+    return num_aligned
+
+
+def get_worst_lines(
+    line_results, num_lines, models=None, iso_langs=None, min_chars=DEFAULT_MIN_CHARS
+):
+    """return the num_lines line results with the highest CER"""
+
+    def is_wanted(r):
+        return (
+            r.get("cer") != ""
+            and int(r.get("number-truth")) >= min_chars
+            and (not models or r.get("model") in models)
+            and (not iso_langs or r.get("iso_lang") in iso_langs)
+        )
+
+    # A page evaluated more than once with the same model counts only with its
+    # newest results.
+    newest = {}
+    for r in line_results:
+        page = (r.get("model"), Path(r.get("truth-text-file")).name)
+        if float(r.get("timestamp")) > float(newest.get(page, 0)):
+            newest[page] = r.get("timestamp")
+    latest = (
+        r
+        for r in line_results
+        if newest.get((r.get("model"), Path(r.get("truth-text-file")).name))
+        == r.get("timestamp")
+    )
+    return heapq.nlargest(
+        num_lines,
+        filter(is_wanted, latest),
+        key=lambda r: (float(r.get("cer")), int(r.get("errors"))),
+    )
+
+
+def get_parsed_args():
+    parser = argparse.ArgumentParser(
+        description="Show the evaluation lines with the highest CER."
+    )
+    parser.add_argument(
+        "-b",
+        "--backfill",
+        action="store_true",
+        help="first align pages in data.csv that aren't in lines.csv yet",
+    )
+    parser.add_argument(
+        "-i",
+        "--iso-lang",
+        action="append",
+        help="only include lines of this iso_lang folder; can be given more than once",
+    )
+    parser.add_argument(
+        "-l",
+        "--model",
+        action="append",
+        help="only include lines read by this model; can be given more than once",
+    )
+    parser.add_argument(
+        "-m",
+        "--min-chars",
+        type=int,
+        default=DEFAULT_MIN_CHARS,
+        help=f"ignore truth lines shorter than this [{DEFAULT_MIN_CHARS}]",
+    )
+    parser.add_argument(
+        "-n",
+        "--lines",
+        type=int,
+        default=DEFAULT_NUM_LINES,
+        help=f"number of lines to show [{DEFAULT_NUM_LINES}]",
+    )
+    parser.add_argument(
+        "-o",
+        "--outfile",
+        type=str,
+        help="write the truth text of these lines to this file",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = get_parsed_args()
+    if args.backfill:
+        num_aligned = backfill_lines()
+        print(f"Aligned lines of {num_aligned} pages.", file=sys.stderr)
+    line_results = load_line_results(LINES_CSV)
+    if not line_results:
+        print(f"Error: No line results in {LINES_CSV}; try -b.")
+        exit(1)
+
+    worst = get_worst_lines(
+        line_results, args.lines, args.model, args.iso_lang, args.min_chars
+    )
+    print("CER\tErrors\tModel\tPage:line")
+    for r in worst:
+        page = Path(r.get("truth-text-file")).name.replace(".gt.txt", "")
+        print(
+            f"{float(r.get('cer')):.3f}\t{r.get('errors')}\t{r.get('model')}\t"
+            f"{r.get('iso_lang')}/{page}:{r.get('line')}"
+        )
+        print(f"  truth: {r.get('truth')}")
+        print(f"  ocr:   {r.get('ocr')}")
+
+    if args.outfile:
+        truth_lines = dict.fromkeys(r.get("truth") for r in worst)
+        Path(args.outfile).write_text("".join(f"{t}\n" for t in truth_lines))
+
+
+if __name__ == "__main__":
+    main()